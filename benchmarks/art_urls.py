@@ -0,0 +1,81 @@
+"""
+Uploading the cover with every now playing message, as before, against
+linking covers already uploaded through ArtUrlCache, over a stub channel
+that charges for upload bandwidth. Plays whole albums in order, then the
+first album again once its URLs have expired to check they are refreshed.
+
+    python -m benchmarks.art_urls --albums 20 --art-bytes 60000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import discord
+
+from .common import report, use_config
+from .fakes import FakeCdnChannel
+
+use_config()
+
+# napbot reads its config on import, so this has to come after use_config
+from napbot.extensions.music.art import ArtUrlCache
+
+TRACKS_PER_ALBUM = 12
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def play(
+    cache: ArtUrlCache, channel: FakeCdnChannel, covers: list[bytes]
+) -> float:
+    start = time.perf_counter()
+    for album, art in enumerate(covers):
+        for track in range(TRACKS_PER_ALBUM):
+            embed = discord.Embed(title=f"Track {track + 1}", description="")
+            await cache.send(channel.send, embed, f"album{album}", lambda: art)
+    return time.perf_counter() - start
+
+
+async def run(args: argparse.Namespace) -> dict[str, float]:
+    covers = [os.urandom(args.art_bytes) for _ in range(args.albums)]
+    results = {}
+    for name, size in (("before", 0), ("after", args.albums)):
+        clock = Clock()
+        channel = FakeCdnChannel(args.latency, args.bandwidth, clock=clock)
+        cache = ArtUrlCache(size, clock)
+        seconds = await play(cache, channel, covers)
+        results[f"seconds_{name}"] = round(seconds, 3)
+        results[f"uploaded_kib_{name}"] = channel.uploaded // 1024
+        results[f"messages_{name}"] = channel.sent
+
+    # a day later every URL has expired, so the first album uploads again
+    clock.now += channel.lifetime
+    uploaded = channel.uploaded
+    await play(cache, channel, covers[:1])
+    if channel.uploaded - uploaded != args.art_bytes:
+        raise AssertionError("an expired cover URL was not refreshed")
+    results["uploads_after_expiry"] = (channel.uploaded - uploaded) // args.art_bytes
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--albums", type=int, default=20)
+    parser.add_argument("--art-bytes", type=int, default=60_000)
+    parser.add_argument("--bandwidth", type=float, default=2_000_000)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    report("art_urls", albums=args.albums, **asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+How often guess mode's CHORUS start lands on a chorus, for the old
+most-common-line pick against the section analysis, on synthetic songs
+whose choruses vary slightly between repeats and whose verses share a
+filler line. Also times the start position lookup once analysed.
+
+    python -m benchmarks.chorus_hits --songs 500
+"""
+
+import argparse
+import random
+import time
+from array import array
+from collections import Counter
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.analysis import SegmentStore, analyse_lyrics
+from napbot.extensions.music.catalog import SongCatalog
+from napbot.extensions.music.song import LyricLines, Song, SongRecord
+
+VOCABULARY = "love night light heart fire dream stay away home rain sky run".split()
+
+
+def vary(rng: random.Random, line: str) -> str:
+    """
+    The same chorus line as it tends to be transcribed the next time round.
+    """
+    roll = rng.random()
+    if roll < 0.3:
+        return line.upper() if rng.random() < 0.5 else line + "!"
+    if roll < 0.5:
+        return line.replace(" ", ", ", 1)
+    if roll < 0.6:
+        return "oh " + line
+    return line
+
+
+def make_song(rng: random.Random) -> tuple[list[str], array, set[float]]:
+    def phrase() -> str:
+        return " ".join(rng.choices(VOCABULARY, k=rng.randint(4, 7)))
+
+    chorus = [phrase() for _ in range(4)]
+    lines: list[str] = []
+    chorus_starts: list[int] = []
+    for _ in range(3):
+        for _ in range(rng.randint(4, 8)):
+            # ad-libs repeated through the verses fool a most-common pick
+            lines.append("yeah yeah" if rng.random() < 0.3 else phrase())
+        chorus_starts.append(len(lines))
+        lines.extend(vary(rng, line) for line in chorus)
+    timestamps = array("d", (i * 3.0 for i in range(len(lines))))
+    return lines, timestamps, {timestamps[i] for i in chorus_starts}
+
+
+def legacy_chorus(lyrics: list[str], timestamps: array) -> float:
+    most_common_lyric = Counter(lyrics).most_common(1)[0][0]
+    return timestamps[lyrics.index(most_common_lyric)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--songs", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpus = [make_song(rng) for _ in range(args.songs)]
+    legacy_hits = sum(legacy_chorus(l, t) in starts for l, t, starts in corpus)
+    hits = 0
+    start = time.perf_counter()
+    for lyrics, timestamps, starts in corpus:
+        chorus = analyse_lyrics(lyrics, timestamps).chorus
+        hits += bool(chorus) and all(t in starts for t in chorus)
+    analyse_ms = (time.perf_counter() - start) / args.songs * 1000
+
+    # a lookup once the analysis is in the catalog
+    store = SegmentStore(SongCatalog(":memory:"))
+    lyrics, timestamps, _ = corpus[0]
+    song = Song.from_record(
+        SongRecord("/bench/song.mp3", None, "Song", None, 1, None, None, True, "song")
+    )
+    song._lyrics = (LyricLines.from_lines(lyrics), timestamps)
+    store.get(song)
+    start = time.perf_counter()
+    for _ in range(10000):
+        rng.choice(store.get(song).chorus)
+    lookup_us = (time.perf_counter() - start) / 10000 * 1e6
+
+    report(
+        "chorus_hits",
+        songs=args.songs,
+        legacy_hit_rate=round(legacy_hits / args.songs, 3),
+        current_hit_rate=round(hits / args.songs, 3),
+        analyse_ms_per_song=round(analyse_ms, 2),
+        lookup_us=round(lookup_us, 1),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Shared helpers for the benchmarks.
+
+napbot reads config.ini from the working directory as soon as it is
+imported, so every benchmark calls `use_config` before importing it. Run
+them from the repository root, e.g. `python -m benchmarks.song_memory`.
+"""
+
+import json
+import os
+import tempfile
+from typing import Any
+
+
+def use_config(**music: Any) -> str:
+    """
+    Switch to a scratch directory containing a config.ini with the given
+    [music] options and return its path.
+    """
+    directory = tempfile.mkdtemp(prefix="napbot-bench-")
+    music = {"MusicPath": directory, "CatalogPath": ":memory:", **music}
+    with open(os.path.join(directory, "config.ini"), "w") as f:
+        f.write("[napbot]\nLogLevel=2\nDebugGuilds=0\nAdminIds=0\nModules=music\n")
+        f.write("\n[music]\n")
+        for key, value in music.items():
+            f.write(f"{key}={value}\n")
+    os.chdir(directory)
+    return directory
+
+
+def report(name: str, **results: Any):
+    print(json.dumps({"benchmark": name, **results}))
@@ -0,0 +1,148 @@
+"""
+Just enough of discord.py's bot, context and voice client for VoiceState
+to run without a connection. Tracks "play" for a fixed length on a thread
+and call `after` from it, as discord.py's AudioPlayer does.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections.abc import Callable
+from types import SimpleNamespace
+from typing import Any
+
+
+class FakeSource:
+    """
+    An audio source that takes as long to start as ffmpeg does: `spawn`
+    seconds to start the process and `probe` more before the first packet.
+    """
+
+    def __init__(self, name: str = "", spawn: float = 0.0, probe: float = 0.0):
+        time.sleep(spawn)
+        self.name = name
+        self.probe = probe
+        self.packets = 0
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        if self.packets == 0:
+            time.sleep(self.probe)
+        self.packets += 1
+        return b"\xf8\xff\xfe"
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class FakeVoiceClient:
+    def __init__(self, length: float, channel_id: int = 0):
+        self.length = length
+        self.channel = SimpleNamespace(id=channel_id, members=[])
+        self.played: list[Any] = []
+        self.started: list[float] = []
+        self.ended: list[float] = []
+        self.stopped = threading.Event()
+        self.connected = True
+
+    def play(self, source: Any, *, after):
+        self.played.append(source)
+        self.started.append(time.perf_counter())
+        self.stopped = stopped = threading.Event()
+
+        def run():
+            if callable(getattr(source, "read", None)):
+                # a track only starts once its first packet is ready
+                source.read()
+                self.started[-1] = time.perf_counter()
+            stopped.wait(self.length)
+            self.ended.append(time.perf_counter())
+            after(None)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def is_playing(self) -> bool:
+        return not self.stopped.is_set()
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def move_to(self, channel: Any):
+        self.channel = channel
+
+    async def disconnect(self):
+        self.connected = False
+
+
+class FakeChannel:
+    ids = itertools.count(1)
+
+    def __init__(self, latency: float = 0.0):
+        # the outbound scheduler gives each channel its own lane
+        self.id = next(self.ids)
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, *args: Any, **kwargs: Any):
+        self.sent += 1
+        await asyncio.sleep(self.latency)
+
+
+class FakeCdnChannel(FakeChannel):
+    """
+    A channel that takes longer to send the more it uploads, at `bandwidth`
+    bytes a second, and hands back the embed the way Discord does: with
+    attachment:// swapped for a signed CDN URL that expires in `lifetime`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        bandwidth: float = 1_000_000,
+        lifetime: float = 24 * 3600,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(latency)
+        self.bandwidth = bandwidth
+        self.lifetime = lifetime
+        self.clock = clock
+        self.uploaded = 0
+
+    async def send(self, *args: Any, embed: Any = None, file: Any = None, **kwargs):
+        size = len(file.fp.read()) if file is not None else 0
+        self.uploaded += size
+        await super().send(*args, **kwargs)
+        await asyncio.sleep(size / self.bandwidth)
+        if embed is not None and embed.thumbnail.url == "attachment://cover.jpg":
+            expires = int(self.clock() + self.lifetime)
+            embed = embed.copy()
+            embed.set_thumbnail(
+                url=f"https://cdn.discordapp.com/attachments/1/{self.sent}/"
+                f"cover.jpg?ex={expires:x}&is={expires - 86400:x}&hm=00"
+            )
+        return SimpleNamespace(embeds=[embed] if embed is not None else [])
+
+
+class FakeContext:
+    def __init__(self, guild_id: int, vc: FakeVoiceClient, latency: float = 0.0):
+        self.guild = SimpleNamespace(id=guild_id, voice_client=vc)
+        self.author = SimpleNamespace(voice=SimpleNamespace(channel=vc.channel))
+        self.channel = FakeChannel(latency)
+
+    async def send(self, *args: Any, **kwargs: Any):
+        await self.channel.send(*args, **kwargs)
+
+
+class FakeBot:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def change_presence(self, **_: Any):
+        pass
@@ -0,0 +1,160 @@
+"""
+Recall and latency of the fuzzy search fallback on synthetic libraries of
+growing size, for queries that miss exactly: titles with a typo, with the
+accents left off and in Simplified rather than Traditional Chinese. A hit
+is any song with the query's intended title, since a synthetic library
+repeats titles, and the exact search is shown alongside for comparison.
+
+    python -m benchmarks.fuzzy_search --sizes 1000 10000 50000 --queries 300
+"""
+
+import argparse
+import random
+import time
+import unicodedata
+
+from .common import report, use_config
+from .synth import ACCENTED, CJK, LATIN, make_title
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.index import FuzzyIndex, SearchIndex, fold
+from napbot.extensions.music.song import Song, SongRecord, cc, title_slugify
+
+
+def make_songs(count: int, seed: int = 0) -> list[Song]:
+    rng = random.Random(seed)
+    songs = []
+    for i in range(count):
+        artist = f"{rng.choice(ACCENTED)} {rng.choice(CJK)} {i // 36}"
+        album = f"{rng.choice(LATIN).capitalize()} {rng.choice(CJK)} {i // 12}"
+        title = make_title(rng)
+        record = SongRecord(
+            path=f"/media/Moosic/{artist}/{album}/{i % 12 + 1:02} {title}.mp3",
+            artist=artist,
+            title=title,
+            album=album,
+            track_num=i % 12 + 1,
+            art_hash=None,
+            dominant_colour=None,
+            has_lyrics=False,
+            title_slugified=title_slugify(title),
+        )
+        songs.append(Song.from_record(record))
+    return songs
+
+
+def typo(rng: random.Random, title: str) -> str | None:
+    words = title.split()
+    long = [i for i, word in enumerate(words) if len(word) >= 4 and word.isascii()]
+    if not long:
+        return None
+    i = rng.choice(long)
+    word = words[i]
+    at = rng.randrange(len(word) - 1)
+    edit = rng.choice(("swap", "drop", "replace"))
+    if edit == "swap":
+        word = word[:at] + word[at + 1] + word[at] + word[at + 2 :]
+    elif edit == "drop":
+        word = word[:at] + word[at + 1 :]
+    else:
+        word = word[:at] + rng.choice("aeiourstn") + word[at + 1 :]
+    words[i] = word
+    return " ".join(words)
+
+
+def unaccented(_: random.Random, title: str) -> str | None:
+    text = unicodedata.normalize("NFKD", title)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return text if text != title else None
+
+
+def simplified(_: random.Random, title: str) -> str | None:
+    text = cc.convert(title)
+    return text if text != title else None
+
+
+KINDS = {"typo": typo, "unaccented": unaccented, "simplified": simplified}
+
+
+def make_queries(
+    rng: random.Random, songs: list[Song], kind: str, count: int
+) -> list[tuple[str, str]]:
+    """
+    Up to `count` (query, intended folded title) pairs that the exact
+    search cannot find as they are typed.
+    """
+    alter = KINDS[kind]
+    queries = []
+    for _ in range(count * 20):
+        if len(queries) == count:
+            break
+        title = rng.choice(songs).title
+        query = alter(rng, title)
+        if query is not None and query.lower() not in title.lower():
+            queries.append((query, fold(title)))
+    return queries
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(size: int, args: argparse.Namespace) -> list[dict[str, float]]:
+    songs = make_songs(size)
+    start = time.perf_counter()
+    exact = SearchIndex(songs)
+    exact_build = time.perf_counter() - start
+    start = time.perf_counter()
+    fuzzy = FuzzyIndex(songs)
+    fuzzy_build = time.perf_counter() - start
+
+    rng = random.Random(1)
+    results = []
+    for kind in KINDS:
+        queries = make_queries(rng, songs, kind, args.queries)
+        exact_hits = top_1 = top_10 = 0
+        latencies = []
+        for query, wanted in queries:
+            found = exact.search(query.lower().split(), [])
+            exact_hits += any(fold(song.title) == wanted for song in found[:10])
+
+            start = time.perf_counter()
+            found = fuzzy.search(query, args.budget / 1000)
+            latencies.append(time.perf_counter() - start)
+            titles = [fold(song.title) for song in found[:10]]
+            top_1 += titles[:1] == [wanted]
+            top_10 += wanted in titles
+
+        results.append(
+            {
+                "kind": kind,
+                "queries": len(queries),
+                "exact_build_ms": round(exact_build * 1000),
+                "fuzzy_build_ms": round(fuzzy_build * 1000),
+                "exact_recall_at_10": round(exact_hits / len(queries), 3),
+                "fuzzy_recall_at_1": round(top_1 / len(queries), 3),
+                "fuzzy_recall_at_10": round(top_10 / len(queries), 3),
+                "fuzzy_ms_p50": round(percentile(latencies, 0.5) * 1000, 2),
+                "fuzzy_ms_p99": round(percentile(latencies, 0.99) * 1000, 2),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--budget", type=float, default=50, help="milliseconds")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        for results in run(size, args):
+            report("fuzzy_search", songs=size, budget_ms=args.budget, **results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Messages per second through the guess-mode check, for the on_message
+code that slugified every message twice against the matcher, over chat
+where about one message in a hundred is a guess.
+
+    python -m benchmarks.guess_match --messages 50000
+"""
+
+import argparse
+import random
+import time
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.guess import GuessMatcher
+from napbot.extensions.music.song import Song, SongRecord, title_slugify
+
+WORDS = (
+    "lol ok nice song who is this sounds like the one from yesterday "
+    "no idea maybe haha wait what 好听 这首歌 是谁 不知道 愛 我 你"
+).split()
+
+
+def legacy_matches(title_slugified: str, content: str, lenient: bool) -> bool:
+    return title_slugify(content) == title_slugified or (
+        lenient and title_slugified in title_slugify(content)
+    )
+
+
+def make_chat(rng: random.Random, count: int, title: str) -> list[str]:
+    messages = []
+    for _ in range(count):
+        if rng.random() < 0.01:
+            messages.append(title if rng.random() < 0.5 else title.upper() + "!!")
+        else:
+            messages.append(" ".join(rng.choices(WORDS, k=rng.randint(1, 12))))
+    return messages
+
+
+def bench(check, messages: list[str]) -> tuple[float, int]:
+    start = time.perf_counter()
+    hits = sum(1 for message in messages if check(message))
+    return len(messages) / (time.perf_counter() - start), hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    title = "Shape of You (feat. Someone)"
+    record = SongRecord(
+        "/bench/song.mp3",
+        "Artist",
+        title,
+        None,
+        1,
+        None,
+        None,
+        False,
+        title_slugify(title),
+    )
+    song = Song.from_record(record)
+    matcher = GuessMatcher(song)
+    messages = make_chat(random.Random(0), args.messages, "shape of you")
+
+    results = {}
+    for mode, lenient in (("strict", False), ("lenient", True)):
+        legacy, legacy_hits = bench(
+            lambda m: legacy_matches(song.title_slugified, m, lenient), messages
+        )
+        current, current_hits = bench(lambda m: matcher.matches(m, lenient), messages)
+        results[f"{mode}_legacy_msgs_per_s"] = round(legacy)
+        results[f"{mode}_current_msgs_per_s"] = round(current)
+        results[f"{mode}_speedup"] = round(current / legacy, 1)
+        results[f"{mode}_hits"] = [legacy_hits, current_hits]
+    report("guess_match", messages=args.messages, **results)
+
+
+if __name__ == "__main__":
+    main()
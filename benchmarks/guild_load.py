@@ -0,0 +1,100 @@
+"""
+Many guilds playing at once through one VoiceStateManager: checks that
+every guild only hears its own queue and keeps its own guess scores, and
+that memory returns to where it started once idle guilds are evicted.
+
+    python -m benchmarks.guild_load --guilds 200 --tracks 3
+"""
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from .common import report, use_config
+from .fakes import FakeBot, FakeContext, FakeSource, FakeVoiceClient
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+import discord
+
+from napbot.extensions.music.song import Song, SongRecord
+from napbot.extensions.music.voice import VoiceState, VoiceStateManager
+
+
+class BenchVoiceState(VoiceState):
+    def make_source(
+        self, song: Song, start_ts: str, cached: str | None
+    ) -> discord.AudioSource:
+        return FakeSource(song.path)  # type: ignore[return-value]
+
+
+class BenchManager(VoiceStateManager):
+    state_class = BenchVoiceState
+
+
+async def run(guilds: int, tracks: int, length: float, idle_timeout: float):
+    manager = BenchManager(FakeBot(), idle_timeout=idle_timeout)  # type: ignore[arg-type]
+    clients: dict[int, FakeVoiceClient] = {}
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for guild_id in range(guilds):
+        vc = clients[guild_id] = FakeVoiceClient(length, channel_id=guild_id)
+        state = manager.get(guild_id)
+        await state.connect(FakeContext(guild_id, vc))  # type: ignore[arg-type]
+        state.guess_leaderboard[guild_id] = guild_id
+        for i in range(tracks):
+            path = f"/guild {guild_id}/{i}.mp3"
+            record = SongRecord(
+                path, "Artist", f"Song {i}", None, i, None, None, False, ""
+            )
+            await state.add(Song.from_record(record), lyrics=False)
+    active = len(manager)
+    during = tracemalloc.get_traced_memory()[0]
+
+    while len(manager):
+        await asyncio.sleep(idle_timeout / 2)
+    isolated = all(
+        len(vc.played) == tracks
+        and all(
+            # played sources may be wrapped by the prefetcher
+            getattr(source, "source", source).name.startswith(f"/guild {guild_id}/")
+            for source in vc.played
+        )
+        for guild_id, vc in clients.items()
+    )
+    # the fake voice clients stand in for discord.py's own, so not ours to count
+    clients.clear()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return active, isolated, during - before, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--tracks", type=int, default=3)
+    parser.add_argument("--length", type=float, default=0.05)
+    parser.add_argument("--idle-timeout", type=float, default=0.5)
+    args = parser.parse_args()
+
+    active, isolated, during, after = asyncio.run(
+        run(args.guilds, args.tracks, args.length, args.idle_timeout)
+    )
+    report(
+        "guild_load",
+        guilds=args.guilds,
+        active_states=active,
+        isolated=isolated,
+        bytes_per_guild_active=round(during / args.guilds),
+        bytes_retained_after_eviction=after,
+    )
+
+
+if __name__ == "__main__":
+    main()
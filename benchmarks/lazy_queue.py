@@ -0,0 +1,107 @@
+"""
+Memory and time for "play all" on libraries of growing size: copying,
+shuffling and queueing an entry per song as before, against queueing one
+lazy segment over a seeded permutation. Checks along the way that paging,
+skipping, playnext and clear see the same queue either way.
+
+    python -m benchmarks.lazy_queue --sizes 10000 50000 200000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from .common import report, use_config
+from .fakes import FakeBot
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.segments import Shuffled
+from napbot.extensions.music.voice import VoiceState
+
+
+class Song:
+    def __init__(self, i: int):
+        self.path = f"/media/Moosic/{i:06}.mp3"
+
+
+def measure(fn) -> tuple[float, int, int]:
+    """
+    Seconds taken, bytes still held afterwards and peak bytes while running.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, current, peak
+
+
+def check(state: VoiceState, expected: list[Song], extra: Song):
+    queue = state.queue
+    assert len(queue) == len(expected)
+    middle = len(expected) // 2
+    assert [s for s, _ in queue[middle : middle + 10]] == expected[middle : middle + 10]
+    # the player and prefetch compare the head by identity
+    assert queue[0] is queue[0] and queue[0][0] is expected[0]
+    state.add_many([extra], right_away=True)
+    assert queue[0][0] is extra and queue[1][0] is expected[0]
+    queue.skip(middle + 1)
+    assert queue[0][0] is expected[middle]
+    assert len(queue) == len(expected) - middle
+    state.clear()
+    assert len(queue) == 0
+
+
+async def run(size: int) -> dict[str, float]:
+    songs = [Song(i) for i in range(size)]
+    extra = Song(-1)
+    before = VoiceState(FakeBot(), prefetch=False)  # type: ignore[arg-type]
+    after = VoiceState(FakeBot(), prefetch=False)  # type: ignore[arg-type]
+
+    def eager():
+        sources = songs.copy()
+        random.shuffle(sources)
+        before.queue.extend([(song, True) for song in sources])
+
+    def lazy():
+        after.add_many(Shuffled(songs))
+
+    eager_seconds, eager_held, eager_peak = measure(eager)
+    lazy_seconds, lazy_held, lazy_peak = measure(lazy)
+
+    check(before, [song for song, _ in before.queue], extra)
+    after.clear()
+    order = list(Shuffled(songs, seed=1))
+    after.add_many(Shuffled(songs, seed=1))
+    check(after, order, extra)
+    if sorted(song.path for song in order) != [song.path for song in songs]:
+        raise AssertionError("the shuffled order is not a permutation")
+
+    return {
+        "ms_before": round(eager_seconds * 1000, 2),
+        "ms_after": round(lazy_seconds * 1000, 3),
+        "held_kib_before": eager_held // 1024,
+        "held_kib_after": lazy_held // 1024,
+        "peak_kib_before": eager_peak // 1024,
+        "peak_kib_after": lazy_peak // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000]
+    )
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        report("lazy_queue", songs=size, **asyncio.run(run(size)))
+
+
+if __name__ == "__main__":
+    main()
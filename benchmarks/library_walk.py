@@ -0,0 +1,110 @@
+"""
+Listing a deep library the old way, with one rglob for songs and one for
+playlists, resolving every path and probing each song for its LRC file,
+against the single scandir walk that prunes ignored directories.
+
+    python -m benchmarks.library_walk --depth 4 --fanout 5 --songs 8
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from .common import report, use_config
+
+root = use_config(IgnoredPaths="Ignored")
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.walk import walk_library
+
+
+def make_tree(path: str, depth: int, fanout: int, songs: int) -> int:
+    """
+    Build empty songs, half with lyrics, a playlist in every directory and
+    an ignored subtree as deep as the rest. Returns how many songs it made.
+    """
+    os.makedirs(path, exist_ok=True)
+    made = 0
+    for i in range(songs):
+        stem = os.path.join(path, f"{i:02} Song")
+        open(stem + ".mp3", "w").close()
+        if i % 2 == 0:
+            open(stem + ".lrc", "w").close()
+        made += 1
+    open(os.path.join(path, "cover.jpg"), "w").close()
+    open(os.path.join(path, f"{os.path.basename(path)}.m3u"), "w").close()
+    if depth > 0:
+        for i in range(fanout):
+            made += make_tree(os.path.join(path, f"Dir {i}"), depth - 1, fanout, songs)
+        made += make_tree(os.path.join(path, "Ignored"), depth - 1, 1, songs)
+    return made
+
+
+def legacy_walk(root: str, ignored_paths: list[str]) -> tuple[int, int, int]:
+    songs = lyrics = 0
+    for file in Path(root).rglob("*.mp3"):
+        parent = str(file.resolve().parent.absolute())
+        path = str(file.resolve().absolute())
+        if any(query in parent for query in ignored_paths):
+            continue
+        songs += 1
+        # file_stamp and Song each looked for the LRC
+        lrc = os.path.splitext(path)[0] + ".lrc"
+        try:
+            os.stat(lrc)
+        except OSError:
+            pass
+        lyrics += os.path.isfile(lrc)
+    playlists = sum(1 for f in Path(root).rglob("*.m3u") if f.resolve().absolute())
+    return songs, lyrics, playlists
+
+
+def new_walk(root: str, ignored_paths: list[str]) -> tuple[int, int, int]:
+    files = walk_library(root, ignored_paths)
+    lyrics = sum(files.has_lyrics(path) for path in files.songs)
+    return len(files.songs), lyrics, len(files.playlists)
+
+
+def best_of(runs: int, walk, *args) -> tuple[float, tuple[int, int, int]]:
+    best = float("inf")
+    result = (0, 0, 0)
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = walk(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--songs", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    library = os.path.join(root, "library")
+    total = make_tree(library, args.depth, args.fanout, args.songs)
+    ignored = ["Ignored"]
+
+    before, legacy = best_of(args.runs, legacy_walk, library, ignored)
+    after, walked = best_of(args.runs, new_walk, library, ignored)
+    # playlists used to be read from ignored directories as well
+    if legacy[:2] != walked[:2]:
+        raise AssertionError(f"walks disagree: {legacy} != {walked}")
+
+    report(
+        "library_walk",
+        songs_on_disk=total,
+        songs=walked[0],
+        lyrics=walked[1],
+        playlists=walked[2],
+        seconds_before=round(before, 4),
+        seconds_after=round(after, 4),
+        speedup=round(before / after, 2),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Time spent in the caller per log call, for the print-based Logger against
+the queued one: debug messages below the log level, built as f-strings
+before and passed as a callable now, and a flood of playlist
+warnings written to a stdout that takes `--write-ms` per line.
+
+    python -m benchmarks.log_calls --calls 20000 --warnings 2000
+"""
+
+import argparse
+import sys
+import time
+from typing import Any
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so this has to come after use_config
+from napbot.iohandler import Logger
+
+
+class LegacyLogger:
+    LOG_STRINGS = ["DEBUG", " INFO", " WARN", "ERROR"]
+
+    def __init__(self, log_level: int = 0):
+        self.log_level = log_level
+
+    def _log(self, msg: Any, log_level: int):
+        if log_level >= self.log_level:
+            print(f"{LegacyLogger.LOG_STRINGS[log_level]}: {msg}")
+
+    def debug(self, msg: Any):
+        self._log(msg, 0)
+
+    def warn(self, msg: Any):
+        self._log(msg, 2)
+
+
+class SlowStream:
+    """
+    A stdout that blocks on every write, like a terminal or pipe that
+    cannot keep up.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Song:
+    def __init__(self, i: int):
+        self.path = f"/media/Moosic/Artist {i // 100}/Album {i // 10}/{i:05}.mp3"
+
+    def get_name(self) -> str:
+        return f"Song {self.path.rsplit('/', 1)[-1]}"
+
+
+def per_call(calls: int, fn) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--warnings", type=int, default=2000)
+    parser.add_argument("--write-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    songs = [Song(i) for i in range(100)]
+    legacy = LegacyLogger(Logger.INFO_LEVEL)
+    queued = Logger(Logger.INFO_LEVEL)
+
+    debug_before = per_call(
+        args.calls,
+        lambda i: legacy.debug(f"Loaded {songs[i % 100].get_name()} ({i} of many)."),
+    )
+    debug_after = per_call(
+        args.calls,
+        lambda i: queued.debug(
+            lambda: f"Loaded {songs[i % 100].get_name()} ({i} of many)."
+        ),
+    )
+
+    stdout = sys.stdout
+    sys.stdout = before_stream = SlowStream(args.write_ms / 1000)
+    try:
+        warn_before = per_call(
+            args.warnings,
+            lambda i: legacy.warn(
+                f"Playlist 'mix' contains song '{songs[i % 100].path}' "
+                "which does not exist."
+            ),
+        )
+        sys.stdout = after_stream = SlowStream(args.write_ms / 1000)
+        warn_after = per_call(
+            args.warnings,
+            lambda i: queued.warn(
+                "Playlist '%s' contains song '%s' which does not exist.",
+                "mix",
+                songs[i % 100].path,
+            ),
+        )
+        queued.flush()
+    finally:
+        sys.stdout = stdout
+
+    report(
+        "log_calls",
+        disabled_debug_us_before=round(debug_before * 1e6, 3),
+        disabled_debug_us_after=round(debug_after * 1e6, 3),
+        warning_us_before=round(warn_before * 1e6, 2),
+        warning_us_after=round(warn_after * 1e6, 2),
+        lines_written_before=before_stream.lines,
+        lines_written_after=after_stream.lines,
+    )
+
+
+if __name__ == "__main__":
+    main()
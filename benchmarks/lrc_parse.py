@@ -0,0 +1,91 @@
+"""
+Throughput of the LRC parser against the per-line split parser it replaced.
+
+    python -m benchmarks.lrc_parse --files 2000 --lines 80
+"""
+
+import argparse
+import random
+import re
+import time
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so this has to come after use_config
+from napbot.extensions.music.lrc import parse_lrc
+
+
+def legacy_parse(text: str) -> tuple[list[str], list[float]]:
+    """
+    The parser Song.__init__ used to run on every LRC at scan time.
+    """
+    lyrics: list[str] = []
+    timestamps: list[float] = []
+    for s in text.split("\n"):
+        try:
+            ts_end_index = s.index("]")
+            ts = s[1:ts_end_index]
+            ts_seconds = sum(
+                x * int(t)
+                for x, t in zip([0.001, 1, 60], reversed(re.split(r":|\.", ts)))
+            )
+            lyric = s[ts_end_index + 1 :]
+            if not lyric.isspace() and lyric != "":
+                lyrics.append(lyric)
+                timestamps.append(ts_seconds)
+        except IndexError:
+            pass
+        except ValueError:
+            pass
+    return lyrics, timestamps
+
+
+def make_lrc(rng: random.Random, lines: int) -> str:
+    out = ["[ti:Synthetic]", "[ar:Benchmark]", "[offset:+120]", ""]
+    t = 0.0
+    for i in range(lines):
+        t += rng.uniform(1.5, 6.0)
+        tag = f"[{int(t // 60):02}:{t % 60:05.2f}]"
+        if i % 9 == 0:
+            # a chorus repeated later in the song on the same line
+            later = t + 60
+            tag += f"[{int(later // 60):02}:{later % 60:05.2f}]"
+        out.append(f"{tag}line {i} 歌詞 {rng.randrange(10**6)}")
+    return "\n".join(out)
+
+
+def bench(parse, corpus: list[str], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in corpus:
+            parse(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=80)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpus = [make_lrc(rng, args.lines) for _ in range(args.files)]
+    legacy = bench(legacy_parse, corpus, args.rounds)
+    current = bench(parse_lrc, corpus, args.rounds)
+    report(
+        "lrc_parse",
+        files=args.files,
+        lines=args.lines,
+        legacy_us_per_file=round(legacy / args.files * 1e6, 1),
+        current_us_per_file=round(current / args.files * 1e6, 1),
+        speedup=round(legacy / current, 2),
+    )
+
+
+if __name__ == "__main__":
+    main()
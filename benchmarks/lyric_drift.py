@@ -0,0 +1,151 @@
+"""
+How far behind the audio each highlighted lyric lands, for the 100 ms
+polling loop LyricPlayer used to run and the clock-driven scheduler, plus
+how long each takes to notice a skip.
+
+Audio is simulated by a thread counting 20 ms frames the way discord.py's
+AudioPlayer does, and message edits and sends take a random 30-120 ms.
+
+    python -m benchmarks.lyric_drift --lines 40 --interval 0.25
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+from array import array
+from types import SimpleNamespace
+
+from .common import report, use_config
+from .fakes import FakeBot
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.discord import LyricPlayer, lyric_windows
+from napbot.extensions.music.outbound import OutboundScheduler
+from napbot.extensions.music.song import Song, SongRecord
+
+
+class FakePlayer(threading.Thread):
+    DELAY = 0.02
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.loops = 0
+        self.running = True
+
+    def run(self):
+        start = time.perf_counter()
+        while self.running:
+            self.loops += 1
+            time.sleep(
+                max(0, start + self.DELAY * (self.loops + 1) - time.perf_counter())
+            )
+
+
+class FakeVoiceClient:
+    def __init__(self):
+        self._player = FakePlayer()
+
+
+class FakeEmbed:
+    def set_field_at(self, *_, **__):
+        pass
+
+    def copy(self) -> "FakeEmbed":
+        return self
+
+
+class FakeMessage:
+    def __init__(self, rng: random.Random):
+        self.id = 0
+        self.channel = SimpleNamespace(id=0)
+        self.rng = rng
+
+    async def edit(self, **_):
+        await asyncio.sleep(self.rng.uniform(0.03, 0.12))
+
+
+async def legacy_follow(
+    player: LyricPlayer, msg: FakeMessage, timestamps: array, skipped: threading.Event
+):
+    """
+    The loop LyricPlayer.start used to run once the message was sent.
+    """
+    start = time.time()
+    for t in timestamps:
+        now = time.time()
+        while now < t + start:
+            if skipped.is_set():
+                return
+            await asyncio.sleep(0.1)
+            now = time.time()
+        await msg.edit()
+        player.drift.append(player.position() - t)
+
+
+async def run(legacy: bool, lines: int, interval: float, skip_at: float | None):
+    rng = random.Random(0)
+    timestamps = array("d", (i * interval for i in range(lines)))
+    song = Song.from_record(
+        SongRecord(
+            "/bench/song.mp3", "Artist", "Song", None, 1, None, None, True, "song"
+        )
+    )
+    vc = FakeVoiceClient()
+    # follow sends its edits through the voice state's scheduler
+    outbound = OutboundScheduler(FakeBot())  # type: ignore[arg-type]
+    voice_state = SimpleNamespace(outbound=outbound)
+    player = LyricPlayer(vc, None, song, voice_state, None, True)  # type: ignore[arg-type]
+    msg = FakeMessage(rng)
+    skipped = threading.Event()
+
+    vc._player.start()
+    # the now playing message goes out while the audio is already running
+    await msg.edit()
+    if legacy:
+        task = asyncio.create_task(legacy_follow(player, msg, timestamps, skipped))
+    else:
+        windows = lyric_windows([f"line {i}" for i in range(lines)])
+        task = asyncio.create_task(
+            player.follow(msg, FakeEmbed(), windows, timestamps)  # type: ignore[arg-type]
+        )
+
+    reaction = None
+    if skip_at is not None:
+        await asyncio.sleep(skip_at)
+        skipped.set()
+        player.finished.set()
+        skipped_at = time.perf_counter()
+        await task
+        reaction = time.perf_counter() - skipped_at
+    else:
+        await task
+    vc._player.running = False
+    await outbound.close()
+    return player.drift, reaction
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = {}
+    for name, legacy in (("legacy", True), ("current", False)):
+        drift, _ = asyncio.run(run(legacy, args.lines, args.interval, None))
+        _, reaction = asyncio.run(
+            run(legacy, args.lines, args.interval, args.interval * 2.5)
+        )
+        results[f"{name}_mean_drift_ms"] = round(statistics.mean(drift) * 1000, 1)
+        results[f"{name}_max_drift_ms"] = round(max(drift) * 1000, 1)
+        results[f"{name}_skip_reaction_ms"] = round(reaction * 1000, 1)
+    report("lyric_drift", lines=args.lines, interval=args.interval, **results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Several guilds following fast lyrics through a channel rate limit, awaiting
+every edit in turn as LyricPlayer did, against handing them to the shared
+OutboundScheduler. Reports how late each line showed up, how many edits
+went out and how long a now playing message sent mid-song waited.
+
+Each channel allows `--limit` requests per `--per` seconds and holds back
+the rest, as discord.py does when it waits out a 429, apart from the first
+`--throttled` channels, which allow one request per `--throttled-per`
+seconds. Lateness is also reported for the other channels on their own,
+which should not suffer for the throttled ones. Presence changes go
+through a bot that counts them.
+
+    python -m benchmarks.outbound --guilds 20 --lines 40 --interval 1.5 --throttled 4
+"""
+
+import argparse
+import asyncio
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.extensions.music.outbound import (
+    LYRICS,
+    NOW_PLAYING,
+    OUTBOUND,
+    OutboundScheduler,
+)
+
+
+class Route:
+    def __init__(self, limit: int, per: float, rtt: float):
+        self.per = per
+        self.rtt = rtt
+        self.times: deque[float] = deque(maxlen=limit)
+
+    async def request(self):
+        while len(self.times) == self.times.maxlen:
+            wait = self.times[0] + self.per - time.perf_counter()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self.times.append(time.perf_counter())
+        await asyncio.sleep(self.rtt)
+
+
+class Message:
+    def __init__(self, id: int, route: Route):
+        self.id = id
+        self.channel = SimpleNamespace(id=id)
+        self.route = route
+        # perf_counter when each line was first on screen
+        self.shown: dict[int, float] = {}
+
+    async def edit(self, line: int):
+        await self.route.request()
+        now = time.perf_counter()
+        for i in range(line + 1):
+            self.shown.setdefault(i, now)
+
+
+class Channel:
+    def __init__(self, route: Route):
+        self.route = route
+
+    async def send(self, **_: Any) -> float:
+        await self.route.request()
+        return time.perf_counter()
+
+
+class Bot:
+    def __init__(self):
+        self.presences = 0
+
+    async def change_presence(self, **_: Any):
+        self.presences += 1
+
+
+async def guild(
+    i: int,
+    args: argparse.Namespace,
+    scheduler: OutboundScheduler | None,
+    bot: Bot,
+) -> tuple[list[float], float]:
+    if i < args.throttled:
+        route = Route(1, args.throttled_per, args.rtt)
+    else:
+        route = Route(args.limit, args.per, args.rtt)
+    msg = Message(i, route)
+    channel = Channel(route)
+    start = time.perf_counter()
+    due = [start + n * args.interval for n in range(args.lines)]
+    announce = start + args.lines * args.interval / 2
+    sent_at = None
+
+    async def now_playing() -> float:
+        await asyncio.sleep(announce - time.perf_counter())
+        if scheduler is None:
+            return await channel.send() - announce
+        return await scheduler.call(NOW_PLAYING, i, channel.send) - announce
+
+    waiting = asyncio.create_task(now_playing())
+    for line, when in enumerate(due):
+        await asyncio.sleep(max(0.0, when - time.perf_counter()))
+        if scheduler is None:
+            await msg.edit(line=line)
+        else:
+            sent_at = scheduler.edit(msg, LYRICS, line=line)  # type: ignore[arg-type]
+        if line % 10 == 0:
+            activity = SimpleNamespace(type=2, name=f"guild {i} track {line}")
+            if scheduler is None:
+                await bot.change_presence(activity=activity)
+            else:
+                scheduler.presence(activity)  # type: ignore[arg-type]
+    if sent_at is not None:
+        await sent_at
+    late = [msg.shown[line] - when for line, when in enumerate(due)]
+    return late, await waiting
+
+
+def sent(kind: str, result: str) -> float:
+    return OUTBOUND.values.get((kind, result), 0)
+
+
+async def run(args: argparse.Namespace, scheduled: bool) -> dict[str, float]:
+    bot = Bot()
+    scheduler = OutboundScheduler(bot) if scheduled else None  # type: ignore[arg-type]
+    edits = sent("lyrics", "sent")
+    coalesced = sent("lyrics", "coalesced")
+    results = await asyncio.gather(
+        *(guild(i, args, scheduler, bot) for i in range(args.guilds))
+    )
+    if scheduler is not None:
+        await scheduler.close()
+    late = sorted(x for lateness, _ in results for x in lateness)
+    free = sorted(x for lateness, _ in results[args.throttled :] for x in lateness)
+    announce = [wait for _, wait in results]
+    return {
+        "line_late_ms_mean": round(sum(late) / len(late) * 1000, 1),
+        "line_late_ms_max": round(late[-1] * 1000, 1),
+        "unthrottled_late_ms_mean": round(sum(free) / len(free) * 1000, 1),
+        "unthrottled_late_ms_max": round(free[-1] * 1000, 1),
+        "now_playing_wait_ms_max": round(max(announce) * 1000, 1),
+        "unthrottled_now_playing_wait_ms_max": round(
+            max(announce[args.throttled :]) * 1000, 1
+        ),
+        "lyric_edits": (
+            sent("lyrics", "sent") - edits if scheduled else args.guilds * args.lines
+        ),
+        "coalesced": sent("lyrics", "coalesced") - coalesced,
+        "presence_updates": bot.presences,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--per", type=float, default=1.0)
+    parser.add_argument("--rtt", type=float, default=0.02)
+    parser.add_argument("--throttled", type=int, default=0)
+    parser.add_argument("--throttled-per", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for name, scheduled in (("direct", False), ("scheduled", True)):
+        report(f"outbound.{name}", **asyncio.run(run(args, scheduled)))
+
+
+if __name__ == "__main__":
+    main()
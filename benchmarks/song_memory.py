@@ -0,0 +1,117 @@
+"""
+Bytes per Song for the old dict-backed layout against the slotted one,
+with every song's lyrics loaded.
+
+    python -m benchmarks.song_memory --songs 20000 --lines 60
+"""
+
+import argparse
+import gc
+import random
+import tracemalloc
+from array import array
+from collections.abc import Callable
+from typing import Any
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+import discord
+
+from napbot.extensions.music.song import LyricLines, Song, SongRecord
+
+
+class LegacySong:
+    """
+    Song as it was laid out before it had __slots__: one __dict__ per song,
+    lyrics as a list of str and timestamps as a list of boxed floats.
+    """
+
+    def __init__(self, record: SongRecord, lyrics: str, timestamps: array):
+        self.base_name = record.path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        self.path = record.path
+        self.path_lower = record.path.lower()
+        self.artist = record.artist
+        self.title = record.title
+        self.album = record.album
+        self.track_num = record.track_num
+        self.art_hash = record.art_hash
+        self.lyrics = lyrics.split("\n") if lyrics else []
+        self.lyric_timestamps = timestamps.tolist()
+        self.dominant_colour = (
+            discord.Colour(record.dominant_colour)
+            if record.dominant_colour is not None
+            else None
+        )
+        self.title_slugified = record.title_slugified
+
+
+def make_records(
+    count: int, lines: int, seed: int = 0
+) -> list[tuple[SongRecord, str, array]]:
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        # roughly half of a typical library has synchronised lyrics
+        n = lines if rng.random() < 0.5 else 0
+        lyrics = "\n".join(f"line {rng.randrange(10**6)} of song {i}" for _ in range(n))
+        timestamps = array("d", sorted(rng.uniform(0, 240) for _ in range(n)))
+        record = SongRecord(
+            path=f"/media/Moosic/Artist {i // 100}/Album {i // 10}/{i:05} Song.mp3",
+            artist=f"Artist {i // 100}",
+            title=f"Song {i}",
+            album=f"Album {i // 10}",
+            track_num=i % 10 + 1,
+            art_hash=f"{i // 10:040x}",
+            dominant_colour=rng.randrange(1 << 24),
+            has_lyrics=n > 0,
+            title_slugified=f"song{i}",
+        )
+        records.append((record, lyrics, timestamps))
+    return records
+
+
+def loaded_song(record: SongRecord, lyrics: str, timestamps: array) -> Song:
+    song = Song.from_record(record)
+    # copy rather than share, as LegacySong does, so both sides pay for the text
+    lines = lyrics.split("\n") if lyrics else []
+    song._lyrics = (LyricLines.from_lines(lines), array("d", timestamps))
+    return song
+
+
+def measure(
+    build: Callable[[SongRecord, str, array], Any],
+    records: list[tuple[SongRecord, str, array]],
+) -> float:
+    gc.collect()
+    tracemalloc.start()
+    songs = [build(*record) for record in records]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del songs
+    return size / len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--songs", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=60)
+    args = parser.parse_args()
+
+    records = make_records(args.songs, args.lines)
+    before = measure(LegacySong, records)
+    after = measure(loaded_song, records)
+    report(
+        "song_memory",
+        songs=args.songs,
+        lines=args.lines,
+        bytes_per_song_before=round(before),
+        bytes_per_song_after=round(after),
+        ratio=round(after / before, 3),
+    )
+
+
+if __name__ == "__main__":
+    main()
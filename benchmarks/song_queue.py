@@ -0,0 +1,131 @@
+"""
+The deque-backed SongQueue against the BlockList one at 100k entries:
+queueing a whole library, reading pages of the queue command across it,
+removing and moving entries in the middle, skipping half of it and
+shuffling it. The old queue was filled and skipped one await at a time,
+as `play` with number 0 and `skip` did.
+
+    python -m benchmarks.song_queue --entries 100000
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import deque
+
+from .common import report, use_config
+
+use_config()
+
+# napbot reads its config on import, so this has to come after use_config
+from napbot.extensions.music.song import SongQueue
+
+PAGE = 10
+
+
+class LegacySongQueue[T](asyncio.Queue[T]):
+    _queue: deque[T]
+
+    def __getitem__(self, item: int | slice) -> T | list[T]:
+        if isinstance(item, slice):
+            return list(itertools.islice(self._queue, item.start, item.stop, item.step))
+        return self._queue[item]
+
+    def __len__(self):
+        return self.qsize()
+
+    def remove(self, index: int) -> None:
+        del self._queue[index]
+
+    def move(self, source: int, destination: int) -> None:
+        item = self._queue[source]
+        del self._queue[source]
+        self._queue.insert(destination, item)
+
+    def shuffle(self) -> None:
+        items = list(self._queue)
+        random.shuffle(items)
+        self._queue = deque(items)
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+async def timed_async(fn, *args) -> float:
+    start = time.perf_counter()
+    await fn(*args)
+    return time.perf_counter() - start
+
+
+async def measure(queue, items: list, bulk: bool, edits: int) -> dict[str, float]:
+    async def fill():
+        if bulk:
+            queue.extend(items)
+        else:
+            for item in items:
+                await queue.put(item)
+
+    async def skip(count: int):
+        if bulk:
+            queue.skip(count)
+        else:
+            for _ in range(count):
+                await queue.get()
+
+    def pages():
+        for offset in range(0, len(queue), len(queue) // 100 * PAGE or PAGE):
+            queue[offset : offset + PAGE]
+
+    def remove():
+        for _ in range(edits):
+            queue.remove(len(queue) // 2)
+
+    def move():
+        for _ in range(edits):
+            queue.move(len(queue) // 2, 0)
+
+    results = {"fill": await timed_async(fill)}
+    results["pages"] = timed(pages)
+    results["remove"] = timed(remove)
+    results["move"] = timed(move)
+    results["shuffle"] = timed(queue.shuffle)
+    results["skip"] = await timed_async(skip, len(queue) // 2)
+    return results
+
+
+async def run(entries: int, edits: int) -> tuple[dict, dict]:
+    items = [(object(), True) for _ in range(entries)]
+    before = await measure(LegacySongQueue(), items, False, edits)
+    after = await measure(SongQueue(), items, True, edits)
+
+    # the player waiting on an empty queue still wakes for a bulk add
+    queue = SongQueue()
+    getter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0)
+    queue.extend(items[:3])
+    if await asyncio.wait_for(getter, 1) is not items[0]:
+        raise AssertionError("a waiting get() did not receive the first entry")
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, default=1000)
+    args = parser.parse_args()
+
+    before, after = asyncio.run(run(args.entries, args.edits))
+    results = {}
+    for name in before:
+        results[f"{name}_ms_before"] = round(before[name] * 1000, 2)
+        results[f"{name}_ms_after"] = round(after[name] * 1000, 2)
+    report("song_queue", entries=args.entries, edits=args.edits, **results)
+
+
+if __name__ == "__main__":
+    main()
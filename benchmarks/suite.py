@@ -0,0 +1,263 @@
+"""
+Times the music extension's hot paths on a synthetic library and records
+the peak memory each one allocates. Every case prints one JSON line; with
+--output the whole run is also written as one JSON document, which a
+later run can be checked against with --compare.
+
+    python -m benchmarks.suite --tracks 2000 --output before.json
+    python -m benchmarks.suite --tracks 2000 --compare before.json
+
+The library is generated into a scratch directory unless --library points
+at one made earlier by benchmarks.synth.
+"""
+
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from .common import report, use_config
+from .fakes import FakeBot, FakeContext, FakeVoiceClient
+from .synth import make_library
+
+root = use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+from napbot.state import config
+from napbot.extensions.music import Music
+from napbot.extensions.music.catalog import SongCatalog
+from napbot.extensions.music.library import Library
+from napbot.extensions.music.lrc import parse_lrc
+from napbot.extensions.music.song import SongQueue, title_slugify
+
+
+class Suite:
+    def __init__(self, runs: int, baseline: dict[str, Any] | None = None):
+        self.runs = runs
+        self.baseline = baseline or {}
+        self.results: dict[str, dict[str, Any]] = {}
+
+    async def case(
+        self,
+        name: str,
+        run: Callable[[Any], Any],
+        setup: Callable[[], Any] | None = None,
+        ops: int = 1,
+    ):
+        """
+        Time `run` at its best over the configured runs, then run it once
+        more under tracemalloc for its peak allocation. `setup` is called
+        untimed before every run and its result passed to `run`.
+        """
+
+        async def once(trace: bool) -> float:
+            state = setup() if setup else None
+            gc.collect()
+            if trace:
+                tracemalloc.start()
+            start = time.perf_counter()
+            result = run(state)
+            if inspect.isawaitable(result):
+                await result
+            return time.perf_counter() - start
+
+        timings = [await once(False) for _ in range(self.runs)]
+        await once(True)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        best = min(timings)
+        result = {
+            "seconds": round(best, 6),
+            "mean_seconds": round(sum(timings) / len(timings), 6),
+            "ops": ops,
+            "ops_per_second": round(ops / best, 1) if best else None,
+            "peak_bytes": peak,
+        }
+        previous = self.baseline.get(name)
+        if previous and previous["seconds"]:
+            # per operation, so runs on different library sizes still compare
+            before = previous["seconds"] / previous["ops"]
+            result["ratio"] = round(best / ops / before, 3)
+        self.results[name] = result
+        report(f"suite.{name}", **result)
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+QUERIES = [
+    "love",
+    "愛",
+    "夢 -night",
+    "sóng",
+    "summer rain",
+    "feat",
+    "playlist 0",
+    "nothing matches this",
+]
+
+
+async def run_suite(args: argparse.Namespace):
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    suite = Suite(args.runs, baseline)
+
+    music = Music(FakeBot())
+    await music.index_library()
+    songs = music.songs
+    titles = [song.title or song.base_name for song in songs]
+    lrc_texts = []
+    for song in songs:
+        if song.has_lyrics:
+            with open(song.lrc_path, encoding="utf-8-sig") as f:
+                lrc_texts.append(f.read())
+
+    def cold():
+        music.catalog = SongCatalog(":memory:")
+        music.library = Library([], {}, {})
+
+    def from_catalog():
+        music.library = Library([], {}, {})
+
+    await suite.case("get_files.cold", lambda _: music.get_files(), cold, len(songs))
+    music.library = music.get_files()
+    await suite.case(
+        "get_files.catalog", lambda _: music.get_files(), from_catalog, len(songs)
+    )
+    music.library = music.get_files()
+    await suite.case("get_files.unchanged", lambda _: music.get_files(), ops=len(songs))
+
+    await suite.case(
+        "find_songs",
+        lambda _: [music.find_songs(query) for query in QUERIES],
+        ops=len(QUERIES),
+    )
+    await suite.case(
+        "title_slugify",
+        lambda _: [title_slugify(title) for title in titles],
+        ops=len(titles),
+    )
+    await suite.case(
+        "parse_lrc",
+        lambda _: [parse_lrc(text) for text in lrc_texts],
+        ops=len(lrc_texts),
+    )
+
+    items = [(song, True) for song in songs]
+
+    def filled() -> SongQueue:
+        queue = SongQueue()
+        for item in items:
+            queue.put_nowait(item)
+        return queue
+
+    def fill(_):
+        queue = SongQueue()
+        for item in items:
+            queue.put_nowait(item)
+
+    def page_through(queue: SongQueue):
+        for offset in range(0, len(queue), 10):
+            queue[offset : offset + 10]
+
+    def edit(queue: SongQueue):
+        # remove from the middle and jump the queue, as remove and playnext do
+        for i in range(min(100, len(queue))):
+            queue.remove(len(queue) // 2)
+            queue.putfirst(items[i])
+
+    await suite.case("song_queue.put", fill, ops=len(items))
+    await suite.case("song_queue.pages", page_through, filled, len(items) // 10 + 1)
+    await suite.case("song_queue.edit", edit, filled, min(100, len(items)))
+
+    ctx = FakeContext(1, FakeVoiceClient(0))
+    voice_state = music.voice_states.get(1)
+    for item in items:
+        voice_state.queue.put_nowait(item)
+    pages = len(items) // 10 + 1
+
+    async def search_embeds(_):
+        for query in QUERIES:
+            for page in range(1, 4):
+                await Music.search.callback(music, ctx, query, page)
+
+    async def queue_embeds(_):
+        for page in range(1, pages + 1):
+            await Music.show_queue.callback(music, ctx, page)
+
+    async def playlist_embeds(_):
+        await Music.show_playlists.callback(music, ctx)
+        for name in music.playlist_map:
+            await Music.show_playlists.callback(music, ctx, name, 1)
+
+    await suite.case("embed.search", search_embeds, ops=len(QUERIES) * 3)
+    await suite.case("embed.queue", queue_embeds, ops=pages)
+    await suite.case(
+        "embed.playlists", playlist_embeds, ops=len(music.playlist_map) + 1
+    )
+    voice_state.clear()
+    await music.voice_states.close()
+
+    return suite.results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--tracks", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--library", help="an existing synthetic library")
+    parser.add_argument("--output", help="write the whole run to this file")
+    parser.add_argument("--compare", help="a previous --output to compare with")
+    args = parser.parse_args()
+
+    path = args.library or os.path.join(root, "library")
+    if args.library:
+        library = {"path": path}
+    else:
+        start = time.perf_counter()
+        library = make_library(path, args.tracks, args.seed)
+        library["generated_seconds"] = round(time.perf_counter() - start, 2)
+    config.config["music"]["MusicPath"] = path
+
+    results = asyncio.run(run_suite(args))
+    document = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "library": library,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Builds a synthetic music library to benchmark against, entirely offline:
+silent MP3s tagged with ID3 and embedded cover art, LRC files for some of
+them and M3U playlists, with CJK, accented and emoji titles mixed in.
+
+    python -m benchmarks.synth /tmp/library --tracks 2000
+
+eyed3 is needed for tags and pillow for cover art; without them the files
+are still written, untagged or without art.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+from typing import Any
+
+try:
+    import eyed3
+    import eyed3.id3
+
+    eyed3_installed = True
+except ImportError:
+    eyed3_installed = False
+
+try:
+    from PIL import Image
+
+    pillow_installed = True
+except ImportError:
+    pillow_installed = False
+
+# one silent MPEG-1 layer III frame, 128 kbps at 44.1 kHz
+FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+FRAMES_PER_TRACK = 40
+
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 3
+
+LATIN = "love night summer heart fire dream river light home road rain gold".split()
+ACCENTED = "Sóng Café Niño Æther Über Déjà Señor Mañana".split()
+CJK = "愛 夜 夢 光 雨 心 星 花 海 風 歌 戀 晴れ さくら 사랑 별".split()
+EMOJI = "🔥 ✨ 💔 🌙 🎧 🌸".split()
+
+
+def make_title(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.5:
+        words = rng.sample(LATIN, rng.randint(1, 4))
+        title = " ".join(w.capitalize() for w in words)
+    elif roll < 0.65:
+        title = f"{rng.choice(ACCENTED)} {rng.choice(LATIN)}"
+    elif roll < 0.9:
+        title = "".join(rng.sample(CJK, rng.randint(1, 3)))
+    else:
+        title = f"{rng.choice(LATIN).capitalize()} {rng.choice(EMOJI)}"
+
+    roll = rng.random()
+    if roll < 0.1:
+        title += f" (feat. {rng.choice(ACCENTED)})"
+    elif roll < 0.15:
+        title += " (Remastered)"
+    elif roll < 0.2:
+        title = f"{title} & {rng.choice(LATIN).capitalize()}"
+    return title
+
+
+def make_lrc(rng: random.Random, title: str) -> str:
+    out = [f"[ti:{title}]", "[ar:Synthetic]", f"[offset:{rng.randint(-200, 200)}]"]
+    verse = [f"{rng.choice(LATIN)} {rng.choice(CJK)} {i}" for i in range(8)]
+    chorus = [f"{title} {rng.choice(LATIN)}" for _ in range(4)]
+    t = rng.uniform(0, 10)
+    for section in (verse, chorus, verse, chorus, chorus):
+        for line in section:
+            t += rng.uniform(2, 5)
+            out.append(f"[{int(t // 60):02}:{t % 60:05.2f}]{line}")
+    return "\n".join(out) + "\n"
+
+
+def make_art(rng: random.Random, size: int = 600) -> bytes:
+    colour = tuple(rng.randrange(256) for _ in range(3))
+    image = Image.new("RGB", (size, size), colour)
+    # a second colour so the dominant colour has something to choose from
+    accent = tuple(rng.randrange(256) for _ in range(3))
+    image.paste(accent, (0, 0, size // 3, size // 3))
+    with io.BytesIO() as buffer:
+        image.save(buffer, "JPEG", quality=90)
+        return buffer.getvalue()
+
+
+def tag(path: str, tags: dict[str, Any], art: bytes | None):
+    audio = eyed3.load(path)
+    audio.initTag(version=eyed3.id3.ID3_V2_4)
+    audio.tag.artist = tags["artist"]
+    audio.tag.title = tags["title"]
+    audio.tag.album = tags["album"]
+    audio.tag.track_num = tags["track_num"]
+    if art is not None:
+        audio.tag.images.set(3, art, "image/jpeg")
+    audio.tag.save()
+
+
+def make_library(
+    root: str,
+    tracks: int,
+    seed: int = 0,
+    lyrics_ratio: float = 0.5,
+    playlists: int = 5,
+    playlist_length: int = 50,
+) -> dict[str, Any]:
+    """
+    Write `tracks` songs under `root` as Artist/Album/NN Title.mp3 and
+    return a summary of what was made. The same seed always gives the same
+    library.
+    """
+    if eyed3_installed:
+        # it warns about every frame it cannot work out a length for
+        eyed3.log.setLevel("ERROR")
+    rng = random.Random(seed)
+    paths: list[str] = []
+    lyrics = 0
+    albums = (tracks + TRACKS_PER_ALBUM - 1) // TRACKS_PER_ALBUM
+    for album in range(albums):
+        artist = (
+            f"{rng.choice(ACCENTED)} {rng.choice(CJK)} {album // ALBUMS_PER_ARTIST}"
+        )
+        album_name = f"{make_title(rng)} {album}"
+        directory = os.path.join(root, artist, album_name)
+        os.makedirs(directory, exist_ok=True)
+        art = make_art(rng) if pillow_installed else None
+
+        for number in range(min(TRACKS_PER_ALBUM, tracks - len(paths))):
+            title = make_title(rng)
+            # titles can hold characters file systems do not like
+            stem = os.path.join(directory, f"{number + 1:02} {title.replace('/', '_')}")
+            path = stem + ".mp3"
+            with open(path, "wb") as f:
+                f.write(FRAME * FRAMES_PER_TRACK)
+            if eyed3_installed:
+                tags = {
+                    "artist": artist,
+                    "title": title,
+                    "album": album_name,
+                    "track_num": number + 1,
+                }
+                tag(path, tags, art)
+            if rng.random() < lyrics_ratio:
+                with open(stem + ".lrc", "w", encoding="utf-8") as f:
+                    f.write(make_lrc(rng, title))
+                lyrics += 1
+            paths.append(os.path.realpath(path))
+
+    for i in range(playlists):
+        songs = rng.sample(paths, min(playlist_length, len(paths)))
+        with open(os.path.join(root, f"playlist {i}.m3u"), "w", encoding="utf-8") as f:
+            f.write("#EXTM3U\n")
+            for song in songs:
+                f.write(f"#EXTINF:0,{os.path.basename(song)}\n{song}\n")
+
+    return {
+        "tracks": len(paths),
+        "lyrics": lyrics,
+        "albums": albums,
+        "playlists": playlists,
+        "tagged": eyed3_installed,
+        "art": pillow_installed,
+        "seed": seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lyrics-ratio", type=float, default=0.5)
+    parser.add_argument("--playlists", type=int, default=5)
+    args = parser.parse_args()
+
+    summary = make_library(
+        args.root, args.tracks, args.seed, args.lyrics_ratio, args.playlists
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Silence between consecutive tracks, measured by running VoiceState's
+player against a fake voice client whose tracks end on a timer from the
+audio thread, the way discord.py's AudioPlayer calls `after`.
+
+    python -m benchmarks.track_gap --tracks 20 --length 0.2
+"""
+
+import argparse
+import asyncio
+import statistics
+
+from .common import report, use_config
+from .fakes import FakeBot, FakeContext, FakeSource, FakeVoiceClient
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+import discord
+
+from napbot.extensions.music.song import Song, SongRecord
+from napbot.extensions.music.voice import VoiceState
+
+
+class BenchVoiceState(VoiceState):
+    def make_source(
+        self, song: Song, start_ts: str, cached: str | None
+    ) -> discord.AudioSource:
+        return FakeSource(song.path)  # type: ignore[return-value]
+
+
+async def run(tracks: int, length: float) -> list[float]:
+    state = BenchVoiceState(FakeBot())  # type: ignore[arg-type]
+    vc = FakeVoiceClient(length)
+    await state.connect(FakeContext(0, vc, latency=0.05))  # type: ignore[arg-type]
+    for i in range(tracks):
+        record = SongRecord(
+            f"/bench/{i}.mp3", "Artist", f"Song {i}", None, i, None, None, False, ""
+        )
+        await state.add(Song.from_record(record), lyrics=False)
+
+    while len(vc.started) < tracks:
+        await asyncio.sleep(length / 4)
+    state.player.cancel()
+    return [start - end for end, start in zip(vc.ended, vc.started[1:])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--length", type=float, default=0.2)
+    args = parser.parse_args()
+
+    gaps = asyncio.run(run(args.tracks, args.length))
+    report(
+        "track_gap",
+        tracks=args.tracks,
+        mean_gap_ms=round(statistics.mean(gaps) * 1000, 2),
+        max_gap_ms=round(max(gaps) * 1000, 2),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Time from one track ending to the next one's first packet, with and
+without the next track's source prepared while the current one plays.
+Sources take as long to start as a typical ffmpeg process.
+
+    python -m benchmarks.transition --tracks 10 --spawn 0.01 --probe 0.06
+"""
+
+import argparse
+import asyncio
+import statistics
+
+from .common import report, use_config
+from .fakes import FakeBot, FakeContext, FakeSource, FakeVoiceClient
+
+use_config()
+
+# napbot reads its config on import, so these have to come after use_config
+import discord
+
+from napbot.extensions.music.song import Song, SongRecord
+from napbot.extensions.music.voice import VoiceState
+
+
+class BenchVoiceState(VoiceState):
+    spawn = 0.0
+    probe = 0.0
+
+    def make_source(
+        self, song: Song, start_ts: str, cached: str | None
+    ) -> discord.AudioSource:
+        source = FakeSource(song.path, self.spawn, self.probe)
+        self.sources.append(source)
+        return source  # type: ignore[return-value]
+
+
+def make_song(i: int) -> Song:
+    record = SongRecord(
+        f"/bench/{i}.mp3", "Artist", f"Song {i}", None, i, None, None, False, ""
+    )
+    return Song.from_record(record)
+
+
+async def transitions(tracks: int, length: float, prefetch: bool) -> list[float]:
+    state = BenchVoiceState(FakeBot(), prefetch=prefetch)  # type: ignore[arg-type]
+    state.sources = []
+    vc = FakeVoiceClient(length)
+    await state.connect(FakeContext(0, vc))  # type: ignore[arg-type]
+    for i in range(tracks):
+        await state.add(make_song(i), lyrics=False)
+
+    while len(vc.ended) < tracks:
+        await asyncio.sleep(length / 4)
+    state.player.cancel()
+    return [start - end for end, start in zip(vc.ended, vc.started[1:])]
+
+
+async def discarded_on_clear(length: float) -> bool:
+    """
+    Whether the source prepared for the next track is released when the
+    queue is cleared underneath it.
+    """
+    state = BenchVoiceState(FakeBot())  # type: ignore[arg-type]
+    state.sources = []
+    vc = FakeVoiceClient(length)
+    await state.connect(FakeContext(0, vc))  # type: ignore[arg-type]
+    await state.add(make_song(0), lyrics=False)
+    await state.add(make_song(1), lyrics=False)
+    await asyncio.sleep(length / 2)
+    state.clear()
+    await asyncio.sleep(length)
+    state.player.cancel()
+    return len(state.sources) == 2 and state.sources[1].cleaned_up
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--length", type=float, default=0.3)
+    parser.add_argument("--spawn", type=float, default=0.01)
+    parser.add_argument("--probe", type=float, default=0.06)
+    args = parser.parse_args()
+    BenchVoiceState.spawn = args.spawn
+    BenchVoiceState.probe = args.probe
+
+    cold = asyncio.run(transitions(args.tracks, args.length, prefetch=False))
+    warm = asyncio.run(transitions(args.tracks, args.length, prefetch=True))
+    report(
+        "transition",
+        tracks=args.tracks,
+        without_prefetch_ms=round(statistics.mean(cold) * 1000, 2),
+        with_prefetch_ms=round(statistics.mean(warm) * 1000, 2),
+        discarded_on_clear=asyncio.run(discarded_on_clear(args.length)),
+    )
+
+
+if __name__ == "__main__":
+    main()
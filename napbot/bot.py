@@ -1,37 +1,65 @@
 #!/usr/bin/oython
-from .state import log, config
+from .metrics import MetricsServer, monitor_loop_lag, watch_rate_limits
+from .state import log, config, metrics, started_at
 from discord.ext import commands
 import discord
 import traceback
 import asyncio
+import time
 
 bot = commands.Bot(command_prefix=config.command_prefix, intents=discord.Intents.all())
 
+STARTUP_SECONDS = metrics.gauge(
+    "napbot_startup_seconds",
+    "Seconds from the process starting to each stage of startup.",
+    ("stage",),
+)
+
 
 async def run_bot():
+    watch_rate_limits(metrics)
+    lag_monitor = asyncio.create_task(monitor_loop_lag(metrics))
+    server: MetricsServer | None = None
+    if config.metrics_address:
+        try:
+            server = MetricsServer(metrics, config.metrics_address)
+            await server.start()
+            log.info("Serving metrics on %s:%d.", server.host, server.port)
+        except (OSError, ValueError) as e:
+            log.warn("Could not serve metrics on %s: %s", config.metrics_address, e)
+            server = None
+
     async with bot:
         # import cogs
         for m in config.modules:
-            log.debug(f"Attempting to load extension {m}.")
+            log.debug("Attempting to load extension %s.", m)
             try:
                 # this is a coroutine so we want to blocking wait it
                 await bot.load_extension(f".extensions.{m}", package=__package__)
                 # asyncio.run(bot.load_extension(f"extensions.{m}"))
             except commands.ExtensionNotFound:
                 traceback.print_exc()
-                log.warn(f"Extension {m} was not found, skipping.")
+                log.warn("Extension %s was not found, skipping.", m)
             except commands.NoEntryPointError:
-                log.warn(f"Extension {m} is missing a global setup function, skipping.")
+                log.warn(
+                    "Extension %s is missing a global setup function, skipping.", m
+                )
             except commands.ExtensionFailed:
                 log.warn(
-                    f"Extension {m} failed somewhere in its setup process, skipping."
+                    "Extension %s failed somewhere in its setup process, skipping.", m
                 )
                 log.error(traceback.format_exc())
-        log.info(f"Loaded {len(bot.cogs)} module(s).")
+        log.info("Loaded %d module(s).", len(bot.cogs))
+        online = False
 
         @bot.event
         async def on_ready():
-            log.info(f"Logged in to Discord as {bot.user}.")
+            log.info("Logged in to Discord as %s.", bot.user)
+            nonlocal online
+            # on_ready fires again after reconnecting, keep the first time
+            if not online:
+                online = True
+                STARTUP_SECONDS.set(time.monotonic() - started_at, stage="online")
 
         @bot.command(name="crash")
         async def crash(ctx: commands.Context[commands.Bot]):
@@ -41,7 +69,22 @@ async def run_bot():
             else:
                 await ctx.send("You are not an administrator.")
 
-        await bot.start(config.bot_token)
+        @bot.command(name="metrics")
+        async def show_metrics(ctx: commands.Context[commands.Bot]):
+            if ctx.author.id not in config.admin_ids:
+                return await ctx.send("You are not an administrator.")
+            summary = metrics.summary() or "Nothing recorded yet."
+            # leave room for the code block in Discord's 2000 character limit
+            if len(summary) > 1900:
+                summary = summary[:1900].rsplit("\n", 1)[0] + "\n..."
+            await ctx.send(f"```\n{summary}\n```")
+
+        try:
+            await bot.start(config.bot_token)
+        finally:
+            lag_monitor.cancel()
+            if server is not None:
+                await server.close()
 
 
 if __name__ == "__main__":
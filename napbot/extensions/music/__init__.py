@@ -1,24 +1,59 @@
-from pathlib import Path
+import asyncio
+import bisect
+import os
 import traceback
 import math
 import random
 import re
+import time
+from collections.abc import Callable, Sequence
 from typing import Literal, overload
 
+from .analysis import SegmentStore
+from .art import ArtEntry, ArtStore, ArtUrlCache
+from .catalog import SongCatalog, Stamp, file_stamp
+from .library import Library
+from .opus_cache import OpusCache
+from .outbound import OutboundScheduler
 from .playlist import load_playlists
+from .scan import parse_songs
+from .segments import Shuffled
+from .walk import LibraryFiles, walk_key, walk_library
+from .watcher import LibraryWatcher
 
+from ...bot import STARTUP_SECONDS
 from ...utils import BotContext
 
-from .song import SLUGIFY_PATTERN, Song, title_slugify
+from .song import SLUGIFY_PATTERN, Song, SongRecord
 
-from .voice import VoiceState
-from ...state import config, log
+from .voice import BITRATE, VoiceState, VoiceStateManager
+from ...state import config, log, metrics, started_at
 
 import discord
 from discord.ext import commands
 
 MANUAL_LYRIC_OFFSET = 0
 ITEMS_PER_PAGE = 10
+# seconds between partial generations while the library is first indexed
+PUBLISH_INTERVAL = 2.0
+
+SCAN_SECONDS = metrics.histogram(
+    "napbot_library_scan_seconds",
+    "Time taken to build a generation of the library.",
+    ("kind",),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+SONGS_INDEXED = metrics.gauge(
+    "napbot_library_songs", "Songs in the current generation of the library."
+)
+FUZZY_SECONDS = metrics.histogram(
+    "napbot_fuzzy_search_seconds",
+    "Time taken by searches that fell back to fuzzy matching.",
+)
+
+# called from the scan thread with a partial generation, songs parsed so
+# far and songs in the library
+ProgressCallback = Callable[[Library, int, int], None]
 
 
 class Music(commands.Cog):
@@ -44,81 +79,385 @@ class Music(commands.Cog):
                 conf.getfloat("GuessVoteSkipPercent", 0.0) / 100
             )
             self.guess_lenient: bool = conf.getboolean("GuessLenient", fallback=True)
+            self.catalog_path: str = conf.get("CatalogPath", fallback="catalog.sqlite3")
+            # 0 uses every core, 1 keeps the scan in this process
+            self.scan_workers: int = (
+                conf.getint("ScanWorkers", fallback=1) or os.cpu_count() or 1
+            )
+            self.scan_chunk_size: int = conf.getint("ScanChunkSize", fallback=64)
+            self.art_cache_bytes: int = conf.getint(
+                "ArtCacheBytes", fallback=32 * 1024 * 1024
+            )
+            # covers whose uploaded URL is reused, 0 uploads every time
+            self.art_url_cache_size: int = conf.getint("ArtUrlCacheSize", fallback=1024)
+            # only used when watchdog is unavailable, 0 disables polling
+            self.rescan_interval: float = conf.getfloat("RescanInterval", fallback=600)
+            # empty disables the cache
+            self.opus_cache_path: str = conf.get("OpusCachePath", fallback="")
+            self.opus_cache_bytes: int = conf.getint(
+                "OpusCacheBytes", fallback=2 * 1024 * 1024 * 1024
+            )
+            self.opus_cache_workers: int = conf.getint("OpusCacheWorkers", fallback=2)
+            self.prefetch_next: bool = conf.getboolean("PrefetchNext", fallback=True)
+            # fall back to ranked typo tolerant matches when nothing matches
+            self.fuzzy_search: bool = conf.getboolean("FuzzySearch", fallback=True)
+            self.fuzzy_budget: float = (
+                conf.getfloat("FuzzyBudgetMs", fallback=50) / 1000
+            )
         else:
             self.root_path = "/media/Moosic"
             self.show_song_status = False
             self.guess_vote_skip_percent = 0
             self.guess_lenient = False
+            self.catalog_path = "catalog.sqlite3"
+            self.scan_workers = 1
+            self.scan_chunk_size = 64
+            self.art_cache_bytes = 32 * 1024 * 1024
+            self.art_url_cache_size = 1024
+            self.rescan_interval = 600
+            self.opus_cache_path = ""
+            self.opus_cache_bytes = 2 * 1024 * 1024 * 1024
+            self.opus_cache_workers = 2
+            self.prefetch_next = True
+            self.fuzzy_search = True
+            self.fuzzy_budget = 0.05
+
+        self.catalog = SongCatalog(self.catalog_path)
+        self.art_store = ArtStore(self.catalog, self.art_cache_bytes)
+        self.art_urls = ArtUrlCache(self.art_url_cache_size)
+        self.outbound = OutboundScheduler(self.bot)
+        self.opus_cache = (
+            OpusCache(
+                self.opus_cache_path,
+                BITRATE,
+                self.opus_cache_bytes,
+                self.opus_cache_workers,
+            )
+            if self.opus_cache_path
+            else None
+        )
 
-        self.voice_state = VoiceState(
-            self.bot, guess_vote_skip_percent=self.guess_vote_skip_percent
+        self.voice_states = VoiceStateManager(
+            self.bot,
+            guess_vote_skip_percent=self.guess_vote_skip_percent,
+            art_store=self.art_store,
+            art_urls=self.art_urls,
+            outbound=self.outbound,
+            opus_cache=self.opus_cache,
+            segment_store=SegmentStore(self.catalog),
+            prefetch=self.prefetch_next,
+        )
+        self.rescan_lock = asyncio.Lock()
+        self.watcher = LibraryWatcher(
+            self.root_path, self.update_library, self.rescan_interval
         )
-        # process all songs
-        self.get_files()
-
-    def get_files(self):
-        self.songs: list[Song] = []
-
-        log.info(f"Searching for songs from {self.root_path}.")
-        ignored: int = 0
-        for file in Path(self.root_path).rglob("*.mp3"):
-            abs_path_parent = str(file.resolve().parent.absolute())
-            abs_path = str(file.resolve().absolute())
-            if file.suffix == ".mp3":
-                for query in self.ignored_paths:
-                    if query in abs_path_parent:
-                        ignored += 1
-                        break
+        # filled in the background by cog_load, see index_library
+        self.library = Library([], {}, {})
+        self.library_ready = asyncio.Event()
+        # (songs indexed, songs found), the latter 0 until the walk is done
+        self.index_progress = (0, 0)
+        self.indexer: asyncio.Task[None] | None = None
+
+    async def cog_load(self):
+        self.indexer = asyncio.create_task(self.index_library())
+        self.watcher.start()
+
+    async def cog_unload(self):
+        if self.indexer is not None:
+            self.indexer.cancel()
+        self.watcher.stop()
+        await self.voice_states.close()
+        await self.outbound.close()
+        if self.opus_cache is not None:
+            await self.opus_cache.close()
+
+    @property
+    def songs(self) -> list[Song]:
+        return self.library.songs
+
+    @property
+    def song_map(self) -> dict[str, Song]:
+        return self.library.song_map
+
+    @property
+    def playlist_map(self) -> dict[str, list[Song]]:
+        return self.library.playlist_map
+
+    def is_ignored(self, parent: str) -> bool:
+        return any(query in parent for query in self.ignored_paths)
+
+    def get_files(
+        self,
+        changed: set[str] | None = None,
+        on_progress: ProgressCallback | None = None,
+    ) -> Library:
+        """
+        Build the next generation of the library. If `changed` is given only
+        those paths are looked at, otherwise the whole library is walked.
+        Songs whose files have not changed are carried over from the
+        current generation as they are. `on_progress` is handed partial
+        generations, without playlists, while new songs are being parsed.
+        """
+        start = time.perf_counter()
+        previous = self.library
+        cached = self.catalog.entries() if changed is None else {}
+        stamps: dict[str, Stamp] = {}
+        files: LibraryFiles | None = None
+        hits: int = 0
+        removed: list[str] = []
+        # keep the walk order regardless of which songs come from the cache
+        found: list[Song | None] = []
+        # (position in found, path, stamp, whether it has an LRC if known)
+        misses: list[tuple[int, str, Stamp, bool | None]] = []
+
+        if changed is None:
+            log.info("Searching for songs from %s.", self.root_path)
+            files = walk_library(self.root_path, self.ignored_paths)
+            for abs_path in files.songs:
+                has_lyrics = files.has_lyrics(abs_path)
+                try:
+                    stamp = file_stamp(abs_path, has_lyrics)
+                except IOError:
+                    # expected if file not found
+                    continue
+                entry = cached.get(abs_path)
+                if previous.stamps.get(abs_path) == stamp:
+                    found.append(previous.song_map[abs_path])
+                    stamps[abs_path] = stamp
+                    hits += 1
+                elif entry is not None and entry[0] == stamp:
+                    found.append(Song.from_record(entry[1]))
+                    stamps[abs_path] = stamp
+                    hits += 1
                 else:
-                    try:
-                        self.songs.append(Song(abs_path, log))
-                    except IOError:
-                        # expected if file not found
-                        pass
-
-        self.song_map = {song.path: song for song in self.songs}
+                    misses.append((len(found), abs_path, stamp, has_lyrics))
+                    found.append(None)
+        else:
+            log.info("Rescanning %d changed path(s).", len(changed))
+            found.extend(previous.songs)
+            stamps.update(previous.stamps)
+            positions = {song.path: i for i, song in enumerate(previous.songs)}
+            # an edited LRC means its song needs parsing again
+            audio_paths = {
+                os.path.realpath(os.path.splitext(path)[0] + ".mp3")
+                for path in changed
+                if path.endswith((".mp3", ".lrc"))
+            }
+            for abs_path in sorted(audio_paths):
+                if self.is_ignored(os.path.dirname(abs_path)):
+                    continue
+                index = positions.get(abs_path)
+                try:
+                    stamp = file_stamp(abs_path)
+                except IOError:
+                    if index is not None:
+                        found[index] = None
+                        del stamps[abs_path]
+                        removed.append(abs_path)
+                    continue
+                if stamps.get(abs_path) == stamp:
+                    continue
+                if index is None:
+                    index = len(found)
+                    found.append(None)
+                else:
+                    found[index] = None
+                    del stamps[abs_path]
+                misses.append((index, abs_path, stamp, None))
+
+        parsed = 0
+        published = time.perf_counter()
+        # each partial generation extends the index of the one before
+        partial: Library | None = None
+
+        def publish():
+            nonlocal partial
+            self.catalog.commit()
+            partial = Library(
+                [song for song in found if song is not None],
+                dict(stamps),
+                {},
+                previous=partial,
+            )
+            on_progress(partial, hits + parsed, len(found))
 
-        log.info(f"Found {len(self.songs)} songs, ignored {ignored}.")
+        def store(
+            offset: int, records: list[SongRecord | None], art: dict[str, ArtEntry]
+        ):
+            nonlocal parsed, published
+            for i, record in enumerate(records, offset):
+                index, path, stamp, _ = misses[i]
+                if record is not None:
+                    self.catalog.store(record, stamp, art.get(record.art_hash))
+                    found[index] = Song.from_record(record)
+                    stamps[path] = stamp
+            parsed += len(records)
+            if (
+                on_progress is not None
+                and time.perf_counter() - published >= PUBLISH_INTERVAL
+            ):
+                publish()
+                published = time.perf_counter()
+
+        if on_progress is not None and misses:
+            # whatever the catalog already has is searchable straight away
+            publish()
+        parse_songs(
+            [path for _, path, _, _ in misses],
+            self.scan_workers,
+            self.scan_chunk_size,
+            self.catalog.art_colours() if misses else None,
+            [has_lyrics for _, _, _, has_lyrics in misses],
+            on_chunk=store,
+        )
 
-        playlists = load_playlists()
+        songs = [song for song in found if song is not None]
+        if changed is not None and len(found) > len(previous.songs):
+            # put new songs where a full walk would have found them
+            root = os.path.realpath(self.root_path)
+            songs = [song for song in found[: len(previous.songs)] if song is not None]
+            for song in found[len(previous.songs) :]:
+                if song is not None:
+                    bisect.insort(songs, song, key=lambda s: walk_key(root, s.path))
+        if changed is None:
+            pruned = self.catalog.prune(song.path for song in songs)
+        else:
+            pruned = self.catalog.remove(removed)
+        self.catalog.commit()
+
+        log.info(
+            "Found %d songs, ignored %d directories "
+            "(cache: %d hits, %d misses, %d pruned).",
+            len(songs),
+            files.ignored_dirs if files else 0,
+            hits,
+            len(misses),
+            pruned,
+        )
 
-        self.playlist_map: dict[str, list[Song]] = {}
+        if files is None and any(path.endswith(".m3u") for path in changed or ()):
+            # only the listing is needed, no song is looked at again
+            files = walk_library(self.root_path, self.ignored_paths)
+        if files is not None:
+            playlists = load_playlists(files.playlists)
+        else:
+            playlists = previous.playlists
+        # only the songs that differ from the generation before are indexed
+        library = Library(
+            songs,
+            stamps,
+            playlists,
+            fuzzy=self.fuzzy_search,
+            previous=partial or previous,
+        )
 
-        for name, songs in playlists.items():
-            song_list: list[Song] = []
-            for song in songs:
-                if song in self.song_map:
-                    song_list.append(self.song_map[song])
-                else:
-                    log.warn(
-                        f"Playlist '{name}' contains song '{song}' which does not exist."
-                    )
-            self.playlist_map[name] = song_list
+        log.info("Loaded %d playlists.", len(library.playlist_map))
+        SCAN_SECONDS.observe(
+            time.perf_counter() - start,
+            kind="full" if changed is None else "incremental",
+        )
+        SONGS_INDEXED.set(len(songs))
+        return library
+
+    async def update_library(self, changed: set[str] | None = None) -> bool:
+        """
+        Rescan in a worker thread and swap the new generation in once it is
+        complete. Commands keep using the current one in the meantime, and
+        keep it if the rescan fails. Returns whether it succeeded.
+        """
+        async with self.rescan_lock:
+            try:
+                self.library = await asyncio.to_thread(self.get_files, changed)
+            except Exception:
+                log.error("Rescanning the library failed.")
+                log.error(traceback.format_exc())
+                return False
+        return True
+
+    async def index_library(self):
+        """
+        Index the library for the first time without holding up logging in.
+        Commands see each partial generation as it is published.
+        """
+
+        def publish(library: Library, done: int, total: int):
+            self.library = library
+            self.index_progress = (done, total)
 
-        log.info(f"Loaded {len(self.playlist_map)} playlists.")
+        try:
+            async with self.rescan_lock:
+                self.library = await asyncio.to_thread(self.get_files, None, publish)
+        except Exception:
+            # keep the last partial generation rather than nothing at all
+            log.error("Indexing the library failed, keeping what was indexed.")
+            log.error(traceback.format_exc())
+        finally:
+            # commands waiting on the library must not wait forever
+            self.index_progress = (len(self.songs), len(self.songs))
+            self.library_ready.set()
+        STARTUP_SECONDS.set(time.monotonic() - started_at, stage="library_ready")
+        log.info("Library ready with %d songs.", len(self.songs))
+
+    async def wait_for_library(self, ctx: BotContext):
+        """
+        Hold a command that needs the whole library until the first index
+        is complete, telling the user how far along it is.
+        """
+        if self.library_ready.is_set():
+            return
+        done, total = self.index_progress
+        progress = f" ({done} of {total} songs)" if total else ""
+        await ctx.send(
+            f"Still indexing the library{progress}, "
+            "this will go ahead once it is done."
+        )
+        await self.library_ready.wait()
 
-    async def get_voice_state(self, ctx: BotContext):
-        await self.voice_state.connect(ctx)
+    async def get_voice_state(self, ctx: BotContext) -> VoiceState:
+        voice_state = self.voice_states.get(ctx.guild.id)
+        try:
+            await voice_state.connect(ctx)
+        except AttributeError:
+            # the author is not in a voice channel
+            if not voice_state.audio_running:
+                # never connected, so there is no player to time it out later
+                self.voice_states.evict(ctx.guild.id)
+            raise
+        return voice_state
 
     def find_songs(self, query: str) -> list[Song]:
-        if self.playlist_map.get(query):
-            return self.playlist_map[query]
+        return self.search_songs(query)[0]
+
+    def search_songs(self, query: str) -> tuple[list[Song], bool]:
+        """
+        Return the songs matching `query`, and whether nothing matched
+        exactly so they are fuzzy matches ranked by how closely they
+        resemble it instead.
+        """
+        # a rescan may swap the library out while we are working
+        library = self.library
+        if library.playlist_map.get(query):
+            return library.playlist_map[query], False
 
         args = [q for q in query.lower().split() if not q.startswith("-")]
         exclusion_terms = [q[1:] for q in query.lower().split() if q.startswith("-")]
 
-        sources: list[Song] = []
-        for song in self.songs:
-            for q in exclusion_terms:
-                if q in song.path_lower or q in song.get_name().lower():
-                    break
-            else:
-                for q in args:
-                    if not (q in song.path_lower or q in song.get_name().lower()):
-                        break
-                else:
-                    sources.append(song)
-        return sources
+        songs = library.search_index.search(args, exclusion_terms)
+        if songs or not args or library.fuzzy_index is None:
+            return songs, False
+
+        start = time.perf_counter()
+        songs = library.fuzzy_index.search(" ".join(args), self.fuzzy_budget)
+        FUZZY_SECONDS.observe(time.perf_counter() - start)
+        songs = [
+            song
+            for song in songs
+            if not any(
+                term in song.path_lower or term in song.get_name().lower()
+                for term in exclusion_terms
+            )
+        ]
+        return songs, True
 
     @commands.command()
     async def guess(
@@ -128,39 +467,43 @@ class Music(commands.Cog):
         start_pos: Literal["RANDOM", "CHORUS", "BEGINNING"] = "BEGINNING",
         pattern: str = "",
     ):
-        if self.voice_state:  # if connected
+        voice_state = self.voice_states.get(ctx.guild.id)
+        if voice_state:  # if connected
             return await ctx.send(
                 "Napbot must not be in a voice channel to turn on Guess Mode."
             )
 
-        self.guess_leaderboard = dict[int, int]()
-        self.voice_state.guess_mode = True
-        self.voice_state.guess_show_artist = show_artist
-        self.voice_state.start_pos = start_pos
+        voice_state.guess_leaderboard = dict[int, int]()
+        voice_state.guess_mode = True
+        voice_state.guess_show_artist = show_artist
+        voice_state.start_pos = start_pos
 
         await self._play(ctx, pattern, 0, play_random=False, show_lyrics=False)
+        if not voice_state.audio_running:
+            # never connected, so there is no player to time it out later
+            return self.voice_states.evict(ctx.guild.id)
         await ctx.send("Guess mode activated! Type your guess of the song!")
 
     @commands.Cog.listener()
     async def on_message(self, msg: discord.Message):
         content = msg.content
 
+        voice_state = self.voice_states.peek(msg.guild and msg.guild.id)
         # ignore self
         if msg.author.id == self.bot.user.id or not (
-            self.voice_state and self.voice_state.guess_mode
+            voice_state and voice_state.guess_mode
         ):
             return
 
-        current_title = self.voice_state.current[0].title_slugified
-        if title_slugify(content) == current_title or (
-            self.guess_lenient and current_title in title_slugify(content)
-        ):
-            self.guess_leaderboard[msg.author.id] = (
-                self.guess_leaderboard.get(msg.author.id, 0) + 1
-            )
-            await self.voice_state.skip()
+        matcher = voice_state.guess_matcher
+        if matcher is not None and matcher.matches(content, self.guess_lenient):
+            # only the first correct guess scores
+            voice_state.guess_matcher = None
+            leaderboard = voice_state.guess_leaderboard
+            leaderboard[msg.author.id] = leaderboard.get(msg.author.id, 0) + 1
+            await voice_state.skip()
             await msg.reply(
-                f":white_check_mark: Correct, {msg.author}! Score: {self.guess_leaderboard[msg.author.id]}"
+                f":white_check_mark: Correct, {msg.author}! Score: {leaderboard[msg.author.id]}"
             )
 
     @commands.command(name="play")
@@ -202,8 +545,9 @@ class Music(commands.Cog):
         play_random: bool = False,
         show_lyrics: bool = True,
         return_to_function: bool = False,
-    ) -> list[Song] | None:
-        if self.voice_state and self.voice_state.guess_mode:
+    ) -> Sequence[Song] | None:
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state and voice_state.guess_mode:
             await ctx.send(
                 "Cannot add songs while Guess Mode is on. "
                 "Restore normal function by running /stop then /play."
@@ -214,8 +558,12 @@ class Music(commands.Cog):
         play_all = number <= 0
         if query and not play_random:
             # if there is a query
-            try:
+            sources = self.find_songs(query)
+            if not self.library_ready.is_set() and (play_all or len(sources) < number):
+                # the song may just not have been indexed yet
+                await self.wait_for_library(ctx)
                 sources = self.find_songs(query)
+            try:
                 if not play_all:
                     sources = [sources[number - 1]]
             except IndexError:
@@ -225,13 +573,17 @@ class Music(commands.Cog):
                 return
         else:
             # if query is empty play a random song
+            if play_all or not self.songs:
+                await self.wait_for_library(ctx)
             if play_all:
-                sources = self.songs.copy()
+                sources = self.songs
             else:
-                sources = [random.choice(self.songs)]
+                sources = [random.choice(self.songs)] if self.songs else []
 
         # if there's only one it doesn't matter if more we want to shuffle them
-        random.shuffle(sources)
+        # the order is worked out as songs are queued, so nothing is copied
+        if len(sources) > 1:
+            sources = Shuffled(sources)
 
         if not sources:
             await ctx.send(
@@ -240,17 +592,16 @@ class Music(commands.Cog):
             return
 
         try:
-            await self.get_voice_state(ctx)
+            voice_state = await self.get_voice_state(ctx)
         except AttributeError:
-            print(traceback.format_exc())
+            log.debug(traceback.format_exc)
             await ctx.send("You are not in a voice channel.")
             return
 
         if return_to_function:
             return sources
 
-        for s in sources:
-            await self.voice_state.add(s, lyrics=show_lyrics)
+        voice_state.add_many(sources, lyrics=show_lyrics)
         if len(sources) > 1:
             await ctx.send(f"Added {len(sources)} songs to the queue.")
         else:
@@ -268,15 +619,18 @@ class Music(commands.Cog):
         sources = await self._play(
             ctx, query, number, play_random, show_lyrics, return_to_function=True
         )
-        for s in sources:
-            await self.voice_state.add(s, True, show_lyrics)
+        if not sources:
+            # nothing matched or the author is not in a voice channel
+            return
+        voice_state = self.voice_states.get(ctx.guild.id)
+        voice_state.add_many(sources, True, show_lyrics)
         if len(sources) > 1:
             await ctx.send(
                 f"Playing **{sources[0].get_name()}**, added {len(sources) - 1} songs to the queue."
             )
         else:
             await ctx.send(f"Playing **{sources[0].get_name()}**.")
-        await self.voice_state.skip()
+        await voice_state.skip()
 
     @commands.command(name="playnext")
     async def play_next(
@@ -290,8 +644,11 @@ class Music(commands.Cog):
         sources = await self._play(
             ctx, query, number, play_random, show_lyrics, return_to_function=True
         )
-        for s in sources:
-            await self.voice_state.add(s, True, show_lyrics)
+        if not sources:
+            # nothing matched or the author is not in a voice channel
+            return
+        voice_state = self.voice_states.get(ctx.guild.id)
+        voice_state.add_many(sources, True, show_lyrics)
         if len(sources) > 1:
             await ctx.send(f"Added {len(sources)} songs to the queue.")
         else:
@@ -299,55 +656,91 @@ class Music(commands.Cog):
 
     @commands.command(name="skip")
     async def skip(self, ctx: BotContext, number: int = 1):
-        await self.voice_state.skip(number)
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state:
+            await voice_state.skip(number)
         await ctx.send("Skipped track.")
 
     @commands.command(name="search")
     async def search(self, ctx: BotContext, query: str, page: int = 1):
         page -= 1
-        sources = self.find_songs(query)
+        sources, fuzzy = self.search_songs(query)
         offset = page * ITEMS_PER_PAGE
         if len(sources) < offset:
             return await ctx.send(f"Page not found for query '{query}'.")
 
-        embed = discord.Embed(title=f"Moosic containing '{query}'", description="")
+        title = f"Moosic like '{query}'" if fuzzy else f"Moosic containing '{query}'"
+        embed = discord.Embed(title=title, description="")
         for i, n in enumerate(sources[offset : offset + ITEMS_PER_PAGE]):
             embed.description += (
-                f"{offset + i + 1}. {n.get_name()}{' [LRC]' if n.lyrics else ''}\n"
+                f"{offset + i + 1}. {n.get_name()}{' [LRC]' if n.has_lyrics else ''}\n"
             )
         embed.description += (
             f"\nPage {page + 1} of {math.ceil(len(sources) / ITEMS_PER_PAGE)}"
         )
+        if not self.library_ready.is_set():
+            done, total = self.index_progress
+            embed.description += f"\nStill indexing, {done} of {total} songs so far."
         await ctx.send(embed=embed)
 
     @commands.command(name="stop")
     async def stop(self, ctx: BotContext):
-        self.voice_state.guess_mode = False
-        await self.voice_state.stop()
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state:
+            voice_state.guess_mode = False
+            await voice_state.stop()
         await ctx.send("Goodbye!")
 
     @commands.command(name="clear")
     async def clear_queue(self, ctx: BotContext):
-        self.voice_state.queue.clear()
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state:
+            voice_state.clear()
         await ctx.send("Cleared the queue!")
 
+    @commands.command(name="move")
+    async def move(self, ctx: BotContext, number: int, to: int = 1):
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state and voice_state.guess_mode:
+            return await ctx.send("Queue disabled in guess mode!")
+        if voice_state is None or not 1 <= number <= len(voice_state.queue):
+            return await ctx.send("There is no song at that position in the queue.")
+        to = max(1, min(to, len(voice_state.queue)))
+        song = voice_state.queue[number - 1][0]
+        voice_state.move(number, to)
+        await ctx.send(f"Moved **{song.get_name()}** to position {to}.")
+
+    @commands.command(name="shuffle")
+    async def shuffle(self, ctx: BotContext):
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state is None or len(voice_state.queue) < 2:
+            return await ctx.send("Nothing in the queue to shuffle.")
+        voice_state.shuffle()
+        await ctx.send(f"Shuffled {len(voice_state.queue)} songs in the queue.")
+
     @commands.command(name="queue")
     async def show_queue(self, ctx: BotContext, page: int = 1):
-        if self.voice_state and self.voice_state.guess_mode:
+        voice_state = self.voice_states.peek(ctx.guild.id)
+        if voice_state and voice_state.guess_mode:
             return await ctx.send("Queue disabled in guess mode!")
 
         page -= 1
-        if len(self.voice_state.queue) < 1:
+        if voice_state is None or len(voice_state.queue) < 1:
             return await ctx.send("Nothing in the queue on this page.")
+        queue = voice_state.queue
         offset = page * ITEMS_PER_PAGE
         embed = discord.Embed(title="Queue", description="")
-        for i, s in enumerate(self.voice_state.queue[offset : offset + ITEMS_PER_PAGE]):
-            embed.description += f"{offset + i + 1}. {s[0].get_name()}{' [LRC]' if s[0].lyrics else ''}\n"
-        embed.description += f"\nPage {page + 1} of {math.ceil(len(self.voice_state.queue) / ITEMS_PER_PAGE)}"
+        for i, s in enumerate(queue[offset : offset + ITEMS_PER_PAGE]):
+            embed.description += f"{offset + i + 1}. {s[0].get_name()}{' [LRC]' if s[0].has_lyrics else ''}\n"
+        embed.description += (
+            f"\nPage {page + 1} of {math.ceil(len(queue) / ITEMS_PER_PAGE)}"
+        )
         await ctx.send(embed=embed)
 
     @commands.command(name="playlists")
     async def show_playlists(self, ctx: BotContext, playlist: str = "", page: int = 1):
+        # playlists are only read once every song has been indexed
+        await self.wait_for_library(ctx)
         if playlist:
             if playlist not in self.playlist_map:
                 return await ctx.send(f"Playlist '{playlist}' not found.")
@@ -358,9 +751,7 @@ class Music(commands.Cog):
             offset = page * ITEMS_PER_PAGE
             embed = discord.Embed(title=f"Playlist '{playlist}'", description="")
             for i, s in enumerate(songs[offset : offset + ITEMS_PER_PAGE]):
-                embed.description += (
-                    f"{offset + i + 1}. {s.get_name()}{' [LRC]' if s.lyrics else ''}\n"
-                )
+                embed.description += f"{offset + i + 1}. {s.get_name()}{' [LRC]' if s.has_lyrics else ''}\n"
             embed.description += (
                 f"\nPage {page + 1} of {math.ceil(len(songs) / ITEMS_PER_PAGE)}"
             )
@@ -372,13 +763,30 @@ class Music(commands.Cog):
             embed.description += f"{name} ({len(songs)} songs)\n"
         await ctx.send(embed=embed)
 
+    @commands.command(name="rescan")
+    async def rescan_library(self, ctx: BotContext):
+        if ctx.author.id not in config.admin_ids:
+            return await ctx.send("You are not an administrator.")
+
+        await ctx.send("Rescanning the library...")
+        if not await self.update_library():
+            return await ctx.send("Rescan failed, see the log for details.")
+        await ctx.send(
+            f"Rescan complete, found {len(self.songs)} songs "
+            f"and {len(self.playlist_map)} playlists."
+        )
+
     @commands.command(name="playlist")
     async def play_playlist(self, ctx: BotContext, name: str):
+        await self.wait_for_library(ctx)
         if name not in self.playlist_map:
             return await ctx.send(f"Playlist '{name}' not found.")
 
-        for song in self.playlist_map[name]:
-            await self.voice_state.add(song)
+        try:
+            voice_state = await self.get_voice_state(ctx)
+        except AttributeError:
+            return await ctx.send("You are not in a voice channel.")
+        voice_state.add_many(self.playlist_map[name])
         await ctx.send(
             f"Added {len(self.playlist_map[name])} songs from '{name}' to the queue."
         )
@@ -0,0 +1,106 @@
+import re
+from array import array
+from collections.abc import Sequence
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from .catalog import SongCatalog
+    from .song import Song
+
+# how alike two lyric lines must be to count as the same line
+SIMILARITY = 0.85
+# consecutive matching lines needed for a repeat to count as a section
+MIN_SECTION_LINES = 2
+
+_NOT_WORD = re.compile(r"[\W_]+")
+
+
+class Segments(NamedTuple):
+    """
+    Candidate start offsets in seconds for each guess-mode start position.
+    """
+
+    random: array
+    chorus: array
+
+
+def _normalize(line: str) -> str:
+    return _NOT_WORD.sub("", line.lower())
+
+
+def _similar(a: str, b: str) -> bool:
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    if min(len(a), len(b)) < SIMILARITY * max(len(a), len(b)):
+        return False
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return matcher.quick_ratio() >= SIMILARITY and matcher.ratio() >= SIMILARITY
+
+
+def find_chorus(lines: Sequence[str]) -> list[int]:
+    """
+    Return the index of every occurrence of the section of lyrics repeated
+    most, weighted by how many different lines it has, or of the most
+    repeated line if no run of MIN_SECTION_LINES lines repeats. Lines match if they are alike after
+    dropping case, punctuation and spacing, so small variations between
+    choruses still line up.
+    """
+    normalized = [_normalize(line) for line in lines]
+    n = len(normalized)
+    # runs[i][j]: how many lines match from i and j onwards, for i < j
+    runs = [[0] * (n + 1) for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        for j in range(n - 1, i, -1):
+            if _similar(normalized[i], normalized[j]):
+                runs[i][j] = runs[i + 1][j + 1] + 1
+
+    best: list[int] = []
+    best_score = 0
+    for i in range(n):
+        # where the section starting at i is sung again
+        repeats = [j for j in range(i + 1, n) if runs[i][j] >= MIN_SECTION_LINES]
+        if not repeats:
+            continue
+        # favour sections sung often with many different lines in them,
+        # over a single ad-lib repeated back to back
+        length = min(runs[i][j] for j in repeats)
+        score = (len(repeats) + 1) * len(set(normalized[i : i + length]))
+        if score > best_score:
+            best, best_score = [i, *repeats], score
+    if best:
+        return best
+
+    counts: dict[str, list[int]] = {}
+    for i, line in enumerate(normalized):
+        if line:
+            counts.setdefault(line, []).append(i)
+    repeated = max(counts.values(), key=len, default=[])
+    return repeated if len(repeated) > 1 else []
+
+
+def analyse_lyrics(lyrics: Sequence[str], timestamps: Sequence[float]) -> Segments:
+    # any line in the first third, or the very beginning
+    random_starts = array("d", [0.0, *timestamps[: len(timestamps) // 3]])
+    chorus_starts = array("d", (timestamps[i] for i in find_chorus(lyrics)))
+    return Segments(random_starts, chorus_starts)
+
+
+class SegmentStore:
+    """
+    Lyric analysis for guess mode, computed the first time a song is played
+    in it and kept in the catalog until the song or its LRC changes.
+    """
+
+    def __init__(self, catalog: "SongCatalog"):
+        self.catalog = catalog
+
+    def get(self, song: "Song") -> Segments:
+        segments = self.catalog.load_segments(song.path)
+        if segments is None:
+            segments = analyse_lyrics(song.lyrics, song.lyric_timestamps)
+            self.catalog.store_segments(song.path, segments)
+            self.catalog.commit()
+        return segments
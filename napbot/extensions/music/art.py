@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+import io
+import time
+from typing import TYPE_CHECKING, Any, NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+import discord
+
+from ...state import config, log, metrics
+
+try:
+    from PIL import Image
+
+    pillow_installed = True
+    dominant_colour_enabled = config.config["music"].getboolean(
+        "DominantColorEmbed", True
+    )
+except ImportError:
+    log.warn("pillow is not installed, disabling dominant colour and thumbnails")
+    pillow_installed = False
+    dominant_colour_enabled = False
+
+if TYPE_CHECKING:
+    from .catalog import SongCatalog
+
+# Discord shows embed thumbnails at 80px, so leave room for high-DPI screens
+THUMBNAIL_SIZE = 160
+# side of the image the dominant colour is picked from, and the palette size
+COLOUR_SAMPLE_SIZE = 32
+COLOUR_PALETTE_SIZE = 8
+
+# Discord signs attachment URLs with an expiry, so stop handing one out
+# this many seconds before it, and trust one without an expiry this long
+URL_EXPIRY_MARGIN = 3600
+URL_DEFAULT_LIFETIME = 24 * 3600
+
+# dominant colour of every cover already analysed in this process, by hash
+_colours: dict[str, int | None] = {}
+
+THUMBNAILS = metrics.counter(
+    "napbot_art_thumbnails_total",
+    "Now playing thumbnails, by whether the cover was uploaded or linked.",
+    ("source",),
+)
+
+
+class ArtEntry(NamedTuple):
+    data: bytes
+    thumbnail: bytes | None
+    colour: int | None
+
+
+def reset_colours(colours: dict[str, int | None]):
+    """
+    Replace the covers this process treats as already analysed, normally
+    with those in the catalog, so songs sharing them skip decoding entirely.
+    """
+    _colours.clear()
+    _colours.update(colours)
+
+
+def analyse_art(data: bytes) -> tuple[bytes | None, int | None]:
+    """
+    Decode a cover once at reduced scale and return a small JPEG thumbnail
+    and its dominant colour, as the most common colour after quantising.
+    """
+    if not pillow_installed:
+        return None, None
+
+    with io.BytesIO(data) as imagedata:
+        image = Image.open(imagedata)
+        # JPEG only: let libjpeg decode at 1/2, 1/4 or 1/8 scale
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = image.convert("RGB")
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+    with io.BytesIO() as out:
+        image.save(out, format="JPEG", quality=85)
+        thumbnail = out.getvalue()
+
+    colour = None
+    if dominant_colour_enabled:
+        sample = image.resize((COLOUR_SAMPLE_SIZE, COLOUR_SAMPLE_SIZE)).quantize(
+            COLOUR_PALETTE_SIZE
+        )
+        _, index = max(sample.getcolors())
+        palette = sample.getpalette() or []
+        r, g, b = palette[index * 3 : index * 3 + 3]
+        colour = (r << 16) | (g << 8) | b
+    return thumbnail, colour
+
+
+def process_art(
+    art_hash: str, data: bytes, sink: dict[str, ArtEntry] | None = None
+) -> int | None:
+    """
+    Return the dominant colour of a cover, analysing each distinct cover
+    only once per process. Newly analysed covers are added to `sink`.
+    """
+    if art_hash in _colours:
+        return _colours[art_hash]
+
+    thumbnail, colour = analyse_art(data)
+    _colours[art_hash] = colour
+    if sink is not None:
+        sink[art_hash] = ArtEntry(data, thumbnail, colour)
+    return colour
+
+
+class ArtStore:
+    """
+    Cover art addressed by content hash. Each distinct image lives once in
+    the catalog and is only read into memory when a track needs it, with
+    recently used images kept in an LRU capped at `budget` bytes.
+    """
+
+    def __init__(self, catalog: "SongCatalog", budget: int):
+        self.catalog = catalog
+        self.budget = budget
+        self.cache: OrderedDict[str, bytes] = OrderedDict()
+        self.size = 0
+
+    def get(self, art_hash: str) -> bytes | None:
+        """
+        Return the cover's thumbnail, or the original if there is none.
+        """
+        data = self.cache.get(art_hash)
+        if data is not None:
+            self.cache.move_to_end(art_hash)
+            return data
+
+        data = self.catalog.load_art(art_hash)
+        if data is not None and len(data) <= self.budget:
+            self.cache[art_hash] = data
+            self.size += len(data)
+            while self.size > self.budget:
+                _, evicted = self.cache.popitem(last=False)
+                self.size -= len(evicted)
+        return data
+
+
+def url_expiry(url: str) -> float | None:
+    """
+    When a Discord CDN URL stops working, from the hex timestamp in its
+    `ex` parameter.
+    """
+    try:
+        return float(int(parse_qs(urlsplit(url).query)["ex"][0], 16))
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class ArtUrlCache:
+    """
+    The CDN URL Discord gave each cover the last time it was uploaded, by
+    hash, so a track whose cover went out recently links to it rather than
+    uploading it again. Holds at most `size` URLs, least recently used
+    first out, and forgets each shortly before it expires.
+    """
+
+    def __init__(self, size: int, clock: Callable[[], float] = time.time):
+        self.size = size
+        self.clock = clock
+        self.urls: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def get(self, art_hash: str) -> str | None:
+        entry = self.urls.get(art_hash)
+        if entry is None:
+            return None
+        url, expires = entry
+        if expires - URL_EXPIRY_MARGIN <= self.clock():
+            del self.urls[art_hash]
+            return None
+        self.urls.move_to_end(art_hash)
+        return url
+
+    def put(self, art_hash: str, url: str):
+        if self.size <= 0:
+            return
+        expires = url_expiry(url) or self.clock() + URL_DEFAULT_LIFETIME
+        self.urls[art_hash] = (url, expires)
+        self.urls.move_to_end(art_hash)
+        while len(self.urls) > self.size:
+            self.urls.popitem(last=False)
+
+    async def send(
+        self,
+        send: Callable[..., Awaitable[discord.Message]],
+        embed: discord.Embed,
+        art_hash: str,
+        load: Callable[[], bytes | None],
+        **kwargs: Any,
+    ) -> discord.Message:
+        """
+        Send `embed` through `send`, normally a channel's, with the cover as
+        its thumbnail: linked if it was uploaded recently, otherwise loaded
+        and attached, keeping the URL Discord puts in the sent embed.
+        """
+        url = self.get(art_hash)
+        if url is not None:
+            embed.set_thumbnail(url=url)
+            THUMBNAILS.inc(source="linked")
+            return await send(embed=embed, **kwargs)
+
+        art = load()
+        if not art:
+            return await send(embed=embed, **kwargs)
+        with io.BytesIO(art) as imagedata:
+            file = discord.File(fp=imagedata, filename="cover.jpg")
+            embed.set_thumbnail(url="attachment://cover.jpg")
+            msg = await send(embed=embed, file=file, **kwargs)
+        THUMBNAILS.inc(source="uploaded")
+        # Discord swaps attachment:// for where the upload ended up
+        thumbnail = msg.embeds[0].thumbnail.url if msg.embeds else None
+        if thumbnail and thumbnail.startswith("https://"):
+            self.put(art_hash, thumbnail)
+        return msg
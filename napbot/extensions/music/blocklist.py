@@ -0,0 +1,278 @@
+import bisect
+import itertools
+import random
+from collections.abc import Iterable, Iterator
+from typing import overload
+
+from .segments import Segment
+
+# entries per block: small enough that inserting into or popping from the
+# front of one is a short memmove, large enough that the block index stays
+# a few hundred entries long at 100k songs
+BLOCK_SIZE = 512
+
+
+class BlockList[T]:
+    """
+    A list split into blocks of at most twice BLOCK_SIZE entries, with the
+    index each block starts at kept for bisecting. Reading or changing an
+    entry anywhere costs a search over the blocks and work inside one block,
+    rather than shifting or walking everything before it the way a list or
+    deque does.
+
+    The start index is rebuilt lazily, so a burst of changes pays for it
+    once, on the next lookup that needs it.
+
+    A block can also be a Segment, whose entries are only made when read.
+    Pages are read from one without keeping anything, while looking up or
+    changing a single entry turns the BLOCK_SIZE entries around it into a
+    real block first, so the entries the player takes from the head stay
+    the same objects from one lookup to the next.
+    """
+
+    def __init__(self, items: Iterable[T] = ()):
+        self.blocks: list[list[T] | Segment[T]] = []
+        self.starts: list[int] = []
+        self.size = 0
+        self.dirty = False
+        self.extend(items)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __iter__(self) -> Iterator[T]:
+        return itertools.chain.from_iterable(self.blocks)
+
+    def __repr__(self) -> str:
+        return f"BlockList({list(self)!r})"
+
+    def _index(self) -> list[int]:
+        if self.dirty:
+            self.starts = [0, *itertools.accumulate(map(len, self.blocks[:-1]))]
+            self.dirty = False
+        return self.starts
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        """
+        The block an index falls in and its offset inside that block.
+        """
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("BlockList index out of range")
+        # the ends are where a queue is read and written, so skip the search
+        if index < len(self.blocks[0]):
+            return 0, index
+        last = self.size - len(self.blocks[-1])
+        if index >= last:
+            return len(self.blocks) - 1, index - last
+        starts = self._index()
+        block = bisect.bisect_right(starts, index) - 1
+        return block, index - starts[block]
+
+    def _materialize(self, block: int, offset: int) -> tuple[int, int]:
+        """
+        Make the entries around offset in a segment a real block, returning
+        where the offset ended up.
+        """
+        entries = self.blocks[block]
+        if isinstance(entries, list):
+            return block, offset
+        start = offset - offset % BLOCK_SIZE
+        stop = start + BLOCK_SIZE
+        pieces = [entries[:start], list(entries[start:stop]), entries[stop:]]
+        self.blocks[block : block + 1] = [piece for piece in pieces if len(piece)]
+        self.dirty = True
+        return block + (1 if start else 0), offset - start
+
+    def _concrete(self, index: int) -> tuple[int, int]:
+        return self._materialize(*self._locate(index))
+
+    def _split(self, block: int):
+        entries = self.blocks[block]
+        if len(entries) > 2 * BLOCK_SIZE:
+            half = len(entries) // 2
+            self.blocks[block : block + 1] = [entries[:half], entries[half:]]
+            self.dirty = True
+
+    def _drop_if_empty(self, block: int):
+        if not self.blocks[block]:
+            del self.blocks[block]
+            self.dirty = True
+
+    @overload
+    def __getitem__(self, item: int) -> T: ...
+    @overload
+    def __getitem__(self, item: slice) -> list[T]: ...
+    def __getitem__(self, item: int | slice) -> T | list[T]:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.window(start, stop)
+        block, offset = self._concrete(item)
+        return self.blocks[block][offset]
+
+    def __setitem__(self, index: int, item: T):
+        block, offset = self._concrete(index)
+        self.blocks[block][offset] = item
+
+    def __delitem__(self, index: int):
+        self.pop(index)
+
+    def window(self, start: int, stop: int) -> list[T]:
+        """
+        Entries from start up to stop, touching only the blocks they are in.
+        """
+        if start >= stop:
+            return []
+        block, offset = self._locate(start)
+        out: list[T] = []
+        wanted = stop - start
+        while len(out) < wanted and block < len(self.blocks):
+            entries = self.blocks[block]
+            out.extend(entries[offset : offset + wanted - len(out)])
+            block += 1
+            offset = 0
+        return out
+
+    def _last_has_room(self) -> bool:
+        return (
+            bool(self.blocks)
+            and isinstance(self.blocks[-1], list)
+            and len(self.blocks[-1]) < BLOCK_SIZE
+        )
+
+    def append(self, item: T):
+        if not self._last_has_room():
+            self.blocks.append([])
+            self.dirty = True
+        self.blocks[-1].append(item)
+        self.size += 1
+
+    def appendleft(self, item: T):
+        self.insert(0, item)
+
+    def _chunks(self, items: Iterable[T]) -> list[list[T] | Segment[T]]:
+        if isinstance(items, Segment):
+            return [items] if len(items) else []
+        items = list(items)
+        return [items[i : i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE)]
+
+    def extend(self, items: Iterable[T]):
+        """
+        Add items at the end. A Segment is added as it is, without reading
+        any of its entries.
+        """
+        if not isinstance(items, Segment):
+            items = list(items)
+            if items and self._last_has_room():
+                # top up the last block before starting new ones
+                room = BLOCK_SIZE - len(self.blocks[-1])
+                self.blocks[-1].extend(items[:room])
+                self.size += len(items[:room])
+                items = items[room:]
+        chunks = self._chunks(items)
+        self.blocks.extend(chunks)
+        self.size += sum(map(len, chunks))
+        self.dirty = True
+
+    def insert(self, index: int, item: T):
+        if index < 0:
+            index = max(0, index + self.size)
+        if index >= self.size:
+            self.append(item)
+            return
+        block, offset = self._concrete(index)
+        self.blocks[block].insert(offset, item)
+        self.size += 1
+        self.dirty = True
+        self._split(block)
+
+    def insert_many(self, index: int, items: Iterable[T]):
+        """
+        Insert items in order before index, as whole blocks where possible.
+        A Segment is inserted as it is, splitting the block it lands in.
+        """
+        chunks = self._chunks(items)
+        if not chunks:
+            return
+        if index < 0:
+            index = max(0, index + self.size)
+        if index >= self.size:
+            block, offset = len(self.blocks), 0
+        else:
+            block, offset = self._locate(index)
+        if offset:
+            # split the block around the insertion point
+            entries = self.blocks[block]
+            self.blocks[block : block + 1] = [
+                entries[:offset],
+                *chunks,
+                entries[offset:],
+            ]
+        else:
+            self.blocks[block:block] = chunks
+        self.size += sum(map(len, chunks))
+        self.dirty = True
+
+    def pop(self, index: int = -1) -> T:
+        block, offset = self._concrete(index)
+        item = self.blocks[block].pop(offset)
+        self.size -= 1
+        self.dirty = True
+        self._drop_if_empty(block)
+        return item
+
+    def popleft(self) -> T:
+        if not self.size:
+            raise IndexError("pop from an empty BlockList")
+        return self.pop(0)
+
+    def drop(self, count: int) -> int:
+        """
+        Remove the first count entries, returning how many there were.
+        """
+        count = max(0, min(count, self.size))
+        left = count
+        whole = 0
+        while whole < len(self.blocks) and len(self.blocks[whole]) <= left:
+            left -= len(self.blocks[whole])
+            whole += 1
+        del self.blocks[:whole]
+        if left:
+            self.blocks[0] = self.blocks[0][left:]
+        self.size -= count
+        self.dirty = True
+        return count
+
+    def move(self, source: int, destination: int):
+        """
+        Take the entry at source out and put it back so that it ends up at
+        destination.
+        """
+        item = self.pop(source)
+        if destination < 0:
+            destination += self.size + 1
+        self.insert(destination, item)
+
+    def shuffle(self, rng: random.Random | None = None):
+        """
+        Shuffle every entry in place and lay them out in full blocks again.
+        Segments are read out in full to do so.
+        """
+        items = list(self)
+        (rng or random).shuffle(items)
+        self.blocks = [
+            items[i : i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE)
+        ]
+        self.dirty = True
+
+    def clear(self):
+        self.blocks.clear()
+        self.starts = []
+        self.size = 0
+        self.dirty = False
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import threading
+from array import array
+from collections.abc import Iterable
+
+from .analysis import Segments
+from .art import ArtEntry
+from .song import SongRecord
+
+# bump whenever the layout of SongRecord or the tables below changes;
+# an old catalog is then dropped and rebuilt from scratch
+SCHEMA_VERSION = 4
+
+# (mp3 mtime_ns, mp3 size, lrc mtime_ns or 0 if there is no LRC)
+Stamp = tuple[int, int, int]
+
+
+def file_stamp(audio_path: str, has_lyrics: bool | None = None) -> Stamp:
+    """
+    `has_lyrics` saves looking for an LRC file when it is already known
+    whether there is one.
+    """
+    stat = os.stat(audio_path)
+    lrc_mtime_ns = 0
+    if has_lyrics is not False:
+        try:
+            lrc_mtime_ns = os.stat(os.path.splitext(audio_path)[0] + ".lrc").st_mtime_ns
+        except OSError:
+            pass
+    return (stat.st_mtime_ns, stat.st_size, lrc_mtime_ns)
+
+
+class SongCatalog:
+    """
+    Persistent cache of parsed songs, keyed by path and invalidated by the
+    mtime and size of the MP3 and its LRC file. Safe to share between the
+    event loop and a rescan running in a worker thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._reset()
+
+    def _reset(self):
+        with self.db:
+            self.db.execute("DROP TABLE IF EXISTS songs")
+            self.db.execute("DROP TABLE IF EXISTS art")
+            self.db.execute("DROP TABLE IF EXISTS segments")
+            self.db.execute("""
+                CREATE TABLE songs (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    lrc_mtime_ns INTEGER NOT NULL,
+                    artist TEXT,
+                    title TEXT,
+                    album TEXT,
+                    track_num INTEGER,
+                    art_hash TEXT,
+                    dominant_colour INTEGER,
+                    has_lyrics INTEGER NOT NULL,
+                    title_slugified TEXT NOT NULL
+                )
+                """)
+            self.db.execute(
+                "CREATE TABLE art (hash TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                "thumbnail BLOB, colour INTEGER)"
+            )
+            self.db.execute(
+                "CREATE TABLE segments (path TEXT PRIMARY KEY, "
+                "random BLOB NOT NULL, chorus BLOB NOT NULL)"
+            )
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def entries(self) -> dict[str, tuple[Stamp, SongRecord]]:
+        """
+        Return every cached song as `path: (stamp, record)`.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT mtime_ns, size, lrc_mtime_ns, path, artist, title, album, "
+                "track_num, art_hash, dominant_colour, has_lyrics, title_slugified "
+                "FROM songs"
+            ).fetchall()
+        return {
+            row[3]: ((row[0], row[1], row[2]), SongRecord(*row[3:])) for row in rows
+        }
+
+    def art_colours(self) -> dict[str, int | None]:
+        with self.lock:
+            return dict(self.db.execute("SELECT hash, colour FROM art"))
+
+    def load_art(self, art_hash: str) -> bytes | None:
+        """
+        Return a cover's thumbnail, or the original if it has none.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT COALESCE(thumbnail, data) FROM art WHERE hash = ?",
+                (art_hash,),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def load_segments(self, path: str) -> Segments | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT random, chorus FROM segments WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Segments(*(array("d", blob) for blob in row))
+
+    def store_segments(self, path: str, segments: Segments):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO segments VALUES (?, ?, ?)",
+                (path, *(starts.tobytes() for starts in segments)),
+            )
+
+    def store(
+        self,
+        record: SongRecord,
+        stamp: Stamp,
+        art: ArtEntry | None = None,
+    ):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO songs "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record.path, *stamp, *record[1:]),
+            )
+            # the lyrics may have changed, so analyse them again when needed
+            self.db.execute("DELETE FROM segments WHERE path = ?", (record.path,))
+            if record.art_hash is not None and art is not None:
+                self.db.execute(
+                    "INSERT OR IGNORE INTO art VALUES (?, ?, ?, ?)",
+                    (record.art_hash, *art),
+                )
+
+    def prune(self, live_paths: Iterable[str]) -> int:
+        """
+        Drop every song not in `live_paths` along with any art no longer
+        referenced. Returns the number of songs removed.
+        """
+        with self.lock:
+            self.db.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS live (path TEXT PRIMARY KEY)"
+            )
+            self.db.execute("DELETE FROM live")
+            self.db.executemany(
+                "INSERT INTO live VALUES (?)", ((p,) for p in live_paths)
+            )
+            removed = self.db.execute(
+                "DELETE FROM songs WHERE path NOT IN (SELECT path FROM live)"
+            ).rowcount
+            self.db.execute("DELETE FROM live")
+            self._prune_orphans()
+        return removed
+
+    def remove(self, paths: Iterable[str]) -> int:
+        """
+        Drop the given songs along with any art no longer referenced.
+        Returns the number of songs removed.
+        """
+        with self.lock:
+            removed = self.db.executemany(
+                "DELETE FROM songs WHERE path = ?", ((p,) for p in paths)
+            ).rowcount
+            self._prune_orphans()
+        return removed
+
+    def _prune_orphans(self):
+        self.db.execute(
+            "DELETE FROM art WHERE hash NOT IN "
+            "(SELECT art_hash FROM songs WHERE art_hash IS NOT NULL)"
+        )
+        self.db.execute(
+            "DELETE FROM segments WHERE path NOT IN (SELECT path FROM songs)"
+        )
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
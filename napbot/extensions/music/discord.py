@@ -1,12 +1,15 @@
-import io
+import functools
 import time
 import asyncio
+from bisect import bisect_left
+from collections.abc import Sequence
 from typing import TYPE_CHECKING
 
+from .outbound import NOW_PLAYING
 from .song import Song
 
 
-from ...state import config, log
+from ...state import config, log, metrics
 from ...utils import BotContext
 import discord
 from discord.ext import commands
@@ -17,6 +20,33 @@ if TYPE_CHECKING:
 DEBUG_GUILDS = config.debug_guilds
 MAX_LINES = 5
 
+LYRIC_EDITS = metrics.counter(
+    "napbot_lyric_edits_total", "Lyric embed edits sent to Discord."
+)
+
+
+def lyric_windows(lyrics: Sequence[str]) -> list[str]:
+    """
+    Render the lyrics field for every line of a song up front, with that
+    line in bold and up to MAX_LINES lines of context either side.
+    """
+    windows: list[str] = []
+    for i in range(len(lyrics)):
+        lines_before = max(0, min(i - MAX_LINES, len(lyrics) - MAX_LINES * 2))
+        lines_after = min(
+            len(lyrics), max(i + MAX_LINES, MAX_LINES * 2 + 1 - lines_before)
+        )
+        windows.append(
+            "\n".join(
+                [
+                    *lyrics[lines_before:i],
+                    f"**{lyrics[i]}**",
+                    *lyrics[i + 1 : lines_after],
+                ]
+            )
+        )
+    return windows
+
 
 class MusicPanel(discord.ui.View):
     def __init__(
@@ -81,13 +111,10 @@ class MusicPanel(discord.ui.View):
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
         for admin in self.users_to_ping:
-            try:
-                channel = await (await self.bot.fetch_user(admin)).create_dm()
-                await channel.send(
-                    f"**{str(interaction.user)}** would like you to update the lyrics for **{self.title}**."
-                )
-            except TypeError:
-                log.error(f"{admin} is not a valid user id.")
+            await self.voice_state.outbound.dm(
+                admin,
+                f"**{str(interaction.user)}** would like you to update the lyrics for **{self.title}**.",
+            )
         button.label = "Lyric fix requested"
         button.style = discord.ButtonStyle.grey
         button.disabled = True
@@ -95,6 +122,17 @@ class MusicPanel(discord.ui.View):
 
 
 class LyricPlayer:
+    """
+    Sends the now playing message and, if asked, highlights each lyric
+    line as the audio reaches it.
+
+    Lines are timed against the voice client's playback clock: discord.py
+    sends one 20 ms Opus frame per loop of its player thread, so the frame
+    count plus the `-ss` offset the song started at is the position in the
+    song. `finished` is set when the track ends or is skipped, which wakes
+    the player straight away instead of at its next lyric.
+    """
+
     def __init__(
         self,
         vc: discord.VoiceClient,
@@ -103,6 +141,8 @@ class LyricPlayer:
         voice_state: "VoiceState",
         bot: commands.Bot,
         show_lyrics: bool,
+        start_time: float = 0.0,
+        finished: asyncio.Event | None = None,
     ):
         self.vc = vc
         self.ctx = ctx
@@ -110,6 +150,35 @@ class LyricPlayer:
         self.voice_state = voice_state
         self.bot = bot
         self.show_lyrics = show_lyrics
+        self.start_time = start_time
+        self.finished = finished or asyncio.Event()
+        self.started_at = time.perf_counter()
+        # seconds the audio was past each line when its edit went through
+        self.drift: list[float] = []
+
+    def position(self) -> float:
+        """
+        How far into the song the audio is, in seconds. Falls back to the
+        time since playback was started if the voice client has no player.
+        """
+        player = getattr(self.vc, "_player", None)
+        if player is not None:
+            return self.start_time + player.loops * player.DELAY
+        return self.start_time + time.perf_counter() - self.started_at
+
+    async def wait_until(self, timestamp: float) -> bool:
+        """
+        Sleep until the audio reaches `timestamp`. Returns False if the
+        track finished first.
+        """
+        while (delay := timestamp - self.position()) > 0:
+            try:
+                await asyncio.wait_for(self.finished.wait(), delay)
+            except asyncio.TimeoutError:
+                # the player can fall behind the wall clock, so check again
+                continue
+            return False
+        return not self.finished.is_set()
 
     async def start(self):
         # grab file
@@ -121,66 +190,90 @@ class LyricPlayer:
         if self.source.album:
             embed.description += f"{self.source.album}\n"
         # embed.description += f"{self.source.path}\n"
+
+        windows: list[str] = []
+        timestamps = self.source.lyric_timestamps
+        # index of the first line that has not been sung yet
+        first = bisect_left(timestamps, self.start_time)
         if self.source.lyrics and self.show_lyrics:
+            windows = lyric_windows(self.source.lyrics)
             embed.add_field(
                 name="Lyrics",
-                value="\n".join(
-                    self.source.lyrics[
-                        : min(MAX_LINES * 2 + 1, len(self.source.lyrics))
-                    ]
+                value=(
+                    windows[first - 1]
+                    if first > 0
+                    else "\n".join(self.source.lyrics[: MAX_LINES * 2 + 1])
                 ),
             )
 
-        if self.source.art:
-            with io.BytesIO(self.source.art) as imagedata:
-                file = discord.File(fp=imagedata, filename="cover.jpg")
-                embed.set_thumbnail(url="attachment://cover.jpg")
-                if self.source.dominant_colour:
-                    embed.color = self.source.dominant_colour
-                msg = await self.ctx.channel.send(
-                    embed=embed,
-                    file=file,
-                    view=MusicPanel(self.bot, self.source.get_name(), self.voice_state),
-                )
+        view = MusicPanel(self.bot, self.source.get_name(), self.voice_state)
+        outbound = self.voice_state.outbound
+        art_store = self.voice_state.art_store
+        art_hash = self.source.art_hash if art_store else None
+        if art_hash:
+            if self.source.dominant_colour:
+                embed.color = self.source.dominant_colour
+            msg = await self.voice_state.art_urls.send(
+                functools.partial(
+                    outbound.call,
+                    NOW_PLAYING,
+                    self.ctx.channel.id,
+                    self.ctx.channel.send,
+                ),
+                embed,
+                art_hash,
+                lambda: art_store.get(art_hash),
+                view=view,
+            )
         else:
-            msg = await self.ctx.channel.send(
+            msg = await outbound.call(
+                NOW_PLAYING,
+                self.ctx.channel.id,
+                self.ctx.channel.send,
                 embed=embed,
-                view=MusicPanel(self.bot, self.source.get_name(), self.voice_state),
+                view=view,
             )
 
-        if self.show_lyrics:
-            start = time.time()
-            for i, t in enumerate(self.source.lyric_timestamps):
-                now = time.time()
-                lines_before = max(
-                    0, min(i - MAX_LINES, len(self.source.lyrics) - MAX_LINES * 2)
-                )
-                lines_after = min(
-                    len(self.source.lyrics),
-                    max(i + MAX_LINES, MAX_LINES * 2 + 1 - lines_before),
-                )
-                embed.set_field_at(
-                    0,
-                    name="Lyrics",
-                    value="\n".join(
-                        self.source.lyrics[lines_before:i]
-                        + [f"**{self.source.lyrics[i]}**"]
-                        + (
-                            self.source.lyrics[i + 1 : lines_after]
-                            if i + 1 < len(self.source.lyrics)
-                            else []
-                        )
-                    ),
-                )
-                while now < t + start:
-                    if not self.voice_state.current:
-                        return  # usually because we skipped
+        if windows:
+            await self.follow(msg, embed, windows, timestamps, first)
 
-                    if (
-                        not self.voice_state.current[0].get_name()
-                        == self.source.get_name()
-                    ):
-                        return
-                    await asyncio.sleep(0.1)
-                    now = time.time()
-                await msg.edit(embed=embed)
+    def edited(self, timestamp: float, sent: "asyncio.Future[bool]"):
+        # False when a later line replaced this one before it went out
+        if not sent.cancelled() and sent.result():
+            LYRIC_EDITS.inc()
+            self.drift.append(self.position() - timestamp)
+
+    async def follow(
+        self,
+        msg: discord.Message,
+        embed: discord.Embed,
+        windows: list[str],
+        timestamps: Sequence[float],
+        first: int = 0,
+    ):
+        """
+        Edit `msg` to highlight each line from `first` on as it is sung.
+        """
+        outbound = self.voice_state.outbound
+        sent: asyncio.Future[bool] | None = None
+        for i in range(first, len(windows)):
+            if not await self.wait_until(timestamps[i]):
+                # the track is over, so a line still waiting can go
+                outbound.discard(msg)
+                break
+            embed.set_field_at(0, name="Lyrics", value=windows[i])
+            # a copy, as the edit may go out after the next line is set
+            sent = outbound.edit(msg, embed=embed.copy())
+            sent.add_done_callback(functools.partial(self.edited, timestamps[i]))
+        else:
+            if sent is not None:
+                await sent
+
+        if self.drift:
+            log.debug(
+                "Lyric drift for %s: mean %.0f ms, max %.0f ms over %d lines.",
+                self.source.get_name(),
+                sum(self.drift) / len(self.drift) * 1000,
+                max(self.drift) * 1000,
+                len(self.drift),
+            )
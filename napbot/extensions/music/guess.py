@@ -0,0 +1,129 @@
+import re
+
+from ...state import config, log
+from .song import Song, title_slugify
+
+try:
+    from pypinyin import lazy_pinyin
+
+    pypinyin_installed = config.config["music"].getboolean("GuessRomanized", True)
+except ImportError:
+    log.warn("pypinyin is not installed, disabling romanized guesses")
+    pypinyin_installed = False
+
+# "Song feat. Someone", "Song ft Someone", "Song featuring Someone"
+_FEATURING = re.compile(r"\s+(?:feat\.?|ft\.?|featuring)\s.*$", re.IGNORECASE)
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+
+
+def bounded_distance(a: str, b: str, limit: int) -> int:
+    """
+    Levenshtein distance between `a` and `b`, or `limit + 1` as soon as it
+    is known to be larger than `limit`. Only a band of width 2 * limit + 1
+    around the diagonal is filled in.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    over = limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        lo = max(1, i - limit)
+        hi = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        best = current[0]
+        for j in range(lo, hi + 1):
+            cost = previous[j - 1] + (ca != b[j - 1])
+            cost = min(cost, previous[j] + 1, current[j - 1] + 1)
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > limit:
+            return over
+        previous = current
+    return min(previous[len(b)], over)
+
+
+class Answer:
+    """
+    One accepted spelling of a title, slugified, with the ASCII letters and
+    digits a message has to contain before it is worth slugifying.
+    """
+
+    __slots__ = ("slug", "probe", "probe_without_and", "tolerance")
+
+    def __init__(self, slug: str):
+        self.slug = slug
+        self.probe = frozenset(c for c in slug if c.isascii() and c.isalnum())
+        # "&" is slugified to "and", so those letters may not appear as-is
+        self.probe_without_and = self.probe - {"a", "n", "d"}
+        # typos forgiven in lenient mode, roughly one per five characters
+        self.tolerance = len(slug) // 5
+
+    def could_match(self, lowered: str, has_ampersand: bool, lenient: bool) -> bool:
+        """
+        Cheap check on the raw message that rules out most chat without
+        running the slugifier over it.
+        """
+        allowed = self.tolerance if lenient else 0
+        # slugifying only removes characters, except "&" growing into "and"
+        if len(lowered) + 2 * lowered.count("&") < len(self.slug) - allowed:
+            return False
+        probe = self.probe_without_and if has_ampersand else self.probe
+        missing = 0
+        for c in probe:
+            if c not in lowered:
+                missing += 1
+                if missing > allowed:
+                    return False
+        return True
+
+    def matches(self, slug: str, lenient: bool) -> bool:
+        if slug == self.slug:
+            return True
+        if not lenient:
+            return False
+        return (
+            self.slug in slug
+            or bounded_distance(slug, self.slug, self.tolerance) <= self.tolerance
+        )
+
+
+class GuessMatcher:
+    """
+    Decides whether a chat message names the song being played in guess
+    mode. Every accepted answer is slugified once when the song starts: its
+    title, its title without any featured artists, and their pinyin if
+    pypinyin is installed. Messages are only slugified if they pass a
+    length and character check against at least one of them.
+    """
+
+    def __init__(self, song: Song):
+        self.song = song
+        titles = {song.title_slugified}
+        if song.title:
+            titles.add(title_slugify(_FEATURING.sub("", song.title)))
+
+        slugs = set(titles)
+        if pypinyin_installed:
+            for title in titles:
+                if _CJK.search(title):
+                    slugs.add("".join(lazy_pinyin(title)).replace(" ", ""))
+        self.answers = [Answer(slug) for slug in slugs if slug]
+
+    def matches(self, content: str, lenient: bool = False) -> bool:
+        lowered = content.lower()
+        has_ampersand = "&" in lowered
+        candidates = [
+            answer
+            for answer in self.answers
+            if answer.could_match(lowered, has_ampersand, lenient)
+        ]
+        if not candidates:
+            return False
+
+        slug = title_slugify(content)
+        return any(answer.matches(slug, lenient) for answer in candidates)
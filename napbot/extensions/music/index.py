@@ -0,0 +1,392 @@
+from array import array
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+import copy
+import functools
+import heapq
+import time
+import unicodedata
+from typing import Self
+
+import regex
+
+from .song import Song, cc
+
+GRAM_LENGTH = 3
+_EMPTY = array("I")
+
+# songs scored in full per fuzzy query, taken from those sharing the most
+# trigrams with it, and the lowest score still worth showing
+FUZZY_CANDIDATES = 200
+FUZZY_MIN_SCORE = 0.3
+# shortest words whose edit distance is worth working out
+TYPO_MIN_LENGTH = 3
+
+_non_word = regex.compile(r"[\W_]+")
+
+
+def _grams(text: str) -> set[str]:
+    return {text[i : i + GRAM_LENGTH] for i in range(len(text) - GRAM_LENGTH + 1)}
+
+
+def _put[T](items: list[T], slot: int, item: T):
+    if slot == len(items):
+        items.append(item)
+    else:
+        items[slot] = item
+
+
+class TrigramIndex:
+    """
+    Posting lists from trigrams to slots, each holding one song. A song
+    keeps its slot for as long as it is in the library, so `updated` can
+    make the index for the next generation by touching only the posting
+    lists of the songs that came or went, leaving this one as it was for
+    whoever is still reading it. Results are put in library order by each
+    slot's rank, or by slot while the slots are still in that order.
+
+    Subclasses keep whatever else they need per slot in `_store` and
+    `_forget`, and say which trigrams a slot is listed under.
+    """
+
+    def __init__(self, songs: list[Song]):
+        self.slots: list[Song | None] = list(songs)
+        self.slot_of = {song.path: i for i, song in enumerate(songs)}
+        # slots emptied by songs that are gone, for new songs to reuse
+        self.free: list[int] = []
+        self.rank: array[int] | None = None
+
+        postings: defaultdict[str, list[int]] = defaultdict(list)
+        for i, song in enumerate(songs):
+            self._store(i, song)
+            for gram in self._slot_grams(i):
+                postings[gram].append(i)
+        self.postings = {gram: array("I", ids) for gram, ids in postings.items()}
+
+    def _store(self, slot: int, song: Song):
+        raise NotImplementedError
+
+    def _forget(self, slot: int):
+        raise NotImplementedError
+
+    def _slot_grams(self, slot: int) -> set[str]:
+        raise NotImplementedError
+
+    def _own(self):
+        """
+        Copy whatever `_store` and `_forget` change, so that an updated
+        index does not change this one.
+        """
+
+    def _songs(self, slots: Iterable[int]) -> list[Song]:
+        return [song for i in slots if (song := self.slots[i]) is not None]
+
+    def _order(self, slot: int) -> int:
+        return slot if self.rank is None else self.rank[slot]
+
+    def updated(
+        self, removed: Iterable[Song], added: Iterable[Song], songs: list[Song]
+    ) -> Self:
+        """
+        Return a copy of this index without `removed` and with `added`,
+        for a library whose songs in order are `songs`.
+        """
+        new = copy.copy(self)
+        new.slots = self.slots.copy()
+        new.slot_of = self.slot_of.copy()
+        new.free = self.free.copy()
+        new._own()
+
+        gone: defaultdict[str, set[int]] = defaultdict(set)
+        for song in removed:
+            slot = new.slot_of.pop(song.path)
+            for gram in new._slot_grams(slot):
+                gone[gram].add(slot)
+            new.slots[slot] = None
+            new._forget(slot)
+            new.free.append(slot)
+
+        extra: defaultdict[str, list[int]] = defaultdict(list)
+        for song in added:
+            slot = new.free.pop() if new.free else len(new.slots)
+            _put(new.slots, slot, song)
+            new.slot_of[song.path] = slot
+            new._store(slot, song)
+            for gram in new._slot_grams(slot):
+                extra[gram].append(slot)
+
+        # posting lists nobody changed are shared with this index
+        new.postings = self.postings.copy()
+        for gram in gone.keys() | extra.keys():
+            ids = new.postings.get(gram, _EMPTY)
+            if gram in gone:
+                ids = array("I", [i for i in ids if i not in gone[gram]])
+            else:
+                ids = array("I", ids)
+            ids.extend(extra.get(gram, ()))
+            if ids:
+                new.postings[gram] = ids
+            else:
+                new.postings.pop(gram, None)
+
+        new.rank = array("I", bytes(4 * len(new.slots)))
+        for position, song in enumerate(songs):
+            new.rank[new.slot_of[song.path]] = position
+        return new
+
+
+class SearchIndex(TrigramIndex):
+    """
+    Trigram index over the lowercase path and name of every song.
+
+    Trigrams only narrow down the candidates; every hit is still checked
+    with a plain substring test, so matches are exactly those of
+    `term in path or term in name`, and come out in library order.
+    """
+
+    def __init__(self, songs: list[Song]):
+        self.paths: list[str] = []
+        self.names: list[str] = []
+        super().__init__(songs)
+
+    def _store(self, slot: int, song: Song):
+        _put(self.paths, slot, song.path_lower)
+        _put(self.names, slot, song.get_name().lower())
+
+    def _forget(self, slot: int):
+        # matches no term, so an empty slot never turns up in a result
+        self.paths[slot] = self.names[slot] = ""
+
+    def _slot_grams(self, slot: int) -> set[str]:
+        return _grams(self.paths[slot]) | _grams(self.names[slot])
+
+    def _own(self):
+        self.paths = self.paths.copy()
+        self.names = self.names.copy()
+
+    def _matches(self, term: str, i: int) -> bool:
+        return term in self.paths[i] or term in self.names[i]
+
+    def _lookup(self, term: str, within: set[int] | None) -> set[int]:
+        """
+        Return the slots of songs matching `term`, limited to `within` if
+        given.
+        """
+        grams = _grams(term)
+        if not grams:
+            # too short to have any trigrams, so check the candidates directly
+            ids = within if within is not None else range(len(self.slots))
+            return {i for i in ids if self._matches(term, i)}
+
+        lists = sorted((self.postings.get(gram, _EMPTY) for gram in grams), key=len)
+        candidates = set(lists[0])
+        if within is not None:
+            candidates &= within
+        for ids in lists[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(ids)
+        return {i for i in candidates if self._matches(term, i)}
+
+    def search(self, terms: list[str], exclusion_terms: list[str]) -> list[Song]:
+        """
+        Return every song matching all of `terms` and none of
+        `exclusion_terms`, in library order.
+        """
+        found: set[int] | None = None
+        # longer terms have more trigrams and usually narrow things down fastest
+        for term in sorted(terms, key=len, reverse=True):
+            found = self._lookup(term, found)
+            if not found:
+                return []
+        if found is None:
+            found = set(self.slot_of.values())
+
+        for term in exclusion_terms:
+            if not found:
+                break
+            found -= self._lookup(term, found)
+
+        return self._songs(sorted(found, key=self._order))
+
+
+def fold(text: str) -> str:
+    """
+    Reduce text to what a fuzzy match should compare: Simplified Chinese,
+    no diacritics, lowercase words separated by single spaces.
+    """
+    text = unicodedata.normalize("NFKD", cc.convert(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _non_word.sub(" ", text.lower()).strip()
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _padded_grams(word: str) -> frozenset[str]:
+    return frozenset(gram for gram in _grams(f"  {word} ") if gram.strip())
+
+
+def word_grams(text: str) -> set[str]:
+    """
+    Trigrams of each word padded at both ends, so short words and the
+    starts of words still count.
+    """
+    return set().union(*map(_padded_grams, text.split()))
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Insertions, deletions, substitutions and swaps of neighbouring
+    characters needed to turn `a` into `b`.
+    """
+    before, row = None, list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            cost = min(row[j] + 1, current[j - 1] + 1, row[j - 1] + (x != y))
+            if before is not None and j > 1 and x == b[j - 2] and a[i - 2] == y:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        before, row = row, current
+    return row[-1]
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    How alike two folded words are, from 0 to 1: the overlap of their
+    trigrams, or for words of about the same length how few edits apart
+    they are if that is closer, since a typo in a short word leaves it
+    with few trigrams in common with the word it was meant to be.
+    """
+    if a == b:
+        return 1.0
+    ours, theirs = _padded_grams(a), _padded_grams(b)
+    score = len(ours & theirs) / len(ours | theirs) if ours or theirs else 0.0
+    if min(len(a), len(b)) >= TYPO_MIN_LENGTH and abs(len(a) - len(b)) <= 2:
+        score = max(score, 1 - edit_distance(a, b) / max(len(a), len(b)))
+    return score
+
+
+class FuzzyQuery:
+    """
+    A folded query and how alike each of its words is to the words of the
+    songs scored against it so far.
+    """
+
+    def __init__(self, query: str):
+        self.words = fold(query).split()
+        self.grams = word_grams(" ".join(self.words))
+        self.seen: dict[str, tuple[float, ...]] = {}
+
+    def likeness(self, word: str) -> tuple[float, ...]:
+        found = self.seen.get(word)
+        if found is None:
+            found = self.seen[word] = tuple(similarity(q, word) for q in self.words)
+        return found
+
+    def closeness(self, words: list[str]) -> float:
+        """
+        How close each query word comes to one of `words`, on average.
+        """
+        rows = [self.likeness(word) for word in words]
+        return sum(max(column) for column in zip(*rows)) / len(self.words)
+
+    def coverage(self, words: list[str]) -> float:
+        """
+        How close each of `words` comes to one of the query's, on average.
+        """
+        return sum(max(self.likeness(word)) for word in words) / len(words)
+
+
+class FuzzyIndex(TrigramIndex):
+    """
+    Trigram index over the folded title, artist, album and slugified title
+    of every song, for when a query matches nothing exactly because of a
+    typo, a missing accent or Traditional against Simplified characters.
+
+    Songs are first counted by how many of the query's trigrams they have,
+    rarest trigrams first, then the best FUZZY_CANDIDATES are scored on how
+    many of the query's trigrams they have and how closely its words match
+    theirs. Both steps stop once the query has used up its time budget,
+    ranking whatever has been counted by then.
+    """
+
+    def __init__(self, songs: list[Song]):
+        self.fields: list[tuple[str, ...]] = []
+        super().__init__(songs)
+
+    def _store(self, slot: int, song: Song):
+        fields = tuple(
+            folded
+            for text in (
+                song.title or song.base_name,
+                song.artist,
+                song.album,
+                song.title_slugified,
+            )
+            if text and (folded := fold(text))
+        )
+        _put(self.fields, slot, fields)
+
+    def _forget(self, slot: int):
+        self.fields[slot] = ()
+
+    def _slot_grams(self, slot: int) -> set[str]:
+        return set().union(*map(word_grams, self.fields[slot]))
+
+    def _own(self):
+        self.fields = self.fields.copy()
+
+    def _score(self, query: FuzzyQuery, i: int) -> float:
+        fields = [field.split() for field in self.fields[i]]
+        words = [word for field in fields for word in field]
+        have = word_grams(" ".join(words))
+        # counting both all fields together and the one field that matches
+        # best, so a title holding the whole query beats a song that has
+        # each word in a different field. The best field is also checked the
+        # other way round, so it loses out for words the query does not have
+        best = max(
+            (query.closeness(field) + query.coverage(field)) / 2 for field in fields
+        )
+        return (
+            len(query.grams & have) / len(query.grams) + query.closeness(words) + best
+        ) / 3
+
+    def _shortlist(self, counts: Counter[int]) -> list[int]:
+        """
+        The FUZZY_CANDIDATES songs sharing the most trigrams with the query,
+        taking those first in the library among songs tied at the cutoff,
+        so which are scored does not depend on how the slots were filled.
+        """
+        top = counts.most_common(FUZZY_CANDIDATES)
+        if len(top) < FUZZY_CANDIDATES:
+            return [i for i, _ in top]
+        cutoff = top[-1][1]
+        above = [i for i, count in top if count > cutoff]
+        tied = [i for i, count in counts.items() if count == cutoff]
+        return above + heapq.nsmallest(len(top) - len(above), tied, key=self._order)
+
+    def search(self, query: str, budget: float = 0.05) -> list[Song]:
+        """
+        Return songs resembling `query`, best first, spending about `budget`
+        seconds on it.
+        """
+        deadline = time.perf_counter() + budget
+        wanted = FuzzyQuery(query)
+        if not wanted.grams:
+            return []
+
+        counts: Counter[int] = Counter()
+        postings = (self.postings.get(gram, _EMPTY) for gram in wanted.grams)
+        for ids in sorted(postings, key=len):
+            counts.update(ids)
+            if time.perf_counter() > deadline:
+                break
+
+        scored: list[tuple[float, int, int]] = []
+        for i in self._shortlist(counts):
+            score = self._score(wanted, i)
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((-score, self._order(i), i))
+            if time.perf_counter() > deadline:
+                break
+        return self._songs(i for _, _, i in sorted(scored))
@@ -0,0 +1,61 @@
+from .catalog import Stamp
+from .index import FuzzyIndex, SearchIndex
+from .song import Song
+from ...state import log
+
+
+class Library:
+    """
+    One generation of the scanned library. A generation is never modified
+    once built: rescans build a new one and swap it in whole, so readers
+    always see songs, search index and playlists that agree with each other.
+    """
+
+    def __init__(
+        self,
+        songs: list[Song],
+        stamps: dict[str, Stamp],
+        playlists: dict[str, list[str]],
+        fuzzy: bool = False,
+        previous: "Library | None" = None,
+    ):
+        """
+        If `previous` is given, its indexes are updated with the songs that
+        differ from it rather than built again.
+        """
+        self.songs = songs
+        self.stamps = stamps
+        self.song_map = {song.path: song for song in songs}
+        # costs a few times what the exact index does, so partial generations
+        # published while the library is first indexed go without
+        self.fuzzy_index: FuzzyIndex | None = None
+        if previous is None or not previous.songs:
+            self.search_index = SearchIndex(songs)
+            if fuzzy:
+                self.fuzzy_index = FuzzyIndex(songs)
+        else:
+            before = previous.song_map
+            removed = [s for s in previous.songs if self.song_map.get(s.path) is not s]
+            added = [s for s in songs if before.get(s.path) is not s]
+            self.search_index = previous.search_index.updated(removed, added, songs)
+            if previous.fuzzy_index is not None:
+                self.fuzzy_index = previous.fuzzy_index.updated(removed, added, songs)
+            elif fuzzy:
+                self.fuzzy_index = FuzzyIndex(songs)
+        # raw paths from the .m3u files, kept so a rescan that touches no
+        # playlist can remap them without rereading every file
+        self.playlists = playlists
+
+        self.playlist_map: dict[str, list[Song]] = {}
+        for name, paths in playlists.items():
+            song_list: list[Song] = []
+            for path in paths:
+                if path in self.song_map:
+                    song_list.append(self.song_map[path])
+                else:
+                    log.warn(
+                        "Playlist '%s' contains song '%s' which does not exist.",
+                        name,
+                        path,
+                    )
+            self.playlist_map[name] = song_list
@@ -0,0 +1,45 @@
+import re
+from array import array
+from operator import itemgetter
+
+# a time tag, any further time tags, then the lyric, e.g. "[00:12.00][01:30.00]chorus"
+_LINE = re.compile(
+    r"^\[(\d+):(\d+)(?:[.:](\d+))?\]((?:\[\d+:\d+(?:[.:]\d+)?\])*)(.*?)\r?$",
+    re.MULTILINE,
+)
+_TIME_TAG = re.compile(r"\[(\d+):(\d+)(?:[.:](\d+))?\]")
+_OFFSET_TAG = re.compile(r"^\[offset:\s*([+-]?\d+)\s*\]", re.IGNORECASE | re.MULTILINE)
+
+
+def _seconds(minutes: str, seconds: str, fraction: str) -> float:
+    # "12.3", "12.34" and "12.345" are all fractions of a second
+    return int(minutes) * 60 + float(f"{seconds}.{fraction}" if fraction else seconds)
+
+
+def parse_lrc(text: str) -> tuple[list[str], array]:
+    """
+    Parse the contents of an LRC file into lyric lines and their start times
+    in seconds, sorted by time.
+
+    A line with several time tags is repeated at each of them, and an
+    `[offset:]` tag (in milliseconds, positive meaning earlier) shifts every
+    timestamp. Lines without a time tag or without any text are dropped.
+    """
+    timed: list[tuple[float, str]] = []
+    for minutes, seconds, fraction, more_tags, lyric in _LINE.findall(text):
+        if not lyric or lyric.isspace():
+            continue
+        timed.append((_seconds(minutes, seconds, fraction), lyric))
+        if more_tags:
+            for tag in _TIME_TAG.findall(more_tags):
+                timed.append((_seconds(*tag), lyric))
+
+    # stable, so lines sharing a timestamp keep their order in the file
+    timed.sort(key=itemgetter(0))
+
+    offset_match = _OFFSET_TAG.search(text)
+    offset = int(offset_match.group(1)) / 1000 if offset_match else 0.0
+    timestamps = array("d", (timestamp for timestamp, _ in timed))
+    if offset:
+        timestamps = array("d", (max(0.0, t - offset) for t in timestamps))
+    return [lyric for _, lyric in timed], timestamps
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+
+from ...state import log, metrics
+
+SUFFIX = ".opus"
+
+LOOKUPS = metrics.counter(
+    "napbot_opus_cache_total",
+    "Opus cache lookups, by whether the song was already transcoded.",
+    ("result",),
+)
+
+
+class OpusCache:
+    """
+    Songs transcoded once to Ogg/Opus under `root`, so they can be played
+    with `-c:a copy` instead of ffmpeg re-encoding the MP3 on every play.
+
+    A miss schedules a transcode in the background, at most `workers` at a
+    time, and the song is played the usual way until it is ready. Files are
+    keyed by path, mtime, size and bitrate, so an edited song is transcoded
+    again, and the least recently played are deleted once the cache grows
+    past `max_bytes`.
+    """
+
+    def __init__(self, root: str, bitrate: int, max_bytes: int, workers: int = 2):
+        self.root = root
+        self.bitrate = bitrate
+        self.max_bytes = max_bytes
+        self.semaphore = asyncio.Semaphore(workers)
+        self.enabled = True
+
+        # key -> file size, least recently played first
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.size = 0
+        self.pending: set[str] = set()
+        self.tasks: set[asyncio.Task[None]] = set()
+
+        os.makedirs(root, exist_ok=True)
+        files: list[tuple[float, str, int]] = []
+        for entry in os.scandir(root):
+            if entry.name.endswith(".part"):
+                # left behind by a transcode that never finished
+                os.remove(entry.path)
+            elif entry.name.endswith(SUFFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[: -len(SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.size += size
+        self.evict()
+        log.info("Opus cache holds %d songs (%d bytes).", len(self.entries), self.size)
+
+    def key(self, path: str) -> str:
+        stat = os.stat(path)
+        ident = f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\0{self.bitrate}"
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def file_path(self, key: str) -> str:
+        return os.path.join(self.root, key + SUFFIX)
+
+    def lookup(self, path: str) -> str | None:
+        """
+        Return the transcoded copy of the song at `path`, or None after
+        queueing it to be transcoded.
+        """
+        if not self.enabled:
+            return None
+        try:
+            key = self.key(path)
+        except OSError:
+            return None
+
+        if key in self.entries:
+            cached = self.file_path(key)
+            self.entries.move_to_end(key)
+            LOOKUPS.inc(result="hit")
+            try:
+                # so the LRU order survives a restart
+                os.utime(cached)
+            except OSError:
+                self.discard(key)
+                return None
+            return cached
+
+        LOOKUPS.inc(result="miss")
+        if key not in self.pending:
+            task = asyncio.get_running_loop().create_task(self.transcode(path, key))
+            self.pending.add(key)
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return None
+
+    async def transcode(self, path: str, key: str):
+        target = self.file_path(key)
+        partial = target + ".part"
+        process = None
+        try:
+            async with self.semaphore:
+                if not self.enabled:
+                    return
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        "ffmpeg",
+                        "-nostdin",
+                        "-loglevel",
+                        "error",
+                        "-y",
+                        "-i",
+                        path,
+                        "-map",
+                        "0:a",
+                        "-map_metadata",
+                        "-1",
+                        "-c:a",
+                        "libopus",
+                        "-b:a",
+                        f"{self.bitrate}k",
+                        "-f",
+                        "ogg",
+                        partial,
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.PIPE,
+                    )
+                except FileNotFoundError:
+                    log.warn("ffmpeg was not found, disabling the Opus cache")
+                    self.enabled = False
+                    return
+                _, stderr = await process.communicate()
+            if process.returncode != 0:
+                log.warn("Could not transcode %s: %s", path, stderr.decode().strip())
+                if os.path.exists(partial):
+                    os.remove(partial)
+                return
+            os.replace(partial, target)
+        except asyncio.CancelledError:
+            if process is not None and process.returncode is None:
+                process.kill()
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            self.pending.discard(key)
+
+        size = os.path.getsize(target)
+        self.entries[key] = size
+        self.size += size
+        self.evict()
+        log.debug("Cached %s as Opus (%d bytes).", path, size)
+
+    def discard(self, key: str):
+        size = self.entries.pop(key, 0)
+        self.size -= size
+        try:
+            os.remove(self.file_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        while self.size > self.max_bytes and self.entries:
+            self.discard(next(iter(self.entries)))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
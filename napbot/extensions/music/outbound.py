@@ -0,0 +1,305 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any, NamedTuple
+
+import discord
+from discord.ext import commands
+
+from ...state import log, metrics
+
+# lower goes first
+NOW_PLAYING = 0
+DIRECT_MESSAGE = 1
+LYRICS = 2
+
+PRIORITY_NAMES = {NOW_PLAYING: "now_playing", DIRECT_MESSAGE: "dm", LYRICS: "lyrics"}
+
+# presence updates go over the gateway, which allows only a few of them in
+# a short window, so this is the most the scheduler sends in one
+PRESENCE_UPDATES = 5
+PRESENCE_WINDOW = 20.0
+
+QUEUE_SECONDS = metrics.histogram(
+    "napbot_outbound_queue_seconds",
+    "Time Discord requests waited in the outbound scheduler before being sent.",
+    ("kind",),
+)
+OUTBOUND = metrics.counter(
+    "napbot_outbound_total",
+    "Discord requests handled by the outbound scheduler, by outcome.",
+    ("kind", "result"),
+)
+PENDING = metrics.gauge(
+    "napbot_outbound_pending", "Discord requests waiting in the outbound scheduler."
+)
+
+
+class Job:
+    def __init__(
+        self,
+        priority: int,
+        route: Any,
+        call: Callable[..., Awaitable[Any]],
+        kwargs: dict[str, Any],
+        key: Any = None,
+    ):
+        self.priority = priority
+        # requests to the same route, normally a channel, go out one by one
+        self.route = route
+        self.call = call
+        self.kwargs = kwargs
+        # edits to the same message share a key and replace each other
+        self.key = key
+        self.queued_at = time.perf_counter()
+        self.future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+
+    @property
+    def kind(self) -> str:
+        return PRIORITY_NAMES.get(self.priority, str(self.priority))
+
+    def settle(self, result: Any = None, error: BaseException | None = None):
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+class Presence(NamedTuple):
+    activity: discord.BaseActivity | None
+    queued_at: float
+
+
+def _presence_key(activity: discord.BaseActivity | None) -> tuple[Any, ...] | None:
+    if activity is None:
+        return None
+    return (type(activity), getattr(activity, "type", None), activity.name)
+
+
+class OutboundScheduler:
+    """
+    Every message, edit, DM and presence update the music players send,
+    shared across guilds so they do not race each other into Discord's rate
+    limits.
+
+    Each route, normally a channel, has a lane of its own that sends one
+    request at a time, highest priority first, so now playing messages go
+    out before lyric edits and a channel waiting out its rate limit holds up
+    nothing but itself. A lane is only started when it has something to
+    send. An edit to a message that already has one waiting replaces it, so
+    a player that falls behind sends the latest lyrics once instead of every
+    line it missed, and a message only ever has one edit in flight.
+    Presence updates are kept within PRESENCE_UPDATES per PRESENCE_WINDOW,
+    sending only the latest, and DM channels are looked up once per user.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.lanes: dict[Any, list[tuple[int, int, Job]]] = {}
+        self.lane_tasks: dict[Any, asyncio.Task[None]] = {}
+        self.pending = 0
+        self.order = itertools.count()
+        # edits not yet started, and messages with an edit being sent
+        self.edits: dict[Any, Job] = {}
+        self.in_flight: set[Any] = set()
+        self.presence_task: asyncio.Task[None] | None = None
+
+        self.presence_wanted: Presence | None = None
+        self.presence_sent: tuple[Any, ...] | None = None
+        self.presence_times: deque[float] = deque(maxlen=PRESENCE_UPDATES)
+        self.presence_changed = asyncio.Event()
+
+        self.dm_channels: dict[int, discord.abc.Messageable] = {}
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def _submit(self, job: Job):
+        lane = self.lanes.setdefault(job.route, [])
+        heapq.heappush(lane, (job.priority, next(self.order), job))
+        self.pending += 1
+        PENDING.set(self.pending)
+        if job.route not in self.lane_tasks:
+            self.lane_tasks[job.route] = asyncio.create_task(self._drain(job.route))
+
+    def call(
+        self,
+        priority: int,
+        route: Any,
+        call: Callable[..., Awaitable[Any]],
+        **kwargs: Any,
+    ) -> asyncio.Future[Any]:
+        """
+        Schedule `call(**kwargs)`, such as a channel's send, on the lane for
+        `route`, such as the channel's id, returning a future for its
+        result.
+        """
+        job = Job(priority, route, call, kwargs)
+        self._submit(job)
+        return job.future
+
+    def edit(
+        self, msg: discord.Message, priority: int = LYRICS, **kwargs: Any
+    ) -> asyncio.Future[bool]:
+        """
+        Schedule `msg.edit(**kwargs)`, replacing an edit to the same message
+        that has not been sent yet. The future is True once this edit went
+        through, and False if it was replaced, dropped or failed.
+        """
+        key = ("edit", msg.id)
+        waiting = self.edits.get(key)
+        if waiting is not None:
+            # the waiting job keeps its place in the queue with the new state
+            waiting.settle(False)
+            OUTBOUND.inc(kind=waiting.kind, result="coalesced")
+            waiting.kwargs = kwargs
+            waiting.future = asyncio.get_running_loop().create_future()
+            return waiting.future
+
+        job = Job(priority, msg.channel.id, msg.edit, kwargs, key)
+        self.edits[key] = job
+        if key not in self.in_flight:
+            self._submit(job)
+        return job.future
+
+    def discard(self, msg: discord.Message):
+        """
+        Drop an edit to `msg` that has not been sent, such as the lyrics of
+        a track that has ended.
+        """
+        job = self.edits.pop(("edit", msg.id), None)
+        if job is not None:
+            job.settle(False)
+            OUTBOUND.inc(kind=job.kind, result="dropped")
+
+    async def dm(self, user_id: int, content: str) -> discord.Message | None:
+        """
+        Send `content` to a user in their DMs, opening the channel only the
+        first time.
+        """
+        channel = self.dm_channels.get(user_id)
+        if channel is None:
+            try:
+                user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+                channel = self.dm_channels[user_id] = await user.create_dm()
+            except (discord.HTTPException, TypeError):
+                log.error("%s is not a valid user id.", user_id)
+                return None
+        try:
+            return await self.call(
+                DIRECT_MESSAGE, channel.id, channel.send, content=content
+            )
+        except discord.HTTPException:
+            # already logged when it failed
+            return None
+
+    def presence(self, activity: discord.BaseActivity | None):
+        """
+        Ask for the bot's presence to become `activity`. Only the latest
+        request is sent once the budget allows, and none if it is what the
+        bot already shows.
+        """
+        if self.presence_task is None:
+            self.presence_task = asyncio.create_task(self._presence_loop())
+        if self.presence_wanted is not None:
+            OUTBOUND.inc(kind="presence", result="coalesced")
+        self.presence_wanted = Presence(activity, time.perf_counter())
+        self.presence_changed.set()
+
+    async def _drain(self, route: Any):
+        """
+        Send what is waiting in the lane for `route`, one request at a time,
+        and end once it is empty.
+        """
+        lane = self.lanes[route]
+        while lane:
+            _, _, job = heapq.heappop(lane)
+            self.pending -= 1
+            PENDING.set(self.pending)
+            await self._send(job)
+        del self.lanes[route]
+        del self.lane_tasks[route]
+
+    async def _send(self, job: Job):
+        if job.key is not None:
+            if self.edits.get(job.key) is not job:
+                # discarded while it waited
+                return
+            del self.edits[job.key]
+            self.in_flight.add(job.key)
+
+        QUEUE_SECONDS.observe(time.perf_counter() - job.queued_at, kind=job.kind)
+        try:
+            result = await job.call(**job.kwargs)
+        except asyncio.CancelledError:
+            job.settle(False if job.key is not None else None)
+            raise
+        except Exception as e:
+            OUTBOUND.inc(kind=job.kind, result="failed")
+            log.warn("Could not send %s to Discord: %s", job.kind, e)
+            if job.key is not None:
+                job.settle(False)
+            else:
+                job.settle(error=e)
+        else:
+            OUTBOUND.inc(kind=job.kind, result="sent")
+            job.settle(True if job.key is not None else result)
+        finally:
+            if job.key is not None:
+                self.in_flight.discard(job.key)
+                # an edit that came in while this one was being sent
+                waiting = self.edits.get(job.key)
+                if waiting is not None:
+                    self._submit(waiting)
+
+    async def _presence_loop(self):
+        while True:
+            await self.presence_changed.wait()
+            if len(self.presence_times) == PRESENCE_UPDATES:
+                wait = self.presence_times[0] + PRESENCE_WINDOW - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            self.presence_changed.clear()
+            wanted, self.presence_wanted = self.presence_wanted, None
+            if wanted is None:
+                continue
+            key = _presence_key(wanted.activity)
+            if key == self.presence_sent:
+                OUTBOUND.inc(kind="presence", result="dropped")
+                continue
+
+            QUEUE_SECONDS.observe(
+                time.perf_counter() - wanted.queued_at, kind="presence"
+            )
+            self.presence_times.append(time.monotonic())
+            try:
+                await self.bot.change_presence(activity=wanted.activity)
+            except Exception as e:
+                OUTBOUND.inc(kind="presence", result="failed")
+                log.warn("Could not update the presence: %s", e)
+            else:
+                self.presence_sent = key
+                OUTBOUND.inc(kind="presence", result="sent")
+
+    async def close(self):
+        tasks = list(self.lane_tasks.values())
+        if self.presence_task is not None:
+            tasks.append(self.presence_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.lane_tasks.clear()
+        self.presence_task = None
+        for lane in self.lanes.values():
+            for _, _, job in lane:
+                job.settle(False if job.key is not None else None)
+        self.lanes.clear()
+        self.pending = 0
+        self.edits.clear()
+        self.in_flight.clear()
+        PENDING.set(0)
@@ -1,4 +1,4 @@
-from pathlib import Path
+import os
 from typing import TYPE_CHECKING
 from ...state import config, log
 
@@ -15,20 +15,24 @@ except ImportError:
         import m3u8
 
 
-def load_playlists() -> dict[str, list[str]]:
+def load_playlists(paths: list[str]) -> dict[str, list[str]]:
+    """
+    Read the .m3u files at `paths`, as found by the library walk, into the
+    song paths they list by playlist name.
+    """
     if not playlists_enabled:
         return {}
 
-    music_path = config.config["music"].get("MusicPath")
-
-    if not music_path:
-        return {}
-
     playlist_map: dict[str, list[str]] = {}
 
-    for f in Path(music_path).rglob("*.m3u"):
-        playlist = m3u8.load(str(f.resolve().absolute()))
-        playlist_name = f.stem
+    for path in paths:
+        try:
+            playlist = m3u8.load(path)
+        except Exception as e:
+            # m3u8 raises all sorts of errors on malformed files
+            log.warn("Could not read playlist '%s', skipping: %s", path, e)
+            continue
+        playlist_name = os.path.splitext(os.path.basename(path))[0]
 
         playlist_map[playlist_name] = [p.get_path_from_uri() for p in playlist.segments]
     return playlist_map
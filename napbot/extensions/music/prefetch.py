@@ -0,0 +1,69 @@
+import asyncio
+from collections import deque
+from typing import Any, NamedTuple
+
+import discord
+
+from ...state import log
+
+# packets read ahead of time, 20 ms each
+PREFETCH_PACKETS = 50
+
+
+class PrefetchedSource(discord.AudioSource):
+    """
+    Wraps an audio source whose process is already running and whose
+    first packets have been read, so the player can start sending audio
+    the moment it is handed over.
+    """
+
+    def __init__(self, source: discord.AudioSource, packets: int = PREFETCH_PACKETS):
+        self.source = source
+        self.buffer: deque[bytes] = deque()
+        try:
+            for _ in range(packets):
+                data = source.read()
+                if not data:
+                    break
+                self.buffer.append(data)
+        except Exception:
+            source.cleanup()
+            raise
+
+    def read(self) -> bytes:
+        if self.buffer:
+            return self.buffer.popleft()
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.buffer.clear()
+        self.source.cleanup()
+
+
+class Prefetch(NamedTuple):
+    # the queue entry this was prepared for, compared by identity
+    item: Any
+    # where in the track it starts, and its source ready to play
+    task: asyncio.Future[tuple[float, PrefetchedSource]]
+
+    def discard(self):
+        """
+        Release the prepared source once it has finished buffering, as the
+        reading thread cannot be interrupted.
+        """
+
+        def cleanup(task: asyncio.Future[tuple[float, PrefetchedSource]]):
+            if task.exception() is None:
+                task.result()[1].cleanup()
+
+        self.task.add_done_callback(cleanup)
+
+    async def prepared(self) -> tuple[float, PrefetchedSource] | None:
+        try:
+            return await self.task
+        except Exception as e:
+            log.warn("Could not prefetch the next track: %s", e)
+            return None
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+
+from .art import ArtEntry, reset_colours
+from .song import Song, SongRecord
+from ...state import log
+
+# the scan runs on a thread alongside the log drain and the library watcher,
+# and forking a process with threads running can deadlock the child, so the
+# workers are started fresh instead
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# (pid, seconds spent, records aligned with the input paths, new art by hash)
+ChunkResult = tuple[int, float, list[SongRecord | None], dict[str, ArtEntry]]
+# (index of the chunk's first path, its records, its new art)
+ChunkCallback = Callable[[int, list[SongRecord | None], dict[str, ArtEntry]], None]
+
+
+def parse_chunk(paths: list[tuple[str, bool | None]]) -> ChunkResult:
+    """
+    Parse a batch of songs into picklable records. Covers are returned
+    once per distinct hash rather than once per song, and only if this
+    process has not analysed them before.
+    """
+    start = time.perf_counter()
+    records: list[SongRecord | None] = []
+    art: dict[str, ArtEntry] = {}
+    for path, has_lyrics in paths:
+        try:
+            song = Song(path, art, has_lyrics)
+        except IOError:
+            # expected if file not found
+            records.append(None)
+            continue
+        records.append(song.to_record())
+    return os.getpid(), time.perf_counter() - start, records, art
+
+
+def parse_songs(
+    paths: list[str],
+    workers: int = 1,
+    chunk_size: int = 64,
+    known_colours: dict[str, int | None] | None = None,
+    has_lyrics: list[bool] | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> tuple[list[SongRecord | None], dict[str, ArtEntry]]:
+    """
+    Parse `paths` either in this process or across a pool of `workers`
+    processes. Records come back in the same order as `paths`, with None
+    for files that could not be read. Covers in `known_colours` are not
+    decoded again and are left out of the returned art. `has_lyrics`, if
+    given, says for each path whether it has an LRC file. `on_chunk` is
+    called with every `chunk_size` records as soon as they are parsed, in
+    order.
+    """
+    known_colours = known_colours or {}
+    if not paths:
+        return [], {}
+    lyrics: list[bool | None] = (
+        list(has_lyrics) if has_lyrics is not None else [None] * len(paths)
+    )
+    jobs = list(zip(paths, lyrics))
+
+    records: list[SongRecord | None] = []
+    art: dict[str, ArtEntry] = {}
+    per_worker: defaultdict[int, list[float]] = defaultdict(lambda: [0, 0.0])
+
+    def collect(results: Iterable[ChunkResult]):
+        for pid, busy, chunk_records, chunk_art in results:
+            if on_chunk is not None:
+                on_chunk(len(records), chunk_records, chunk_art)
+            records.extend(chunk_records)
+            art.update(chunk_art)
+            per_worker[pid][0] += len(chunk_records)
+            per_worker[pid][1] += busy
+
+    start = time.perf_counter()
+    chunks = [jobs[i : i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    if workers <= 1 or len(paths) <= chunk_size:
+        reset_colours(known_colours)
+        collect(map(parse_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(START_METHOD),
+            initializer=reset_colours,
+            initargs=(known_colours,),
+        ) as executor:
+            # map hands results back in order as they finish
+            collect(executor.map(parse_chunk, chunks))
+    elapsed = time.perf_counter() - start
+
+    log.info(
+        "Parsed %d songs in %.2fs (%.1f files/s, %d worker(s)).",
+        len(paths),
+        elapsed,
+        len(paths) / elapsed,
+        len(per_worker),
+    )
+    for pid, (count, busy) in per_worker.items():
+        log.debug(
+            "Scan worker %d: %d files in %.2fs (%.1f files/s).",
+            pid,
+            count,
+            busy,
+            count / busy if busy else 0,
+        )
+    return records, art
@@ -0,0 +1,97 @@
+import random
+from collections.abc import Callable, Iterator, Sequence
+from typing import overload
+
+FEISTEL_ROUNDS = 4
+
+
+class Permutation:
+    """
+    A shuffled order of range(n) worked out one position at a time, with a
+    small Feistel network over the next even power of two and cycle walking
+    back into range. Nothing is stored per position, so shuffling a whole
+    library costs the same as shuffling one album.
+    """
+
+    def __init__(self, n: int, seed: int | None = None):
+        self.n = n
+        bits = max(2, (n - 1).bit_length())
+        bits += bits % 2
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(32) for _ in range(FEISTEL_ROUNDS)]
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _round(self, value: int, key: int) -> int:
+        value = ((value ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+        return (value ^ (value >> 15)) & self.mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half, value & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half) | right
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError("Permutation index out of range")
+        # the network permutes up to four times as many values as there
+        # are positions, so walk until one lands back inside the range
+        value = self._encrypt(index)
+        while value >= self.n:
+            value = self._encrypt(value)
+        return value
+
+
+class Shuffled[T](Sequence[T]):
+    """
+    Items in a random order that is only decided when each is looked at.
+    """
+
+    def __init__(self, items: Sequence[T], seed: int | None = None):
+        self.items = items
+        self.order = Permutation(len(items), seed)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @overload
+    def __getitem__(self, index: int) -> T: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[T]: ...
+    def __getitem__(self, index: int | slice) -> T | list[T]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        return self.items[self.order[index]]
+
+
+class Segment[T]:
+    """
+    A run of queue entries that are made when they are read rather than
+    stored, such as every song of a playlist or of the whole library.
+    Slicing one gives a smaller segment over the same entries.
+    """
+
+    def __init__(self, entry: Callable[[int], T], positions: range):
+        self.entry = entry
+        self.positions = positions
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __iter__(self) -> Iterator[T]:
+        return map(self.entry, self.positions)
+
+    @overload
+    def __getitem__(self, index: int) -> T: ...
+    @overload
+    def __getitem__(self, index: slice) -> "Segment[T]": ...
+    def __getitem__(self, index: int | slice) -> "T | Segment[T]":
+        if isinstance(index, slice):
+            return Segment(self.entry, self.positions[index])
+        return self.entry(self.positions[index])
@@ -1,15 +1,17 @@
-from collections import deque
-import io
-import itertools
+from array import array
+import hashlib
 import asyncio
-import contextlib
+import logging
 import re
 import os
-from typing import overload
+from typing import NamedTuple, overload
 
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator, Sequence
 
-from ...iohandler import Logger
+from .art import ArtEntry, process_art
+from .blocklist import BlockList
+from .segments import Segment
+from .lrc import parse_lrc
 from ...state import log, config
 
 import discord
@@ -17,26 +19,18 @@ from opencc import OpenCC
 import regex
 import string
 
-
 try:
     import eyed3
 
     eyed3_installed = config.config["music"].getboolean("Id3Metadata", True)
+    # it warns about every oddity in a file's frames through logging
+    eyed3.log.setLevel(logging.ERROR)
 
 except ImportError:
     log.warn("eyed3 is not installed, disabling metadata")
     eyed3_installed = False
 
 
-try:
-    from PIL import Image
-
-    pillow_installed = config.config["music"].getboolean("DominantColorEmbed", True)
-except ImportError:
-    log.warn("pillow is not installed, disabling dominant colour detection")
-    pillow_installed = False
-
-
 SLUGIFY_PATTERN = regex.compile(rf"\s|\d|[{re.escape(string.punctuation)}]")
 
 _non_ascii_punct_or_symbol = regex.compile(r"[\p{P}\p{So}]+", flags=re.UNICODE)
@@ -72,86 +66,209 @@ def title_slugify(title: str) -> str:
     return core
 
 
+class SongRecord(NamedTuple):
+    """
+    Everything parsed out of a song's files, in a form that can be
+    stored in the catalog and rebuilt into a `Song` without reparsing.
+    """
+
+    path: str
+    artist: str | None
+    title: str | None
+    album: str | None
+    track_num: int | None
+    art_hash: str | None
+    dominant_colour: int | None
+    has_lyrics: bool
+    title_slugified: str
+
+
+def art_hash(art: bytes) -> str:
+    return hashlib.sha1(art).hexdigest()
+
+
+class LyricLines(Sequence[str]):
+    """
+    Read-only list of lyric lines packed into one string, with an array
+    of offsets marking where each line starts.
+    """
+
+    __slots__ = ("text", "offsets")
+
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.offsets = array("I", [0])
+        if text:
+            start = text.find("\n")
+            while start != -1:
+                self.offsets.append(start + 1)
+                start = text.find("\n", start + 1)
+            # pretend there is a trailing newline so every line ends the same
+            self.offsets.append(len(text) + 1)
+
+    @classmethod
+    def from_lines(cls, lines: list[str]) -> "LyricLines":
+        return cls("\n".join(lines))
+
+    @overload
+    def __getitem__(self, item: int) -> str: ...
+    @overload
+    def __getitem__(self, item: slice) -> list[str]: ...
+    def __getitem__(self, item: int | slice) -> str | list[str]:
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("lyric index out of range")
+        return self.text[self.offsets[item] : self.offsets[item + 1] - 1]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[str]:
+        if self.text:
+            yield from self.text.split("\n")
+
+
 class Song:
-    def __init__(self, audio_path: str, log: Logger):
-        self.base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    __slots__ = (
+        "path",
+        "artist",
+        "title",
+        "album",
+        "track_num",
+        "art_hash",
+        "has_lyrics",
+        "colour_value",
+        "title_slugified",
+        "_lyrics",
+    )
+
+    def __init__(
+        self,
+        audio_path: str,
+        art: dict[str, ArtEntry] | None = None,
+        has_lyrics: bool | None = None,
+    ):
+        """
+        Parse a song's tags from disk. Its cover art is not kept on the song;
+        if `art` is given, newly seen covers are added to it by hash instead.
+        Lyrics are only parsed the first time they are needed, and only
+        looked for if `has_lyrics` is not given.
+        """
         self.path = audio_path
-        self.path_lower = audio_path.lower()
         self.artist: str | None = None
         self.title: str | None = None
         self.album: str | None = None
         self.track_num: int | None = None
-        self.art = None
-        self.lyrics: list[str] = []
-        self.lyric_timestamps: list[float] = []
-        self.dominant_colour: discord.Color | None = None
+        self.art_hash: str | None = None
+        self.colour_value: int | None = None
+        self.has_lyrics = (
+            os.path.isfile(self.lrc_path) if has_lyrics is None else has_lyrics
+        )
+        self._lyrics: tuple[LyricLines, array] | None = None
 
         # get art
         if eyed3_installed:
-            with open(os.devnull, "w") as null:
-                with contextlib.redirect_stderr(null):
-                    with contextlib.redirect_stdout(null):
-                        mp3: eyed3.mp3.Mp3AudioFile = eyed3.load(audio_path)
+            # not silenced with redirect_stdout, which would swallow output
+            # from every other thread while the scan runs in the background
+            mp3: eyed3.mp3.Mp3AudioFile = eyed3.load(audio_path)
             if mp3 is not None and mp3.tag is not None:
                 self.artist = (
                     mp3.tag.artist.replace("\x00", ", ") if mp3.tag.artist else None
                 )
                 self.title = mp3.tag.title
                 self.album = mp3.tag.album
-                self.track_num = mp3.tag.track_num
+                self.track_num = mp3.tag.track_num[0]
                 art_frame: eyed3.id3.frames.ImageFrame = next(
                     (i for i in mp3.tag.images), None
                 )
 
                 if art_frame is not None:
-                    self.art = art_frame.image_data
-                    if pillow_installed:
-                        with io.BytesIO(self.art) as imagedata:
-                            image = (
-                                Image.open(imagedata)
-                                .convert("RGB")
-                                .resize((1, 1), resample=0)
-                            )
-                            self.dominant_colour = discord.Colour.from_rgb(
-                                *image.getpixel((0, 0))
-                            )
-
-        # parse lyrics
-        try:
-            lrc_file = os.path.splitext(audio_path)[0] + ".lrc"
-            with open(lrc_file, "r") as file:
-                data = file.read().split("\n")
-        except IOError:
-            # file not found
-            data = []
-        except UnicodeDecodeError:
-            # invalid LRC
-            log.warn(f"{self.get_name()}'s lyrics are not in UTF-8.")
-            data = []
-
-        for s in data:
-            try:
-                ts_end_index = s.index("]")
-                ts = s[1:ts_end_index]
-                ts_seconds = sum(
-                    x * int(t)
-                    for x, t in zip([0.001, 1, 60], reversed(re.split(r":|\.", ts)))
-                )
-                lyric = s[ts_end_index + 1 :]
-                if not lyric.isspace() and lyric != "":
-                    self.lyrics.append(lyric)
-                    self.lyric_timestamps.append(ts_seconds)
-            except IndexError:
-                # expected if newline or badly formatted LRC
-                pass
-            except ValueError:
-                # current line does not have a timestamp
-                pass
+                    self.art_hash = art_hash(art_frame.image_data)
+                    self.colour_value = process_art(
+                        self.art_hash, art_frame.image_data, art
+                    )
 
         self.title_slugified = (
             title_slugify(self.title) if self.title else self.base_name
         )
 
+    @classmethod
+    def from_record(cls, record: SongRecord) -> "Song":
+        song = cls.__new__(cls)
+        song.path = record.path
+        song.artist = record.artist
+        song.title = record.title
+        song.album = record.album
+        song.track_num = record.track_num
+        song.art_hash = record.art_hash
+        song.colour_value = record.dominant_colour
+        song.has_lyrics = bool(record.has_lyrics)
+        song._lyrics = None
+        song.title_slugified = record.title_slugified
+        return song
+
+    def to_record(self) -> SongRecord:
+        return SongRecord(
+            path=self.path,
+            artist=self.artist,
+            title=self.title,
+            album=self.album,
+            track_num=self.track_num,
+            art_hash=self.art_hash,
+            dominant_colour=self.colour_value,
+            has_lyrics=self.has_lyrics,
+            title_slugified=self.title_slugified,
+        )
+
+    @property
+    def lrc_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".lrc"
+
+    @property
+    def lyrics(self) -> LyricLines:
+        return self.load_lyrics()[0]
+
+    @property
+    def lyric_timestamps(self) -> array:
+        return self.load_lyrics()[1]
+
+    def load_lyrics(self) -> tuple[LyricLines, array]:
+        """
+        Parse the song's LRC file on first use and keep the result.
+        """
+        if self._lyrics is None:
+            lines: list[str] = []
+            timestamps = array("d")
+            if self.has_lyrics:
+                try:
+                    with open(self.lrc_path, "r", encoding="utf-8-sig") as file:
+                        lines, timestamps = parse_lrc(file.read())
+                except IOError:
+                    # removed since the last scan
+                    pass
+                except UnicodeDecodeError:
+                    # invalid LRC
+                    log.warn("%s's lyrics are not in UTF-8.", self.get_name())
+            self._lyrics = (LyricLines.from_lines(lines), timestamps)
+        return self._lyrics
+
+    @property
+    def base_name(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def path_lower(self) -> str:
+        return self.path.lower()
+
+    @property
+    def dominant_colour(self) -> discord.Colour | None:
+        if self.colour_value is None:
+            return None
+        return discord.Colour(self.colour_value)
+
     def get_name(self):
         if not (self.title and self.artist):
             return self.base_name
@@ -164,20 +281,42 @@ class Song:
 
 
 class SongQueue[T](asyncio.Queue[T]):
-    _queue: deque[T]
+    """
+    An asyncio.Queue over a BlockList, so the queue command can read a page
+    and remove, move or skip entries anywhere without walking the rest.
+    Everything that adds entries wakes the player if it is waiting on get().
+    """
+
+    _queue: BlockList[T]
+
+    def _init(self, maxsize: int):
+        self._queue = BlockList()
+
+    def _put(self, item: T):
+        self._queue.append(item)
+
+    def _get(self) -> T:
+        return self._queue.popleft()
+
+    def _qsize(self) -> int:
+        return len(self._queue)
+
+    def _added(self, count: int):
+        # what put_nowait does after _put, once for the whole batch
+        self._unfinished_tasks += count
+        self._finished.clear()
+        for _ in range(min(count, len(self._getters))):
+            self._wakeup_next(self._getters)
 
     @overload
     def __getitem__(self, item: int) -> T: ...
     @overload
     def __getitem__(self, item: slice) -> list[T]: ...
     def __getitem__(self, item: int | slice) -> T | list[T]:
-        if isinstance(item, slice):
-            return list(itertools.islice(self._queue, item.start, item.stop, item.step))
-        else:
-            return self._queue[item]
+        return self._queue[item]
 
     def __iter__(self) -> Iterator[T]:
-        return self._queue.__iter__()
+        return iter(self._queue)
 
     def __len__(self):
         return self.qsize()
@@ -190,3 +329,32 @@ class SongQueue[T](asyncio.Queue[T]):
 
     def putfirst(self, item: T) -> None:
         self._queue.appendleft(item)
+        self._added(1)
+
+    def extend(self, items: Iterable[T], first: bool = False) -> None:
+        """
+        Add items in order at the back, or at the front if first is set,
+        without a put per item. A Segment is queued without reading it.
+        """
+        if not isinstance(items, Segment):
+            items = list(items)
+        if first:
+            self._queue.insert_many(0, items)
+        else:
+            self._queue.extend(items)
+        self._added(len(items))
+
+    def skip(self, count: int) -> int:
+        """
+        Drop the first count entries, returning how many there were.
+        """
+        dropped = self._queue.drop(count)
+        if dropped:
+            self._wakeup_next(self._putters)
+        return dropped
+
+    def move(self, source: int, destination: int) -> None:
+        self._queue.move(source, destination)
+
+    def shuffle(self) -> None:
+        self._queue.shuffle()
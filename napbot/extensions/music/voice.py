@@ -1,16 +1,55 @@
-from collections import Counter
 import random
 import asyncio
-from typing import Literal
+import time
+from collections.abc import Callable, Sequence
+from typing import Any, Literal
 
 import discord
 from discord.ext import commands
 from async_timeout import timeout
 
+from .analysis import SegmentStore, analyse_lyrics
+from .art import ArtStore, ArtUrlCache
+from .opus_cache import OpusCache
+from .outbound import OutboundScheduler
+from .prefetch import Prefetch, PrefetchedSource
+from .segments import Segment
 from .discord import LyricPlayer, MusicPanel
+from .guess import GuessMatcher
+from ...state import log, metrics
 from ...utils import BotContext
 from .song import Song, SongQueue
 
+# seconds the player waits on an empty queue before leaving the channel
+IDLE_TIMEOUT = 180
+# kbit/s of the Opus stream sent to Discord
+BITRATE = 96
+
+QUEUE_DEPTH = metrics.gauge(
+    "napbot_queue_depth", "Songs waiting in each guild's queue.", ("guild",)
+)
+PLAY_START = metrics.histogram(
+    "napbot_play_start_seconds",
+    "From a song being queued with nothing playing to it starting to play.",
+)
+FFMPEG_SPAWN = metrics.histogram(
+    "napbot_ffmpeg_spawn_seconds",
+    "Time taken to start ffmpeg for a track.",
+    ("source",),
+)
+TRACK_GAP = metrics.histogram(
+    "napbot_track_gap_seconds",
+    "From one track ending to the next queued one starting.",
+)
+
+
+def format_timestamp(seconds: float) -> str:
+    ms = int((seconds % 1) * 1000)
+    return (
+        f"{int(seconds // 3600):02}:{int((seconds // 60) % 60):02}:"
+        f"{int(seconds % 60):02}.{ms:03}"
+    )
+
 
 class VoiceState:
     def __init__(
@@ -18,13 +57,38 @@ class VoiceState:
         bot: commands.Bot,
         guess_mode: bool = False,
         guess_vote_skip_percent: float = 0.0,
+        art_store: ArtStore | None = None,
+        art_urls: ArtUrlCache | None = None,
+        outbound: OutboundScheduler | None = None,
+        opus_cache: OpusCache | None = None,
+        segment_store: SegmentStore | None = None,
+        idle_timeout: float = IDLE_TIMEOUT,
+        on_idle: Callable[[], Any] | None = None,
+        prefetch: bool = True,
+        guild_id: int | None = None,
     ):
         self.bot = bot
+        self.guild_id = guild_id
+        self.art_store = art_store
+        # none given means every cover is uploaded with its track
+        self.art_urls = art_urls if art_urls is not None else ArtUrlCache(0)
+        # shared by every guild when the cog makes the players
+        self.outbound = outbound if outbound is not None else OutboundScheduler(bot)
+        self.opus_cache = opus_cache
+        self.segment_store = segment_store
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        self.prefetch_enabled = prefetch
+        # the source being prepared for the head of the queue, if any
+        self.prefetched: Prefetch | None = None
         self.queue = SongQueue[tuple[Song, bool]]()
         self.current = None
         self.loop = asyncio.get_event_loop()
         self.next = asyncio.Event()
-        self.player = bot.loop.create_task(self.audio_player())
+        # set when the current track ends, is skipped or playback stops
+        self.track_finished = asyncio.Event()
+        # started on connect, so guilds that never play cost no task
+        self.player: asyncio.Task[None] | None = None
         self.vc: discord.VoiceClient | None = None
         self.audio_running = False
 
@@ -32,9 +96,18 @@ class VoiceState:
         self.guess_show_artist = False
         self.guess_vote_skip_percent = guess_vote_skip_percent
         self.start_pos: Literal["RANDOM", "CHORUS", "BEGINNING"] = "BEGINNING"
+        self.guess_leaderboard = dict[int, int]()
+        # answers for the song being guessed, prepared when it starts
+        self.guess_matcher: GuessMatcher | None = None
+
+        # perf_counter when playback was asked for with nothing playing
+        self.requested_at: float | None = None
+        # perf_counter when the last track ended with more queued after it
+        self.finished_at: float | None = None
 
     def __del__(self):
-        self.player.cancel()
+        if self.player is not None:
+            self.player.cancel()
 
     def __bool__(self):
         return bool(self.vc)
@@ -43,94 +116,203 @@ class VoiceState:
         if not self.vc:
             return
 
-        num -= 1
-        for _ in range(num):
-            await self.queue.get()
+        if self.queue.skip(num - 1):
+            self.queue_changed()
         if self.current:
             self.vc.stop()
+            self.track_finished.set()
 
     async def add(self, song: Song, right_away: bool = False, lyrics: bool = True):
         if not right_away:
             await self.queue.put((song, lyrics))
         else:
             self.queue.putfirst((song, lyrics))
+        if self.current is None and self.requested_at is None:
+            self.requested_at = time.perf_counter()
+        self.queue_changed()
+
+    def add_many(
+        self, songs: Sequence[Song], right_away: bool = False, lyrics: bool = True
+    ):
+        """
+        Queue songs in order, ahead of everything else if right_away is set.
+        Their entries are only made as they are read, so queueing a whole
+        library or playlist keeps nothing per song.
+        """
+        if not songs:
+            return
+        entries = Segment(lambda i: (songs[i], lyrics), range(len(songs)))
+        self.queue.extend(entries, first=right_away)
+        if self.current is None and self.requested_at is None:
+            self.requested_at = time.perf_counter()
+        self.queue_changed()
 
     def remove(self, num: int):
         self.queue.remove(num - 1)
+        self.queue_changed()
+
+    def move(self, num: int, to: int):
+        self.queue.move(num - 1, to - 1)
+        self.queue_changed()
+
+    def shuffle(self):
+        self.queue.shuffle()
+        self.queue_changed()
+
+    def clear(self):
+        self.queue.clear()
+        self.queue_changed()
+
+    def queue_changed(self):
+        if self.guild_id is not None:
+            QUEUE_DEPTH.set(len(self.queue), guild=self.guild_id)
+        self.prefetch()
+
+    def prefetch(self):
+        """
+        Start preparing the source for the head of the queue while the
+        current track plays, throwing away one prepared for a track that is
+        no longer next. Called whenever the queue changes.
+        """
+        head = self.queue[0] if len(self.queue) else None
+        if self.prefetched is not None:
+            if self.prefetched.item is head:
+                return
+            self.prefetched.discard()
+            self.prefetched = None
+        if head is None or not self.prefetch_enabled or not self.current:
+            return
+
+        # picking the start can mean analysing the lyrics, and reading the
+        # first packets blocks until ffmpeg has produced them, but the Opus
+        # cache is only touched from the event loop
+        song = head[0]
+        task = self.loop.run_in_executor(
+            None, self.prepare, song, self.cached_path(song)
+        )
+        self.prefetched = Prefetch(head, task)
+
+    def prepare(self, song: Song, cached: str | None) -> tuple[float, PrefetchedSource]:
+        start_time = self.start_position(song)
+        source = self.make_source(song, format_timestamp(start_time), cached)
+        return start_time, PrefetchedSource(source)
+
+    def start_position(self, song: Song) -> float:
+        """
+        Where to start `song`. In guess mode this may look up or analyse its
+        lyrics, so it is best kept off the event loop.
+        """
+        if not self.guess_mode or self.start_pos == "BEGINNING":
+            return 0
+        # falls back to the beginning if the song has no synced lyrics
+        segments = (
+            self.segment_store.get(song)
+            if self.segment_store
+            else analyse_lyrics(song.lyrics, song.lyric_timestamps)
+        )
+        starts = segments.random if self.start_pos == "RANDOM" else segments.chorus
+        return random.choice(starts) if starts else 0
 
     async def connect(self, ctx: BotContext):
         channel = ctx.author.voice.channel
         self.vc = ctx.guild.voice_client
+        self.ctx = ctx
         if not self.audio_running:
+            self.audio_running = True
             self.player = self.bot.loop.create_task(self.audio_player())
         if self.vc:
             if self.vc.channel.id == channel.id:
                 return
-            self.vc = await self.vc.move_to(channel)
+            await self.vc.move_to(channel)
         else:
             self.vc = await channel.connect()
-        self.ctx = ctx
+
+    def cached_path(self, song: Song) -> str | None:
+        return self.opus_cache.lookup(song.path) if self.opus_cache else None
+
+    def make_source(
+        self, song: Song, start_ts: str, cached: str | None
+    ) -> discord.AudioSource:
+        if cached is not None:
+            # already Opus at the right bitrate, so ffmpeg only remuxes it
+            with FFMPEG_SPAWN.time(source="opus_cache"):
+                return discord.FFmpegOpusAudio(
+                    source=cached, codec="copy", before_options=f"-ss {start_ts}"
+                )
+        with FFMPEG_SPAWN.time(source="mp3"):
+            return discord.FFmpegOpusAudio(
+                source=song.path, bitrate=BITRATE, before_options=f"-ss {start_ts}"
+            )
 
     async def audio_player(self):
         self.audio_running = True
         while True:
             try:
-                async with timeout(180):
+                async with timeout(self.idle_timeout):
                     self.current = await self.queue.get()
+                if self.guild_id is not None:
+                    QUEUE_DEPTH.set(len(self.queue), guild=self.guild_id)
             except asyncio.TimeoutError:
-                self.bot.loop.create_task(self.stop())
                 self.audio_running = False
+                await self.stop()
+                if self.on_idle is not None:
+                    self.on_idle()
                 return
 
             song, show_lyrics = self.current
-            start_time = 0
-            if self.guess_mode:
-                if self.start_pos == "RANDOM":
-                    # pick a random lyric if any, otherwise fall back to beginning
-                    first_third_timestamps = [
-                        0,
-                        *song.lyric_timestamps[: len(song.lyric_timestamps) // 3],
-                    ]
-                    start_time = random.choice(first_third_timestamps)
-                elif self.start_pos == "CHORUS":
-                    # attempt to find the chorus by finding the first most common
-                    # lyric and its timestamp
-                    # if no lyric timestamps, fall back to beginning
-                    if song.lyric_timestamps:
-                        most_common_lyric = Counter(song.lyrics).most_common(1)[0][0]
-                        common_lyric_index = song.lyrics.index(most_common_lyric)
-                        most_common_lyric_timestamp = song.lyric_timestamps[
-                            common_lyric_index
-                        ]
-                        start_time = most_common_lyric_timestamp
-                    else:
-                        start_time = 0
-
-            start_time_ms = int(
-                (start_time % 1) * 1000
-            )  # Convert fractional seconds to milliseconds
-            start_time_s = int(start_time % 60)
-            start_time_m = int((start_time // 60) % 60)
-            start_time_h = int(start_time // 3600)
-            start_ts = f"{start_time_h:02}:{start_time_m:02}:{start_time_s:02}.{start_time_ms:03}"
+            self.guess_matcher = GuessMatcher(song) if self.guess_mode else None
+            prefetched, self.prefetched = self.prefetched, None
             if not self.vc:
+                if prefetched is not None:
+                    prefetched.discard()
                 continue
 
-            self.vc.play(
-                discord.FFmpegOpusAudio(
-                    source=song.path, bitrate=96, before_options=f"-ss {start_ts}"
-                )
-            )
+            source: discord.AudioSource
+            prepared = None
+            if prefetched is not None and prefetched.item is self.current:
+                prepared = await prefetched.prepared()
+            elif prefetched is not None:
+                prefetched.discard()
+            if prepared is not None:
+                start_time, source = prepared
+            else:
+                cached = self.cached_path(song)
+                start_time = await asyncio.to_thread(self.start_position, song)
+                source = self.make_source(song, format_timestamp(start_time), cached)
+
+            finished = self.track_finished = asyncio.Event()
+
+            def after(error: Exception | None):
+                # runs on the audio thread once the track ends or is stopped
+                if error:
+                    log.error("Playback of %s failed: %s", song.path, error)
+                self.bot.loop.call_soon_threadsafe(finished.set)
+
+            self.vc.play(source, after=after)
+            started = time.perf_counter()
+            if self.finished_at is not None:
+                TRACK_GAP.observe(started - self.finished_at)
+            elif self.requested_at is not None:
+                PLAY_START.observe(started - self.requested_at)
+            self.finished_at = self.requested_at = None
+            self.prefetch()
             if not self.guess_mode:
                 lyric_client = LyricPlayer(
-                    self.vc, self.ctx, song, self, self.bot, show_lyrics
+                    self.vc,
+                    self.ctx,
+                    song,
+                    self,
+                    self.bot,
+                    show_lyrics,
+                    start_time=start_time,
+                    finished=self.track_finished,
                 )
 
                 self.loop.create_task(lyric_client.start())
 
             if not self.guess_mode:
-                await self.bot.change_presence(
-                    activity=discord.Activity(
+                self.outbound.presence(
+                    discord.Activity(
                         type=discord.ActivityType.listening,
                         name=song.get_name(),
                     )
@@ -159,20 +341,88 @@ class VoiceState:
                     )
 
             # launch monitor for guesses here
-            while self.vc and self.vc.is_playing() and self.vc.is_connected():
-                await asyncio.sleep(1)
-            await self.bot.change_presence(activity=None)
+            await finished.wait()
+            if not self.queue.empty():
+                self.finished_at = time.perf_counter()
+            # nothing here may hold up the next track, so announcements go
+            # out in the background and the presence is left for the next
+            # track to replace unless the queue has run dry
+            if self.queue.empty():
+                self.outbound.presence(None)
             if self.guess_mode:
-                await self.ctx.send(
-                    f"That was **{song.get_name()}** ({song.title_slugified})!"
+                self.bot.loop.create_task(
+                    self.ctx.send(
+                        f"That was **{song.get_name()}** ({song.title_slugified})!"
+                    )
                 )
             self.current = None
+            self.guess_matcher = None
 
     async def stop(self):
-        self.queue.clear()
+        self.clear()
+        self.finished_at = self.requested_at = None
         self.guess_mode = False
-        await self.bot.change_presence(activity=None)
+        self.outbound.presence(None)
+        self.track_finished.set()
         if self.vc:
             self.vc.stop()
             await self.vc.disconnect()
             self.vc = None
+
+
+class VoiceStateManager:
+    """
+    One VoiceState per guild, created the first time a guild needs one and
+    dropped again once its player has been idle for `idle_timeout`.
+    """
+
+    state_class = VoiceState
+
+    def __init__(self, bot: commands.Bot, **options: Any):
+        self.bot = bot
+        # passed on to every VoiceState
+        self.options = options
+        # one scheduler for every guild, unless the cog passed its own
+        self.options.setdefault("outbound", OutboundScheduler(bot))
+        self.states: dict[int, VoiceState] = {}
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def get(self, guild_id: int) -> VoiceState:
+        state = self.states.get(guild_id)
+        if state is None:
+            state = self.state_class(
+                self.bot,
+                on_idle=lambda: self.evict(guild_id, state),
+                guild_id=guild_id,
+                **self.options,
+            )
+            self.states[guild_id] = state
+        return state
+
+    def peek(self, guild_id: int | None) -> VoiceState | None:
+        """
+        Return the guild's VoiceState without creating one.
+        """
+        return self.states.get(guild_id) if guild_id is not None else None
+
+    def evict(self, guild_id: int, state: VoiceState | None = None):
+        """
+        Forget a guild's VoiceState, unless it has been replaced or has
+        started playing again since `state` went idle.
+        """
+        current = self.states.get(guild_id)
+        if current is None or (state is not None and current is not state):
+            return
+        if state is not None and current.audio_running:
+            return
+        del self.states[guild_id]
+        QUEUE_DEPTH.remove(guild=guild_id)
+        if current.player is not None and current.player is not asyncio.current_task():
+            current.player.cancel()
+
+    async def close(self):
+        for guild_id, state in list(self.states.items()):
+            await state.stop()
+            self.evict(guild_id)
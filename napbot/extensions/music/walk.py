@@ -0,0 +1,90 @@
+import os
+from collections.abc import Sequence
+from typing import NamedTuple
+
+
+class LibraryFiles(NamedTuple):
+    """
+    Everything one walk of the music directory found, as resolved paths.
+    """
+
+    songs: list[str]
+    # extensionless paths of every LRC file, to pair with songs
+    lyrics: set[str]
+    playlists: list[str]
+    ignored_dirs: int
+
+    def has_lyrics(self, audio_path: str) -> bool:
+        return os.path.splitext(audio_path)[0] in self.lyrics
+
+
+def walk_library(root: str, ignored_paths: Sequence[str] = ()) -> LibraryFiles:
+    """
+    List the songs, lyrics and playlists under `root` in a single pass.
+    A directory whose resolved path contains any of `ignored_paths` is
+    skipped without being listed. Symlinked directories are not followed,
+    but symlinked files are resolved to their targets.
+    """
+    songs: list[str] = []
+    lyrics: set[str] = set()
+    playlists: list[str] = []
+    ignored_dirs = 0
+
+    # directories are resolved once, so their entries can be joined onto them
+    root = os.path.realpath(root)
+    if any(query in root for query in ignored_paths):
+        return LibraryFiles(songs, lyrics, playlists, 1)
+
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        subdirs: list[str] = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    name = entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            path = os.path.join(directory, name)
+                            if any(query in path for query in ignored_paths):
+                                ignored_dirs += 1
+                            else:
+                                subdirs.append(path)
+                            continue
+                    except OSError:
+                        continue
+
+                    if name.endswith(".mp3"):
+                        target = songs
+                    elif name.endswith(".lrc"):
+                        lyrics.add(os.path.join(directory, name[:-4]))
+                        continue
+                    elif name.endswith(".m3u"):
+                        target = playlists
+                    else:
+                        continue
+                    path = os.path.join(directory, name)
+                    if entry.is_symlink():
+                        path = os.path.realpath(path)
+                        # its LRC sits next to the target, which may not be walked
+                        stem = os.path.splitext(path)[0]
+                        if os.path.isfile(stem + ".lrc"):
+                            lyrics.add(stem)
+                    target.append(path)
+        except OSError:
+            # removed or unreadable since its parent was listed
+            continue
+        # depth first, in name order
+        stack.extend(reversed(subdirs))
+
+    return LibraryFiles(songs, lyrics, playlists, ignored_dirs)
+
+
+def walk_key(root: str, path: str) -> tuple[tuple[bool, str], ...]:
+    """
+    Sort key putting `path` where walk_library lists it under the resolved
+    `root`: a directory's files in name order, then its subdirectories in
+    name order.
+    """
+    *directories, name = os.path.relpath(path, root).split(os.sep)
+    return (*((True, part) for part in directories), (False, name))
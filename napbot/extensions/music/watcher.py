@@ -0,0 +1,117 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from ...state import config, log
+
+try:
+    from watchdog.observers import Observer
+
+    watchdog_installed = config.config["music"].getboolean("WatchLibrary", True)
+except ImportError:
+    log.warn("watchdog is not installed, polling for library changes instead")
+    watchdog_installed = False
+
+WATCHED_SUFFIXES = (".mp3", ".lrc", ".m3u")
+IGNORED_EVENTS = ("opened", "closed_no_write")
+
+# called with the changed paths, or None if everything should be rescanned
+RescanCallback = Callable[[set[str] | None], Awaitable[Any]]
+
+
+class _EventHandler:
+    """
+    Forwards watchdog events from its observer thread to the event loop.
+    """
+
+    def __init__(self, watcher: "LibraryWatcher"):
+        self.watcher = watcher
+
+    def dispatch(self, event: Any):
+        if event.event_type in IGNORED_EVENTS:
+            return
+
+        changed: set[str] | None
+        if event.is_directory:
+            if event.event_type == "modified":
+                return
+            # a directory moving in or out can carry any number of songs
+            changed = None
+        else:
+            paths = {event.src_path, getattr(event, "dest_path", "")}
+            changed = {str(p) for p in paths if str(p).endswith(WATCHED_SUFFIXES)}
+            if not changed:
+                return
+        self.watcher.loop.call_soon_threadsafe(self.watcher.notify, changed)
+
+
+class LibraryWatcher:
+    """
+    Watch the music directory and pass batches of changed paths to
+    `on_change`. Uses inotify through watchdog when it is installed,
+    otherwise rescans the whole library every `poll_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        root_path: str,
+        on_change: RescanCallback,
+        poll_interval: float,
+        debounce: float = 2.0,
+    ):
+        self.root_path = root_path
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+
+        self.pending: set[str] | None = set()
+        self.timer: asyncio.TimerHandle | None = None
+        self.observer: Any = None
+        self.poll_task: asyncio.Task[None] | None = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        if watchdog_installed:
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self), self.root_path, recursive=True)
+            self.observer.daemon = True
+            self.observer.start()
+            log.info("Watching %s for changes.", self.root_path)
+        elif self.poll_interval > 0:
+            self.poll_task = self.loop.create_task(self.poll())
+            log.info("Rescanning %s every %gs.", self.root_path, self.poll_interval)
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def notify(self, changed: set[str] | None):
+        """
+        Queue changed paths, waiting for `debounce` seconds of quiet so
+        copying in an album triggers one rescan rather than one per file.
+        """
+        if changed is None or self.pending is None:
+            self.pending = None
+        else:
+            self.pending |= changed
+
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.loop.call_later(self.debounce, self.flush)
+
+    def flush(self):
+        self.timer = None
+        changed, self.pending = self.pending, set()
+        self.loop.create_task(self.on_change(changed))
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.on_change(None)
@@ -1,39 +1,164 @@
+import atexit
 import configparser
+import json
 import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
 from typing import Any
 
 
 class Logger:
+    """
+    Logs from a queue drained by a background thread, so writing to a slow
+    stdout never holds up the event loop. Messages below the log level are
+    dropped before they are formatted: pass %-style arguments, or a
+    callable returning the message, instead of building an f-string.
+
+    Warnings and errors logged more than REPEAT_LIMIT times within
+    REPEAT_WINDOW seconds are held back and summarised once the window is
+    over, keyed by the message before its arguments are filled in.
+    """
+
     LOG_STRINGS = ["DEBUG", " INFO", " WARN", "ERROR"]
     DEBUG_LEVEL = 0
     INFO_LEVEL = 1
     WARN_LEVEL = 2
     ERROR_LEVEL = 3
 
-    def __init__(self, log_level: int = 0):
+    REPEAT_WINDOW = 10.0
+    REPEAT_LIMIT = 5
+
+    def __init__(self, log_level: int = 0, json_lines: bool = False):
         self.log_level = log_level
+        self.json_lines = json_lines
+        self._start()
+        # the drain thread does not survive a fork, e.g. into a scan worker
+        os.register_at_fork(after_in_child=self._start)
+        atexit.register(self.flush)
+
+    def _start(self):
+        # (time, level, key, text); None asks for held back summaries
+        self.queue: queue.Queue[tuple[float, int, str, str] | None] = queue.Queue()
+        # key -> [window start, times logged, times held back, level, last text]
+        self.repeats: dict[str, list[Any]] = {}
+        self.thread = threading.Thread(target=self._drain, name="log", daemon=True)
+        self.thread.start()
+
+    def _log(self, msg: Any, log_level: int, args: tuple[Any, ...] = ()):
+        if log_level < self.log_level:
+            return
+        if callable(msg):
+            msg = msg()
+        key = str(msg)
+        text = key
+        if args:
+            try:
+                text = key % args
+            except (TypeError, ValueError):
+                text = f"{key} {args!r}"
+        self.queue.put((time.time(), log_level, key, text))
 
-    def _log(self, msg: Any, log_level: int):
-        if log_level >= self.log_level:
-            print(f"{Logger.LOG_STRINGS[log_level]}: {msg}")
+    def _drain(self):
+        while True:
+            deadline = min(
+                (entry[0] + self.REPEAT_WINDOW for entry in self.repeats.values()),
+                default=None,
+            )
+            try:
+                item = self.queue.get(
+                    timeout=None if deadline is None else max(0, deadline - time.time())
+                )
+            except queue.Empty:
+                self._summarise(time.time())
+                continue
+            try:
+                if item is None:
+                    self._summarise(None)
+                else:
+                    self._handle(*item)
+            except Exception:
+                # never let a bad message stop the logger
+                traceback.print_exc()
+            finally:
+                self.queue.task_done()
 
-    def debug(self, msg: Any):
-        self._log(msg, Logger.DEBUG_LEVEL)
+    def _handle(self, created: float, log_level: int, key: str, text: str):
+        self._summarise(created)
+        if log_level >= Logger.WARN_LEVEL:
+            entry = self.repeats.setdefault(key, [created, 0, 0, log_level, text])
+            entry[1] += 1
+            if entry[1] > self.REPEAT_LIMIT:
+                entry[2] += 1
+                entry[4] = text
+                return
+        self._write(created, log_level, text)
 
-    def info(self, msg: Any):
-        self._log(msg, Logger.INFO_LEVEL)
+    def _summarise(self, now: float | None):
+        """
+        Report the messages held back in every window that has ended by
+        `now`, or in all of them if `now` is None.
+        """
+        for key, (start, _, held, log_level, last) in list(self.repeats.items()):
+            if now is not None and now - start < self.REPEAT_WINDOW:
+                continue
+            del self.repeats[key]
+            if held:
+                self._write(
+                    now or time.time(),
+                    log_level,
+                    f"{held} more like this in the last "
+                    f"{self.REPEAT_WINDOW:.0f}s, the last being: {last}",
+                    held,
+                )
 
-    def warn(self, msg: Any):
-        self._log(msg, Logger.WARN_LEVEL)
+    def _write(self, created: float, log_level: int, text: str, held: int = 0):
+        if self.json_lines:
+            record: dict[str, Any] = {
+                "time": datetime.fromtimestamp(created, timezone.utc).isoformat(),
+                "level": Logger.LOG_STRINGS[log_level].strip(),
+                "message": text,
+            }
+            if held:
+                record["held_back"] = held
+            line = json.dumps(record, ensure_ascii=False)
+        else:
+            line = f"{Logger.LOG_STRINGS[log_level]}: {text}"
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
 
-    def error(self, msg: Any, abort: bool = False):
-        self._log(msg, Logger.ERROR_LEVEL)
+    def flush(self):
+        """
+        Block until everything logged so far, summaries included, is out.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.queue.join()
+
+    def debug(self, msg: Any, *args: Any):
+        self._log(msg, Logger.DEBUG_LEVEL, args)
+
+    def info(self, msg: Any, *args: Any):
+        self._log(msg, Logger.INFO_LEVEL, args)
+
+    def warn(self, msg: Any, *args: Any):
+        self._log(msg, Logger.WARN_LEVEL, args)
+
+    def error(self, msg: Any, *args: Any, abort: bool = False):
+        self._log(msg, Logger.ERROR_LEVEL, args)
         if abort:
+            self.flush()
             exit(1)
 
     def set_log_level(self, log_level: int):
         self.log_level = log_level
 
+    def set_json_lines(self, json_lines: bool):
+        self.json_lines = json_lines
+
 
 class Config:
     def __init__(self, log: Logger):
@@ -46,6 +171,7 @@ class Config:
         )
         general = self.config["napbot"]
         self.log_level = general.getint("LogLevel", fallback=1)
+        self.log_json = general.getboolean("LogJson", fallback=False)
         self.admin_ids = list(map(int, general.get("AdminIds", fallback="").split(",")))
         self.debug_guilds = list(
             map(int, general.get("DebugGuilds", fallback="").split(","))
@@ -53,3 +179,5 @@ class Config:
         self.bot_token = general.get("BotToken")
         self.modules = general.get("Modules", fallback="").split(",")
         self.command_prefix = general.get("CommandPrefix") or ","
+        # host:port for the Prometheus endpoint, empty disables it
+        self.metrics_address = general.get("MetricsAddress", fallback="")
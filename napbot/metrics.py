@@ -0,0 +1,336 @@
+import asyncio
+import bisect
+import logging
+import math
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+
+# seconds, for anything from a dict lookup to spawning ffmpeg
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # observations can come from the scan thread and the audio threads
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labels}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _label_text(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[tuple[str, float]]:
+        raise NotImplementedError
+
+    def summary(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name} {_format_value(value)}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, float]]:
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield f"{self.name}{self._label_text(key)}", value
+
+    def summary(self) -> Iterator[str]:
+        for name, value in self.samples():
+            yield f"{name} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: object):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels: object):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels: object):
+        """
+        Stop reporting a set of labels, such as a guild that has gone away.
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values.pop(key, None)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # per label set: count in each bucket (not cumulative), sum, count
+        self.values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: object):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = ([0] * len(self.buckets), [0.0, 0])
+            entry[0][index] += 1
+            entry[1][0] += value
+            entry[1][1] += 1
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self) -> list[tuple[LabelValues, list[int], float, int]]:
+        with self.lock:
+            return [
+                (key, list(counts), total, int(count))
+                for key, (counts, (total, count)) in self.values.items()
+            ]
+
+    def samples(self) -> Iterator[tuple[str, float]]:
+        for key, counts, total, count in self._snapshot():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{self._label_text(key, le)}", cumulative
+            yield f"{self.name}_sum{self._label_text(key)}", total
+            yield f"{self.name}_count{self._label_text(key)}", count
+
+    def quantile(self, counts: list[int], q: float) -> float:
+        """
+        Upper bound of the bucket the q-th quantile falls in.
+        """
+        target = q * sum(counts)
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            if cumulative >= target:
+                return bound
+        return math.inf
+
+    def summary(self) -> Iterator[str]:
+        for key, counts, total, count in self._snapshot():
+            if not count:
+                continue
+            yield (
+                f"{self.name}{self._label_text(key)} n={count} "
+                f"mean={total / count:.4g} "
+                f"p50<={_format_value(self.quantile(counts, 0.5))} "
+                f"p99<={_format_value(self.quantile(counts, 0.99))}"
+            )
+
+
+class Registry:
+    """
+    Every metric the bot reports, by name. Asking for a metric that already
+    exists returns it, so modules can be reloaded without losing counts.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _get[M: Metric](self, cls: type[M], name: str, *args, **kwargs) -> M:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def summary(self) -> str:
+        """
+        One line per series, short enough to read in a chat message.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.summary())
+
+
+class MetricsServer:
+    """
+    Serves `GET /metrics` for Prometheus to scrape. Meant to be bound to
+    localhost, as it does no authentication.
+    """
+
+    def __init__(self, registry: Registry, address: str):
+        host, _, port = address.rpartition(":")
+        self.host = host or "127.0.0.1"
+        self.port = int(port)
+        self.registry = registry
+        self.server: asyncio.Server | None = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # the headers are not needed, but have to be read past
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            method, path, *_ = request.decode("latin-1").split() or ["", ""]
+            if method == "GET" and path.split("?")[0] in ("/", "/metrics"):
+                status = "200 OK"
+                body = self.registry.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def monitor_loop_lag(registry: Registry, interval: float = 0.5):
+    """
+    Measure how late the event loop wakes up from a sleep, which is how
+    long anything else was blocking it.
+    """
+    lag = registry.histogram(
+        "napbot_event_loop_lag_seconds",
+        "How late the event loop ran a timer it was given.",
+    )
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+class RateLimitCounter(logging.Filter):
+    """
+    Counts the 429s discord.py logs as it waits them out, as it does not
+    report them any other way. A filter rather than a handler, so the
+    warnings are still printed wherever they were before.
+
+    Every 429 is logged as "We are being rate limited", followed straight
+    away by "Global rate limit" if it was a global one, so a route hit is
+    only counted once the loop has moved on without the second line.
+    """
+
+    def __init__(self, registry: Registry):
+        super().__init__()
+        self.hits = registry.counter(
+            "napbot_discord_rate_limits_total",
+            "Requests to Discord that were rate limited.",
+            ("scope",),
+        )
+        self.pending = False
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = str(record.msg)
+        if message.startswith("We are being rate limited"):
+            self.flush()
+            try:
+                asyncio.get_running_loop().call_soon(self.flush)
+            except RuntimeError:
+                self.hits.inc(scope="route")
+            else:
+                self.pending = True
+        elif message.startswith("Global rate limit"):
+            self.pending = False
+            self.hits.inc(scope="global")
+        return True
+
+    def flush(self):
+        if self.pending:
+            self.pending = False
+            self.hits.inc(scope="route")
+
+
+def watch_rate_limits(registry: Registry):
+    logger = logging.getLogger("discord.http")
+    if not any(isinstance(f, RateLimitCounter) for f in logger.filters):
+        logger.addFilter(RateLimitCounter(registry))
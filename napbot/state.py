@@ -1,6 +1,14 @@
+import time
+
 from . import iohandler
+from .metrics import Registry
+
+# for timing how long startup takes
+started_at = time.monotonic()
 
 log = iohandler.Logger()
 config = iohandler.Config(log)
+metrics = Registry()
 
 log.set_log_level(config.log_level)
+log.set_json_lines(config.log_json)